@@ -1,20 +1,14 @@
 import os
-import smtplib
 import logging
-import uuid
-import mysql.connector
 from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, Blueprint
-import threading
-import time
+from flask import request, jsonify, Blueprint
 import config
+from db_routing import DEFAULT_SHARD, get_connection, get_read_connection
 from access_validation_at_api_level import validate_access
 from utils import token_required
+from attachment_store import stream_to_temp, discard_temp, add_blob_reference, UploadTooLarge, upload_limits
+from email_outbox import queue_email, wake_outbox_sender
 
 # Create Blueprint for feedback management
 feedback_blueprint = Blueprint('feedback', __name__)
@@ -24,20 +18,17 @@ UPLOAD_FOLDER = config.ATTACHMENTS_FOLDER_PATH
 FEEDBACK_FOLDER = 'feedback'  # Subfolder for feedback attachments
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_FILES = 5
+MAX_HISTORY_PAGE_SIZE = 200
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'txt', 'png', 'jpg', 'jpeg', 'gif'}
 
-# Email configuration using your hosting provider's settings
-SMTP_SERVER = config.SMTP_SERVER
-SMTP_PORT = config.SMTP_PORT
+# Feedback notifications go to the system mailbox; SMTP settings are used by email_outbox
 SENDER_EMAIL = config.EMAIL_ID
-EMAIL_PASSWORD = config.EMAIL_PASSWORD
 
 # Ensure upload directory exists
 feedback_upload_path = os.path.join(UPLOAD_FOLDER, FEEDBACK_FOLDER)
 os.makedirs(feedback_upload_path, exist_ok=True)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -51,33 +42,10 @@ def get_file_size_mb(size_bytes):
     return round(size_bytes / (1024 * 1024), 2)
 
 
-def cleanup_files(file_paths, delay=60):
-    """Clean up uploaded files after a delay"""
-
-    def cleanup():
-        time.sleep(delay)
-        for file_path in file_paths:
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Deleted file: {file_path}")
-            except Exception as e:
-                logger.error(f"Error deleting file {file_path}: {e}")
-
-    cleanup_thread = threading.Thread(target=cleanup)
-    cleanup_thread.daemon = True
-    cleanup_thread.start()
-
-
-def store_feedback_in_database(feedback_data, attachments=None):
-    """Store feedback submission in database"""
+def store_feedback_in_database(feedback_data, attachments=None, notify_email=None):
+    """Store feedback submission in database, queueing the notification email in the same transaction"""
     try:
-        connection = mysql.connector.connect(
-            host=config.host,
-            database=config.database,
-            user=config.user,
-            password=config.password
-        )
+        connection = get_connection(shard=DEFAULT_SHARD)
         cursor = connection.cursor()
 
         # Insert feedback record
@@ -102,9 +70,11 @@ def store_feedback_in_database(feedback_data, attachments=None):
 
         feedback_id = cursor.lastrowid
 
-        # Store attachments if any
+        # Store attachments if any; identical files share one blob
         if attachments:
             for attachment in attachments:
+                attachment['relative_path'] = add_blob_reference(cursor, attachment['content_hash'],
+                                                                 attachment['file_size'], attachment['temp_path'])
                 cursor.execute("""
                     INSERT INTO FEEDBACK_ATTACHMENTS 
                     (FEEDBACK_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOAD_DATE)
@@ -118,6 +88,9 @@ def store_feedback_in_database(feedback_data, attachments=None):
                     datetime.now()
                 ))
 
+        if notify_email:
+            queue_feedback_email(cursor, feedback_data, notify_email, attachments, feedback_id)
+
         connection.commit()
         cursor.close()
         connection.close()
@@ -133,102 +106,80 @@ def store_feedback_in_database(feedback_data, attachments=None):
         return None
 
 
-def send_feedback_email(feedback_data, recipient_email, attachments=None, feedback_id=None):
-    """Send feedback email using SMTP"""
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = recipient_email
-        msg['Subject'] = f"[ReqSharp {feedback_data['type'].upper()}] {feedback_data['subject']}"
-
-        # Set reply-to if user email is provided
-        if feedback_data.get('userEmail'):
-            msg['Reply-To'] = feedback_data['userEmail']
-
-        # Pre-process the description to replace newlines with <br> tags
-        formatted_description = feedback_data['description'].replace('\n', '<br>')
-
-        # Create HTML email content
-        html_content = f"""
-        <html>
-        <body>
-            <h2>New {feedback_data['type'].title()} Submission</h2>
-
-            <h3>User Information:</h3>
-            <ul>
-                <li><strong>Name:</strong> {feedback_data.get('userName', 'Not provided')}</li>
-                <li><strong>Email:</strong> {feedback_data.get('userEmail', 'Not provided')}</li>
-                <li><strong>Project:</strong> {feedback_data.get('userProject', 'Not provided')}</li>
-                <li><strong>Company:</strong> {feedback_data.get('userCompany', 'Not provided')}</li>
-            </ul>
-
-            <h3>Submission Details:</h3>
-            <ul>
-                <li><strong>Feedback ID:</strong> {feedback_id or 'N/A'}</li>
-                <li><strong>Type:</strong> {feedback_data['type']}</li>
-                <li><strong>Category:</strong> {feedback_data.get('category', 'Not specified')}</li>
-                <li><strong>Priority:</strong> {feedback_data.get('priority', 'medium').upper()}</li>
-                <li><strong>Subject:</strong> {feedback_data['subject']}</li>
-                <li><strong>Submission Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
-            </ul>
-
-            <h3>Description:</h3>
-            <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 10px 0;">
-                {formatted_description}
-            </div>
-        """
-
-        # Add attachments info to email content
-        if attachments:
-            html_content += "<h3>Attachments:</h3><ul>"
-            for attachment in attachments:
-                file_size = get_file_size_mb(attachment['file_size'])
-                html_content += f"<li>{attachment['original_filename']} ({file_size} MB)</li>"
-            html_content += "</ul>"
-        else:
-            html_content += "<p><em>No attachments</em></p>"
-
-        html_content += """
-            <hr>
-            <p><small>This message was sent from the ReqSharp Feedback System.</small></p>
-        </body>
-        </html>
-        """
-
-        # Attach HTML content
-        msg.attach(MIMEText(html_content, 'html'))
-
-        # Add file attachments
-        if attachments:
-            for attachment in attachments:
-                try:
-                    full_path = os.path.join(UPLOAD_FOLDER, attachment['relative_path'])
-                    with open(full_path, 'rb') as file:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(file.read())
-                        encoders.encode_base64(part)
-                        part.add_header(
-                            'Content-Disposition',
-                            f'attachment; filename= {attachment["original_filename"]}'
-                        )
-                        msg.attach(part)
-                except Exception as e:
-                    logger.error(f"Error attaching file {attachment['original_filename']}: {e}")
-
-        # Send email using SSL
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-            server.login(SENDER_EMAIL, EMAIL_PASSWORD)
-            server.sendmail(SENDER_EMAIL, recipient_email, msg.as_string())
-            logger.info(f"Feedback email sent successfully to {recipient_email}")
-            return True
-
-    except Exception as e:
-        logger.error(f"Error sending email: {e}")
-        return False
+def build_feedback_email_html(feedback_data, attachments=None, feedback_id=None):
+    """Build the HTML body of the feedback notification email"""
+    # Pre-process the description to replace newlines with <br> tags
+    formatted_description = feedback_data['description'].replace('\n', '<br>')
+
+    # Create HTML email content
+    html_content = f"""
+    <html>
+    <body>
+        <h2>New {feedback_data['type'].title()} Submission</h2>
+
+        <h3>User Information:</h3>
+        <ul>
+            <li><strong>Name:</strong> {feedback_data.get('userName', 'Not provided')}</li>
+            <li><strong>Email:</strong> {feedback_data.get('userEmail', 'Not provided')}</li>
+            <li><strong>Project:</strong> {feedback_data.get('userProject', 'Not provided')}</li>
+            <li><strong>Company:</strong> {feedback_data.get('userCompany', 'Not provided')}</li>
+        </ul>
+
+        <h3>Submission Details:</h3>
+        <ul>
+            <li><strong>Feedback ID:</strong> {feedback_id or 'N/A'}</li>
+            <li><strong>Type:</strong> {feedback_data['type']}</li>
+            <li><strong>Category:</strong> {feedback_data.get('category', 'Not specified')}</li>
+            <li><strong>Priority:</strong> {feedback_data.get('priority', 'medium').upper()}</li>
+            <li><strong>Subject:</strong> {feedback_data['subject']}</li>
+            <li><strong>Submission Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
+        </ul>
+
+        <h3>Description:</h3>
+        <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin: 10px 0;">
+            {formatted_description}
+        </div>
+    """
+
+    # Add attachments info to email content
+    if attachments:
+        html_content += "<h3>Attachments:</h3><ul>"
+        for attachment in attachments:
+            file_size = get_file_size_mb(attachment['file_size'])
+            html_content += f"<li>{attachment['original_filename']} ({file_size} MB)</li>"
+        html_content += "</ul>"
+    else:
+        html_content += "<p><em>No attachments</em></p>"
+
+    html_content += """
+        <hr>
+        <p><small>This message was sent from the ReqSharp Feedback System.</small></p>
+    </body>
+    </html>
+    """
+
+    return html_content
+
+
+def queue_feedback_email(cursor, feedback_data, recipient_email, attachments=None, feedback_id=None):
+    """Add the feedback notification email to the outbox in the caller's transaction"""
+    return queue_email(
+        cursor,
+        recipient=recipient_email,
+        subject=f"[ReqSharp {feedback_data['type'].upper()}] {feedback_data['subject']}",
+        html_body=build_feedback_email_html(feedback_data, attachments, feedback_id),
+        reply_to=feedback_data.get('userEmail') or None,
+        attachments=[{
+            'file_name': attachment['original_filename'],
+            'relative_path': attachment['relative_path']
+        } for attachment in attachments or []],
+        reference_type='FEEDBACK',
+        reference_id=feedback_id
+    )
 
 
 @feedback_blueprint.route('/api/submit_feedback', methods=['POST'])
+@upload_limits(MAX_FILE_SIZE, MAX_FILES)
 @token_required
 def submit_feedback(current_user):
     """Handle feedback submission with file uploads"""
@@ -282,26 +233,16 @@ def submit_feedback(current_user):
                 if file and file.filename and allowed_file(file.filename):
                     logging.info("Level 4 - Processing individual file")
 
-                    # Create unique filename to prevent collisions
                     original_filename = secure_filename(file.filename)
                     file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-                    unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-
-                    # Create timestamp-based folder structure for feedback
-                    timestamp_folder = datetime.now().strftime('%Y%m%d')
-                    relative_path = f"{FEEDBACK_FOLDER}/{timestamp_folder}"
-                    full_dir = os.path.join(UPLOAD_FOLDER, relative_path)
-                    os.makedirs(full_dir, exist_ok=True)
 
-                    file_path = os.path.join(full_dir, unique_filename)
-
-                    # Save the file
-                    file.save(file_path)
-
-                    # Get file size and validate
-                    file_size = os.path.getsize(file_path)
-                    if file_size > MAX_FILE_SIZE:
-                        os.remove(file_path)  # Clean up oversized file
+                    # Spooled to a temporary file and hashed while the body was read; it is moved into
+                    # the blob store on save. Reading stopped with 413 if it went over MAX_FILE_SIZE
+                    try:
+                        content_hash, file_size, temp_path = stream_to_temp(file, MAX_FILE_SIZE)
+                    except UploadTooLarge:
+                        for file_info in uploaded_files:
+                            discard_temp(file_info['temp_path'])
                         return jsonify({
                             'status': 'Error',
                             'status_description': f'File too large: {original_filename}. Maximum size is {get_file_size_mb(MAX_FILE_SIZE)}MB'
@@ -309,9 +250,9 @@ def submit_feedback(current_user):
 
                     uploaded_files.append({
                         'original_filename': original_filename,
-                        'unique_filename': unique_filename,
-                        'relative_path': os.path.join(relative_path, unique_filename),
-                        'full_path': file_path,
+                        'content_hash': content_hash,
+                        'temp_path': temp_path,
+                        'relative_path': None,
                         'file_size': file_size,
                         'file_type': file_extension
                     })
@@ -319,24 +260,20 @@ def submit_feedback(current_user):
                     logging.info("Level 5 - File processed successfully")
 
         # Store feedback in database
-        feedback_id = store_feedback_in_database(feedback_data, uploaded_files)
+        feedback_id = store_feedback_in_database(feedback_data, uploaded_files, SENDER_EMAIL)
 
         if not feedback_id:
             # Clean up files if database storage failed
             for file_info in uploaded_files:
-                if os.path.exists(file_info['full_path']):
-                    os.remove(file_info['full_path'])
+                discard_temp(file_info['temp_path'])
 
             return jsonify({
                 'status': 'Error',
                 'status_description': 'Failed to store feedback in database'
             }), 500
 
-        # Send email
-        email_sent = send_feedback_email(feedback_data, SENDER_EMAIL , uploaded_files, feedback_id)
-
-        if not email_sent:
-            logger.warning("Email sending failed, but feedback was stored in database")
+        # The notification email was queued with the feedback; the outbox sender delivers it
+        wake_outbox_sender()
 
         # Log successful submission
         logger.info(
@@ -353,7 +290,7 @@ def submit_feedback(current_user):
                     'file_type': f['file_type']
                 } for f in uploaded_files
             ],
-            'email_sent': email_sent,
+            'email_status': 'Queued',  # EMAIL_OUTBOX records the delivery status
             'timestamp': datetime.now().isoformat()
         })
 
@@ -363,8 +300,7 @@ def submit_feedback(current_user):
         # Clean up any uploaded files in case of error
         if 'uploaded_files' in locals():
             for file_info in uploaded_files:
-                if os.path.exists(file_info['full_path']):
-                    os.remove(file_info['full_path'])
+                discard_temp(file_info['temp_path'])
 
         return jsonify({
             'status': 'Error',
@@ -372,23 +308,49 @@ def submit_feedback(current_user):
         }), 500
 
 
+def _parse_history_cursor(page_cursor):
+    """(submission_date, feedback_id) from a next_cursor; raises ValueError if it is not one"""
+    if not isinstance(page_cursor, dict) or 'submission_date' not in page_cursor or 'feedback_id' not in page_cursor:
+        raise ValueError('cursor must be the next_cursor of the previous page')
+    feedback_id = int(page_cursor['feedback_id'])
+    submission_date = page_cursor['submission_date']
+    if submission_date is not None:
+        submission_date = datetime.strptime(str(submission_date), '%Y-%m-%d %H:%M:%S.%f')
+    return submission_date, feedback_id
+
+
 @feedback_blueprint.route('/api/get_feedback_history', methods=['POST'])
 def get_feedback_history():
-    """Get feedback history with optional filtering"""
+    """
+    Get feedback history with optional filtering, newest first.
+    Pages are keyed on (SUBMISSION_DATE, FEEDBACK_ID): pass the returned next_cursor back as cursor.
+    offset is still honoured when no cursor is given.
+    """
     try:
         # Get filter parameters
         user_email = request.json.get('user_email')
         feedback_type = request.json.get('type')
         status = request.json.get('status')
-        limit = request.json.get('limit', 50)
-        offset = request.json.get('offset', 0)
-
-        connection = mysql.connector.connect(
-            host=config.host,
-            database=config.database,
-            user=config.user,
-            password=config.password
-        )
+        try:
+            limit = max(1, min(int(request.json.get('limit', 50)), MAX_HISTORY_PAGE_SIZE))
+            offset = max(0, int(request.json.get('offset') or 0))
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'Error',
+                'status_description': 'limit and offset must be integers'
+            }), 400
+        page_cursor = request.json.get('cursor')
+        if page_cursor is not None:
+            try:
+                page_cursor = _parse_history_cursor(page_cursor)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'status': 'Error',
+                    'status_description': 'cursor must be the next_cursor of the previous page'
+                }), 400
+        include_attachments = request.json.get('include_attachments', False)
+
+        connection = get_read_connection(shard=DEFAULT_SHARD)
         cursor = connection.cursor()
 
         # Build query with filters
@@ -414,13 +376,31 @@ def get_feedback_history():
             query += " AND STATUS = %s"
             params.append(status)
 
-        query += " ORDER BY SUBMISSION_DATE DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        # Rows without a SUBMISSION_DATE sort last, so a cursor with a date still leads on to them
+        if page_cursor and page_cursor[0] is not None:
+            query += """ AND (SUBMISSION_DATE < %s OR (SUBMISSION_DATE = %s AND FEEDBACK_ID < %s)
+                OR SUBMISSION_DATE IS NULL)"""
+            params.extend([page_cursor[0], page_cursor[0], page_cursor[1]])
+        elif page_cursor:
+            query += " AND SUBMISSION_DATE IS NULL AND FEEDBACK_ID < %s"
+            params.append(page_cursor[1])
+
+        # One extra row tells whether another page exists
+        query += " ORDER BY SUBMISSION_DATE DESC, FEEDBACK_ID DESC LIMIT %s"
+        params.append(limit + 1)
+
+        if not page_cursor and offset:
+            query += " OFFSET %s"
+            params.append(offset)
 
         cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
         feedback_list = []
-        for row in cursor.fetchall():
+        for row in rows:
             feedback_list.append({
                 'feedback_id': row[0],
                 'type': row[1],
@@ -433,16 +413,69 @@ def get_feedback_history():
                 'user_project': row[8],
                 'user_company': row[9],
                 'submission_date': row[10].strftime('%Y-%m-%d %H:%M:%S') if row[10] else None,
-                'status': row[11]
+                'status': row[11],
+                'attachment_count': 0,
+                'attachment_total_bytes': 0
             })
 
+        # Attachment details (or just counts and sizes) for the whole page in one query
+        if feedback_list:
+            feedback_by_id = {feedback['feedback_id']: feedback for feedback in feedback_list}
+            placeholders = ', '.join(['%s'] * len(feedback_by_id))
+
+            if include_attachments:
+                for feedback in feedback_list:
+                    feedback['attachments'] = []
+
+                cursor.execute(f"""
+                    SELECT 
+                        FEEDBACK_ID, ATTACHMENT_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOAD_DATE
+                    FROM FEEDBACK_ATTACHMENTS
+                    WHERE FEEDBACK_ID IN ({placeholders})
+                    ORDER BY UPLOAD_DATE DESC
+                """, list(feedback_by_id))
+
+                for row in cursor.fetchall():
+                    feedback = feedback_by_id[row[0]]
+                    feedback['attachments'].append({
+                        'attachment_id': row[1],
+                        'file_name': row[2],
+                        'file_path': row[3],
+                        'file_size': row[4],
+                        'file_type': row[5],
+                        'upload_date': row[6].strftime('%Y-%m-%d %H:%M:%S') if row[6] else None
+                    })
+                    feedback['attachment_count'] += 1
+                    feedback['attachment_total_bytes'] += row[4] or 0
+            else:
+                cursor.execute(f"""
+                    SELECT FEEDBACK_ID, COUNT(*), COALESCE(SUM(FILE_SIZE), 0)
+                    FROM FEEDBACK_ATTACHMENTS
+                    WHERE FEEDBACK_ID IN ({placeholders})
+                    GROUP BY FEEDBACK_ID
+                """, list(feedback_by_id))
+
+                for row in cursor.fetchall():
+                    feedback_by_id[row[0]]['attachment_count'] = row[1]
+                    feedback_by_id[row[0]]['attachment_total_bytes'] = int(row[2])
+
+        next_cursor = None
+        if has_more:
+            last_row = rows[-1]
+            next_cursor = {
+                'submission_date': last_row[10].strftime('%Y-%m-%d %H:%M:%S.%f') if last_row[10] else None,
+                'feedback_id': last_row[0]
+            }
+
         cursor.close()
         connection.close()
 
         return jsonify({
             'status': 'Success',
             'feedback_history': feedback_list,
-            'count': len(feedback_list)
+            'count': len(feedback_list),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         })
 
     except Exception as e:
@@ -465,12 +498,7 @@ def get_feedback_attachments():
                 'status_description': 'Feedback ID is required'
             }), 400
 
-        connection = mysql.connector.connect(
-            host=config.host,
-            database=config.database,
-            user=config.user,
-            password=config.password
-        )
+        connection = get_read_connection(shard=DEFAULT_SHARD)
         cursor = connection.cursor()
 
         cursor.execute("""
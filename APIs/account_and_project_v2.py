@@ -1,25 +1,26 @@
 import re
-from flask import Flask, request, jsonify, Blueprint
-from flask_cors import CORS
+from flask import request, jsonify, Blueprint
 import mysql.connector
 from mysql.connector.constants import flag_is_set
 from foundational_v2 import validate_status
-import config
+from db_routing import get_connection, get_read_connection, shard_names, shard_for
 from datetime import datetime, timedelta
 import logging
 import jwt
 from config import TOKEN_EXPIRY_DAYS
-from argon2 import PasswordHasher
 from functools import wraps
 from access_validation_at_api_level import validate_access
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Callable
 from dataclasses import dataclass
+import time
 
 
 from config import SECRET_KEY
-from foundational_v2 import generate_next_sequence , validate_corporate_account, validate_project_id, validate_functional_domain, validate_project_prefix, validate_user_id
+from foundational_v2 import generate_next_sequence , validate_corporate_account, validate_project_id, validate_functional_domain, validate_project_prefix, validate_user_id, \
+    get_user_shard
 from utils import token_required
+from background_jobs import enqueue_job, register_job_handler, JobCancelled
 
 
 
@@ -38,27 +39,37 @@ def blueprint_token_required(f):
     return decorated
 
 
-ph = PasswordHasher()
+_password_hasher = None
+
+
+def _get_password_hasher():
+    """argon2's PasswordHasher, created on first use so importing this module stays cheap"""
+    global _password_hasher
+    if _password_hasher is None:
+        from argon2 import PasswordHasher
+        _password_hasher = PasswordHasher()
+    return _password_hasher
 
 # Hash password
 def hash_password(password: str) -> str:
     try:
-        return ph.hash(password)
+        return _get_password_hasher().hash(password)
     except Exception as e:
         raise Exception("Error hashing password")
 
 # Verify password
 def verify_password(stored_hash: str, provided_password: str) -> bool:
     try:
-        return ph.verify(stored_hash, provided_password)
+        return _get_password_hasher().verify(stored_hash, provided_password)
     except Exception:
         return False
 
 
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": ["http://localhost:3000"]}})
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
+
+
+# Rows copied per chunk; each chunk of a keyed table is committed on its own
+COPY_CHUNK_SIZE = 5000
 
 
 @dataclass
@@ -68,19 +79,26 @@ class CopyResult:
     records_copied: int
     success: bool
     error_message: Optional[str] = None
+    elapsed_ms: float = 0.0
+    chunks: int = 0
 
 
 class ProjectRecordsCopier:
     """Class for copying records between projects"""
 
-    def __init__(self, connection):
+    # table name -> (column names, primary key column names); table layouts do not change at runtime
+    _table_metadata_cache: Dict[str, Tuple[List[str], List[str]]] = {}
+
+    def __init__(self, connection, chunk_size: int = COPY_CHUNK_SIZE):
         """
         Initialize with database connection
 
         Args:
             connection: MySQL database connection object
+            chunk_size: Maximum number of rows moved by one INSERT ... SELECT statement
         """
         self.connection = connection
+        self.chunk_size = chunk_size
         self.default_tables = [
             'ACCOUNT_STATUSES',
             'USER_PROJECTS',
@@ -94,15 +112,22 @@ class ProjectRecordsCopier:
         ]
 
     def copy_project_records(self, corporate_account: str, copy_from_project_id: str,
-                             copy_to_project_id: str, table_names: Optional[List[str]] = None) -> Dict[str, Any]:
+                             copy_to_project_id: str, table_names: Optional[List[str]] = None,
+                             progress_callback: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, Any]:
         """
         Copy records from one project to another across specified tables
 
+        Each chunk of each table is committed on its own, so locks are held for one chunk at a time.
+        Rows whose key already exists in the target project are skipped, which makes a copy that
+        failed or was stopped part way safe to run again: it carries on where it left off.
+
         Args:
             corporate_account: The corporate account identifier
             copy_from_project_id: Source project ID to copy from
             copy_to_project_id: Target project ID to copy to
             table_names: Optional list of table names to copy. If None, uses default tables.
+            progress_callback: Optional callable(done, total, message) invoked before each table.
+                An exception raised by it stops the copy after the tables already done.
 
         Returns:
             Dict containing operation results and summary
@@ -135,10 +160,13 @@ class ProjectRecordsCopier:
         logging.info(f"Starting copy operation from project {copy_from_project_id} to {copy_to_project_id}")
 
         try:
-            # Begin transaction
-            self.connection.start_transaction()
+            # Column metadata for every table is loaded in one round trip
+            self._load_table_metadata(tables_to_process)
+
+            for index, table_name in enumerate(tables_to_process):
+                if progress_callback:
+                    progress_callback(index, len(tables_to_process), f"Copying {table_name}")
 
-            for table_name in tables_to_process:
                 try:
                     result = self._copy_table_records(
                         table_name,
@@ -150,7 +178,8 @@ class ProjectRecordsCopier:
 
                     if result.success:
                         total_records_copied += result.records_copied
-                        logging.info(f"Successfully copied {result.records_copied} records from {table_name}")
+                        logging.info(f"Successfully copied {result.records_copied} records from {table_name} "
+                                     f"in {result.elapsed_ms:.1f} ms ({result.chunks} chunks)")
                     else:
                         failed_tables.append(table_name)
                         logging.error(f"Failed to copy records from {table_name}: {result.error_message}")
@@ -161,17 +190,26 @@ class ProjectRecordsCopier:
                     results.append(CopyResult(table_name, 0, False, error_msg))
                     failed_tables.append(table_name)
 
-            # Commit transaction if no failures, otherwise rollback
-            if not failed_tables:
-                self.connection.commit()
-                logging.info("All tables copied successfully. Transaction committed.")
-            else:
-                self.connection.rollback()
-                logging.warning(f"Some tables failed to copy: {failed_tables}. Transaction rolled back.")
+            if failed_tables:
+                logging.warning(f"Some tables failed to copy: {failed_tables}. The chunks already copied are kept; "
+                                f"running the copy again resumes it.")
+
+        except JobCancelled as e:
+            self.connection.rollback()
+            # The tables already copied stay committed; record them on the cancelled job
+            e.result = {
+                'total_records_copied': total_records_copied,
+                'tables_copied': [r.table_name for r in results if r.success],
+                'failed_tables': failed_tables,
+                'status_description': 'Copy cancelled. The tables listed were copied; running the copy '
+                                      'again copies the rest.'
+            }
+            logging.info(f"Copy cancelled after {len(results)} of {len(tables_to_process)} tables")
+            raise
 
         except Exception as e:
             self.connection.rollback()
-            logging.error(f"Transaction failed: {str(e)}")
+            logging.error(f"Copy stopped: {str(e)}")
             raise
 
         return {
@@ -185,7 +223,8 @@ class ProjectRecordsCopier:
                 'copy_to_project_id': copy_to_project_id,
                 'tables_processed': len(tables_to_process),
                 'tables_succeeded': len(tables_to_process) - len(failed_tables),
-                'tables_failed': len(failed_tables)
+                'tables_failed': len(failed_tables),
+                'elapsed_ms': round(sum(r.elapsed_ms for r in results), 1)
             }
         }
 
@@ -203,83 +242,182 @@ class ProjectRecordsCopier:
         Returns:
             CopyResult object with operation details
         """
+        start_time = time.perf_counter()
+        chunks = 0
+        records_copied = 0
         try:
             # Get table columns to build dynamic query
-            columns_info = self._get_table_columns(table_name)
+            columns_info, key_columns = self._get_table_metadata(table_name)
 
             if not columns_info:
                 return CopyResult(table_name, 0, False, "Could not retrieve table schema")
 
-            # Build SELECT query for source records
+            # Build SELECT list for source records; the rows are copied inside MySQL and never fetched
             select_columns = []
+            select_params = []
             for column in columns_info:
                 if column.lower() == 'project_id':
-                    select_columns.append(f"'{copy_to_project_id}' as project_id")
+                    select_columns.append(f"%s as {column}")
+                    select_params.append(copy_to_project_id)
                 elif column.lower() in ['created_date', 'updated_date']:
                     select_columns.append(f"NOW() as {column}")
                 else:
                     select_columns.append(column)
 
-            select_query = f"""
+            insert_select_query = f"""
+                INSERT INTO {table_name} ({', '.join(columns_info)})
                 SELECT {', '.join(select_columns)}
-                FROM {table_name}
+                FROM {table_name} source_rows
                 WHERE corporate_account = %s 
                 AND project_id = %s
             """
+            source_params = [corporate_account, copy_from_project_id]
 
-            # Execute SELECT to get records to copy
             cursor = self.connection.cursor()
-            cursor.execute(select_query, (corporate_account, copy_from_project_id))
-            records_to_copy = cursor.fetchall()
 
-            if not records_to_copy:
-                return CopyResult(table_name, 0, True, "No records found to copy")
-
-            # Build INSERT query
-            column_placeholders = ', '.join(['%s'] * len(columns_info))
-            insert_query = f"""
-                INSERT INTO {table_name} ({', '.join(columns_info)})
-                VALUES ({column_placeholders})
+            # Tables without a key to page on go in one statement
+            if not key_columns:
+                self.connection.start_transaction(isolation_level='READ COMMITTED')
+                cursor.execute(insert_select_query, select_params + source_params)
+                records_copied = cursor.rowcount
+                self.connection.commit()
+                return CopyResult(table_name, records_copied, True,
+                                  None if records_copied else "No records found to copy",
+                                  self._elapsed_ms(start_time), 1)
+
+            # Rows already in the target project, from an earlier run of this copy, are skipped
+            insert_select_query += f"""
+                AND NOT EXISTS (
+                    SELECT 1 FROM {table_name} copied_rows
+                    WHERE copied_rows.corporate_account = source_rows.corporate_account
+                    AND copied_rows.project_id = %s
+                    AND {' AND '.join(f'copied_rows.{key} = source_rows.{key}' for key in key_columns)}
+                )
             """
+            source_params.append(copy_to_project_id)
 
-            # Execute INSERT for all records
-            cursor.executemany(insert_query, records_to_copy)
-            records_copied = cursor.rowcount
+            # Copied in primary-key ordered chunks, each in its own short transaction
+            key_list = ', '.join(key_columns)
+            key_placeholders = ', '.join(['%s'] * len(key_columns))
+            last_key = None
 
-            return CopyResult(table_name, records_copied, True)
+            while True:
+                lower_bound = f" AND ({key_list}) > ({key_placeholders})" if last_key else ""
+                lower_params = list(last_key) if last_key else []
+
+                self.connection.start_transaction(isolation_level='READ COMMITTED')
+                try:
+                    cursor.execute(f"""
+                        SELECT {key_list} FROM {table_name}
+                        WHERE corporate_account = %s AND project_id = %s{lower_bound}
+                        ORDER BY {key_list}
+                        LIMIT 1 OFFSET {self.chunk_size - 1}
+                    """, [corporate_account, copy_from_project_id] + lower_params)
+                    upper_key = cursor.fetchone()
+                    cursor.fetchall()
+
+                    upper_bound = f" AND ({key_list}) <= ({key_placeholders})" if upper_key else ""
+                    upper_params = list(upper_key) if upper_key else []
+
+                    cursor.execute(insert_select_query + lower_bound + upper_bound,
+                                   select_params + source_params + lower_params + upper_params)
+                    chunk_copied = cursor.rowcount
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+                records_copied += chunk_copied
+                chunks += 1
+
+                if not upper_key:
+                    break
+                last_key = upper_key
+
+            return CopyResult(table_name, records_copied, True,
+                              None if records_copied else "No records found to copy",
+                              self._elapsed_ms(start_time), chunks)
 
         except Exception as e:
-            return CopyResult(table_name, 0, False, str(e))
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            return CopyResult(table_name, records_copied, False, str(e), self._elapsed_ms(start_time), chunks)
 
-    def _get_table_columns(self, table_name: str) -> List[str]:
+    @staticmethod
+    def _elapsed_ms(start_time: float) -> float:
+        return round((time.perf_counter() - start_time) * 1000, 1)
+
+    def _load_table_metadata(self, table_names: List[str]) -> None:
         """
-        Get column names for a table
+        Load column and primary key metadata for all uncached tables in a single query
 
         Args:
-            table_name: Name of the table
-
-        Returns:
-            List of column names
+            table_names: Names of the tables about to be copied
         """
+        missing_tables = [t for t in table_names if t not in self._table_metadata_cache]
+        if not missing_tables:
+            return
+
+        # The query opens a transaction on a non-autocommit connection; it is ended below unless the
+        # caller already had one, so a copy can start its own transactions afterwards
+        was_in_transaction = self.connection.in_transaction
         try:
-            # This query works for MySQL
-            query = """
-                SELECT column_name 
+            placeholders = ', '.join(['%s'] * len(missing_tables))
+            query = f"""
+                SELECT table_name, column_name, column_key
                 FROM information_schema.columns 
-                WHERE table_name = %s 
+                WHERE table_name IN ({placeholders}) 
                 AND table_schema = DATABASE()
-                ORDER BY ordinal_position
+                ORDER BY table_name, ordinal_position
             """
 
             cursor = self.connection.cursor()
-            cursor.execute(query, (table_name,))
-            columns = [row[0] for row in cursor.fetchall()]
+            cursor.execute(query, missing_tables)
+
+            metadata: Dict[str, Tuple[List[str], List[str]]] = {}
+            for table_name, column_name, column_key in cursor.fetchall():
+                columns, key_columns = metadata.setdefault(table_name.lower(), ([], []))
+                columns.append(column_name)
+                if column_key == 'PRI' and column_name.lower() not in ('corporate_account', 'project_id'):
+                    key_columns.append(column_name)
+            cursor.close()
 
-            return columns
+            for table_name in missing_tables:
+                if table_name.lower() in metadata:
+                    self._table_metadata_cache[table_name] = metadata[table_name.lower()]
 
         except Exception as e:
-            logging.error(f"Error getting columns for table {table_name}: {str(e)}")
-            return []
+            logging.error(f"Error loading column metadata for tables {missing_tables}: {str(e)}")
+
+        finally:
+            if not was_in_transaction and self.connection.in_transaction:
+                self.connection.rollback()
+
+    def _get_table_metadata(self, table_name: str) -> Tuple[List[str], List[str]]:
+        """
+        Get column names and primary key columns for a table
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            Tuple of (column names, primary key column names other than corporate_account/project_id)
+        """
+        if table_name not in self._table_metadata_cache:
+            self._load_table_metadata([table_name])
+
+        return self._table_metadata_cache.get(table_name, ([], []))
+
+    def _get_table_columns(self, table_name: str) -> List[str]:
+        """
+        Get column names for a table
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            List of column names
+        """
+        return self._get_table_metadata(table_name)[0]
 
     def validate_parameters(self, corporate_account: str, copy_from_project_id: str,
                             copy_to_project_id: str) -> Dict[str, Any]:
@@ -388,6 +526,47 @@ def copy_project_records(current_user):
             'status_description': 'Source and target project IDs cannot be the same'
         })
 
+    if data.get('run_in_background', False):
+        try:
+            job_id = enqueue_job('copy_project_records', corporate_account, copy_to_project_id,
+                                 current_user['user_id'], {
+                                     'corporate_account': corporate_account,
+                                     'copy_from_project_id': copy_from_project_id,
+                                     'copy_to_project_id': copy_to_project_id,
+                                     'table_names': table_names
+                                 })
+        except Exception as e:
+            logging.error(f"Error queueing project records copy: {str(e)}")
+            return jsonify({
+                'status': 'Failed',
+                'status_description': f"Failed to queue the copy operation: {str(e)}"
+            })
+
+        return jsonify({
+            'job_id': job_id,
+            'status': 'Success',
+            'status_description': 'Project records copy queued'
+        })
+
+    return jsonify(perform_project_records_copy(None, corporate_account, copy_from_project_id,
+                                                copy_to_project_id, table_names))
+
+
+def perform_project_records_copy(job_context, corporate_account: str, copy_from_project_id: str,
+                                 copy_to_project_id: str, table_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Copy project records for an already validated request
+
+    Args:
+        job_context: JobContext when running as a background job, otherwise None
+        corporate_account: The corporate account identifier
+        copy_from_project_id: Source project ID to copy from
+        copy_to_project_id: Target project ID to copy to
+        table_names: Optional list of table names to copy
+
+    Returns:
+        Response payload for the copy_project_records endpoint
+    """
     sts = "Success"
     sts_description = "Project records copied successfully"
     total_records_copied = 0
@@ -395,10 +574,7 @@ def copy_project_records(current_user):
     results_by_table = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
 
         # Create copier instance
         copier = ProjectRecordsCopier(connection)
@@ -409,21 +585,23 @@ def copy_project_records(current_user):
         )
 
         if not validation_result['valid']:
-            return jsonify({
+            return {
                 'status': 'Failed',
                 'status_description': 'Validation failed',
                 'validation_errors': validation_result['errors'],
                 'warning': validation_result.get('warning')
-            })
+            }
 
         # Perform the copy operation
         result = copier.copy_project_records(
-            corporate_account, copy_from_project_id, copy_to_project_id, table_names
+            corporate_account, copy_from_project_id, copy_to_project_id, table_names,
+            progress_callback=job_context.report_progress if job_context else None
         )
 
         if not result['success']:
             sts = "Failed"
-            sts_description = "Some or all tables failed to copy"
+            sts_description = ("Some or all tables failed to copy. The records already copied are kept; "
+                               "running the copy again copies the rest")
 
         total_records_copied = result['total_records_copied']
         failed_tables = result['failed_tables']
@@ -446,6 +624,9 @@ def copy_project_records(current_user):
             sts_description = f"Database error occurred during copy operation: {error}"
         logging.error(f"Copy operation failed: {error}")
 
+    except JobCancelled:
+        raise
+
     except Exception as error:
         sts = "Failed"
         sts_description = f"Copy operation failed: {str(error)}"
@@ -455,7 +636,7 @@ def copy_project_records(current_user):
         if connection.is_connected():
             connection.close()
 
-    return jsonify({
+    return {
         'status': sts,
         'status_description': sts_description,
         'total_records_copied': total_records_copied,
@@ -463,7 +644,9 @@ def copy_project_records(current_user):
         'results_by_table': {k: {
             'records_copied': v.records_copied,
             'success': v.success,
-            'error_message': v.error_message
+            'error_message': v.error_message,
+            'elapsed_ms': v.elapsed_ms,
+            'chunks': v.chunks
         } for k, v in results_by_table.items()},
         'summary': {
             'corporate_account': corporate_account,
@@ -471,9 +654,13 @@ def copy_project_records(current_user):
             'copy_to_project_id': copy_to_project_id,
             'tables_processed': len(results_by_table),
             'tables_succeeded': len([r for r in results_by_table.values() if r.success]),
-            'tables_failed': len(failed_tables)
+            'tables_failed': len(failed_tables),
+            'elapsed_ms': round(sum(r.elapsed_ms for r in results_by_table.values()), 1)
         }
-    })
+    }
+
+
+register_job_handler('copy_project_records', perform_project_records_copy)
 
 
 @account_and_project_blueprint.route('/api/create_account', methods=['POST'])
@@ -536,10 +723,7 @@ def create_account(current_user):
     sts_description = "Account created successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO CORPORATE_ACCOUNTS (CORPORATE_ACCOUNT, ACCOUNT_DESCRIPTION, STATUS, CREATED_DATE, UPDATED_DATE)
                                 VALUES (%s, %s, %s, %s, %s) """
@@ -651,10 +835,7 @@ def create_project(current_user):
     sts_description = "Project added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO CORPORATE_ACCOUNT_PROJECTS (CORPORATE_ACCOUNT, PROJECT_ID, PROJECT_DESCRIPTION, FUNCTIONAL_DOMAIN, PROJECT_PREFIX, 
         STATUS, CREATED_DATE, UPDATED_DATE)
@@ -768,10 +949,7 @@ def update_project(current_user):
     sts_description = "Project updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE CORPORATE_ACCOUNT_PROJECTS 
                               SET PROJECT_DESCRIPTION = %s, 
@@ -824,10 +1002,7 @@ def get_project_list(current_user):
     project_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         if corporate_account:
             mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.ACCOUNT_DESCRIPTION, B.PROJECT_ID, B.PROJECT_DESCRIPTION, B.FUNCTIONAL_DOMAIN, B.PROJECT_PREFIX, 
@@ -891,13 +1066,9 @@ def get_account_list(current_user):
     sts_description = "Account list retrieved successfully"
     account_details = {}
     account_list = []
+    connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
-        cursor = connection.cursor()
         mySql_select_query = """SELECT CORPORATE_ACCOUNT, ACCOUNT_DESCRIPTION, STATUS, CREATED_DATE, UPDATED_DATE FROM CORPORATE_ACCOUNTS 
         WHERE STATUS = %s """
         record = ['Active']
@@ -913,18 +1084,27 @@ def get_account_list(current_user):
 
         logging.info(f"SQL : {user_id}")
 
-        cursor.execute(mySql_select_query, record)
-        for result in cursor.fetchall():
-
+        # Accounts are spread over the shards; each one is listed from the shard it currently lives on
+        for shard in shard_names():
+            connection = get_read_connection(shard=shard)
+            cursor = connection.cursor()
+            cursor.execute(mySql_select_query, record)
+            for result in cursor.fetchall():
+                if shard_for(result[0]) != shard:
+                    continue
+
+                account_details = {
+                    'corporate_account': result[0],
+                    'account_description': result[1],
+                    'status': result[2],
+                    'created_date': result[3],
+                    'updated_date': result[4]
+                }
+                account_list.append(account_details)
+            cursor.close()
+            connection.close()
 
-            account_details = {
-                'corporate_account': result[0],
-                'account_description': result[1],
-                'status': result[2],
-                'created_date': result[3],
-                'updated_date': result[4]
-            }
-            account_list.append(account_details)
+        account_list.sort(key=lambda account: account['corporate_account'])
 
 
         if len(account_list) == 0:
@@ -937,7 +1117,7 @@ def get_account_list(current_user):
         logging.info(error)
 
     finally:
-        if connection.is_connected():
+        if connection and connection.is_connected():
             cursor.close()
             connection.close()
 
@@ -973,44 +1153,54 @@ def get_user_list(current_user):
     user_details = {}
     user_list = []
 
+    connection = None
+
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
-        cursor = connection.cursor()
         if corporate_account != 'ALL':
             mySql_select_query = """SELECT USER_ID, USER_NAME, A.STATUS, A.CORPORATE_ACCOUNT, ACCOUNT_DESCRIPTION, ACCESS_LEVEL, DEFAULT_PROJECT, A.CREATED_DATE, A.UPDATED_DATE, BT.BUSINESS_TEAM_DESCRIPTION, A.USER_ROLE, BT.BUSINESS_TEAM_ID
             FROM USER_ACCOUNTS A LEFT JOIN BUSINESS_TEAMS BT ON A.CORPORATE_ACCOUNT = BT.CORPORATE_ACCOUNT AND A.DEFAULT_PROJECT = BT.PROJECT_ID AND A.BUSINESS_TEAM_ID = BT.BUSINESS_TEAM_ID
             , CORPORATE_ACCOUNTS B
             WHERE A.CORPORATE_ACCOUNT = B.CORPORATE_ACCOUNT AND A.CORPORATE_ACCOUNT = %s ORDER BY USER_NAME """
             record = [corporate_account, ]
-            cursor.execute(mySql_select_query, record)
+            shards = [None]
 
         else:
                 mySql_select_query = """SELECT USER_ID, USER_NAME, A.STATUS, A.CORPORATE_ACCOUNT, ACCOUNT_DESCRIPTION, ACCESS_LEVEL, DEFAULT_PROJECT, A.CREATED_DATE, A.UPDATED_DATE , BT.BUSINESS_TEAM_DESCRIPTION, A.USER_ROLE, BT.BUSINESS_TEAM_ID
                 FROM USER_ACCOUNTS A LEFT JOIN BUSINESS_TEAMS BT ON A.CORPORATE_ACCOUNT = BT.CORPORATE_ACCOUNT AND A.DEFAULT_PROJECT = BT.PROJECT_ID AND A.BUSINESS_TEAM_ID = BT.BUSINESS_TEAM_ID
                 , CORPORATE_ACCOUNTS B
                 WHERE A.CORPORATE_ACCOUNT = B.CORPORATE_ACCOUNT ORDER BY USER_NAME """
-                cursor.execute(mySql_select_query)
+                record = []
+                # Users of all accounts, each account read from the shard it currently lives on
+                shards = shard_names()
 
+        for shard in shards:
+            connection = get_read_connection(corporate_account=corporate_account, shard=shard)
+            cursor = connection.cursor()
+            cursor.execute(mySql_select_query, record)
 
-        for result in cursor.fetchall():
-            user_details = {
-                'user_id': result[0],
-                'user_name': result[1],
-                'status': result[2],
-                'corporate_account': result[3],
-                'account_description': result[4],
-                'access_level': result[5],
-                'default_project': result[6],
-                'created_date': result[7],
-                'updated_date': result[8],
-                'business_team_description': result[9],
-                'user_role': result[10],
-                'business_team_id': result[11]
-            }
-            user_list.append(user_details)
+            for result in cursor.fetchall():
+                if shard is not None and shard_for(result[3]) != shard:
+                    continue
+                user_details = {
+                    'user_id': result[0],
+                    'user_name': result[1],
+                    'status': result[2],
+                    'corporate_account': result[3],
+                    'account_description': result[4],
+                    'access_level': result[5],
+                    'default_project': result[6],
+                    'created_date': result[7],
+                    'updated_date': result[8],
+                    'business_team_description': result[9],
+                    'user_role': result[10],
+                    'business_team_id': result[11]
+                }
+                user_list.append(user_details)
+            cursor.close()
+            connection.close()
+
+        if len(shards) > 1:
+            user_list.sort(key=lambda user: (user['user_name'] or '').lower())
 
 
         if len(user_list) == 0:
@@ -1023,7 +1213,7 @@ def get_user_list(current_user):
         logging.info(error)
 
     finally:
-        if connection.is_connected():
+        if connection and connection.is_connected():
             cursor.close()
             connection.close()
 
@@ -1097,10 +1287,7 @@ def update_user_project_access(current_user):
     sts_description = "Project access updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         for user_id in user_ids:
@@ -1181,10 +1368,7 @@ def delete_user_project_access(current_user):
     error_count = 0
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         for record in user_project_records:
@@ -1276,10 +1460,7 @@ def get_user_project_list(current_user):
     user_project_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Build dynamic query based on filters
@@ -1396,10 +1577,7 @@ def create_functional_domain(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO FUNCTIONAL_DOMAINS (CORPORATE_ACCOUNT, FUNCTIONAL_DOMAIN, CREATED_DATE, UPDATED_DATE)
                                 VALUES (%s, %s, %s, %s) """
@@ -1466,10 +1644,7 @@ def update_functional_domain(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE FUNCTIONAL_DOMAINS 
                                 SET FUNCTIONAL_DOMAIN = %s, UPDATED_DATE = %s
@@ -1530,10 +1705,7 @@ def delete_functional_domain(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_delete_query = """DELETE FROM FUNCTIONAL_DOMAINS 
                                 WHERE CORPORATE_ACCOUNT = %s AND FUNCTIONAL_DOMAIN = %s"""
@@ -1583,10 +1755,7 @@ def get_functional_domains(current_user):
     functional_domain_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT FUNCTIONAL_DOMAIN FROM FUNCTIONAL_DOMAINS WHERE CORPORATE_ACCOUNT = %s ORDER BY FUNCTIONAL_DOMAIN"""
         record = (corporate_account, )
@@ -1660,10 +1829,7 @@ def validate_user_credentials():
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(stale_ok=False, shard=get_user_shard(user_id))
         cursor = connection.cursor()
         mySql_insert_query = """SELECT USER_NAME, CORPORATE_ACCOUNT, PASSWORD_HASH, CREATED_DATE, DEFAULT_PROJECT, LAST_USED_PROJECT
          FROM USER_ACCOUNTS WHERE USER_ID = %s AND STATUS = %s"""
@@ -1716,12 +1882,6 @@ def validate_user_credentials():
         'status_description': sts_description
     }) ,401 if sts == "Failed" else 200
 
-@app.route('/api/protected', methods=['GET'])
-@token_required
-def protected_route(current_user):
-    return jsonify({'message': f'Hello, {current_user}!'})
-
-
 @account_and_project_blueprint.route('/api/create_user', methods=['POST'])
 @token_required
 @validate_access
@@ -1809,16 +1969,21 @@ def create_user(current_user):
             'status_description': 'Invalid default project'
         })
 
+    # The primary key only covers this account's database; user ids must be unique across all of them
+    if get_user_shard(user_id) is not None:
+        return jsonify({
+            'user_id': user_id,
+            'status': 'Failed',
+            'status_description': 'Attempt to create a duplicate entry'
+        })
+
     sts = "Success"
     sts_description = "User added successfully"
     password_hash =  hash_password(password)
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO USER_ACCOUNTS (CORPORATE_ACCOUNT, USER_ID, USER_NAME, PASSWORD_HASH, 
         PASSWORD_RESET_TOKEN, PASSWORD_RESET_EXPIRES, LAST_PASSWORD_CHANGE, STATUS, ACCESS_LEVEL, CREATED_DATE, UPDATED_DATE, DEFAULT_PROJECT,
@@ -1951,10 +2116,7 @@ def update_user(current_user):
     sts_description = "User updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         if password:
             password_hash = hash_password(password)
@@ -2085,10 +2247,7 @@ def update_user_access_level(current_user):
     placeholders = ','.join(['%s'] * len(user_ids))
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_update_query = f"""UPDATE USER_ACCOUNTS 
@@ -2189,10 +2348,7 @@ def update_user_password(current_user):
     placeholders = ','.join(['%s'] * len(user_ids))
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         logging.info("check 4")
 
@@ -2297,10 +2453,7 @@ def update_user_status(current_user):
     placeholders = ','.join(['%s'] * len(user_ids))
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = f"""UPDATE USER_ACCOUNTS 
                               SET STATUS = %s,
@@ -2353,10 +2506,7 @@ def get_access_levels_definition_NOT_REQD(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT CATEGORY_HEADER, CATEGORY_SUB_HEADER, CATEGORY_ID FROM ACCOUNT_ACCESS_LEVELS
         WHERE STATUS = %s AND CORPORATE_ACCOUNT = %s AND """ + access_level_str + """ = True ORDER BY CATEGORY_ID"""
@@ -2412,10 +2562,7 @@ def get_user_api_access_level(current_user):
     logging.info("Inside get user access level - data =  ${data}")
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(stale_ok=False)
         cursor = connection.cursor()
         mySql_select_query = """SELECT ACCESS_LEVEL FROM USER_PROJECTS 
         WHERE USER_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -2498,10 +2645,7 @@ def get_user_access_level_new(current_user):
     user_actions_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT ACCESS_LEVEL FROM USER_PROJECTS 
         WHERE USER_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -2610,10 +2754,7 @@ def get_access_level_category_headers(current_user):
     category_header_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = f"""SELECT ACCESS_LEVEL FROM USER_ACCOUNTS WHERE CORPORATE_ACCOUNT = %s AND USER_ID = %s"""
@@ -2701,10 +2842,7 @@ def get_admin_access_level_definitions(current_user):
     category_sub_header_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT CATEGORY_SUB_HEADER,
             LEVEL_1,
@@ -2803,10 +2941,7 @@ def update_admin_access_level_definition(current_user):
     sts_description = f"Access level definition updated successfully. Updated fields: {', '.join([field.split(' = ')[0] for field in update_fields[:-1]])}"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Build dynamic SQL query
@@ -2864,10 +2999,7 @@ def get_access_level_roles(current_user):
     access_level_roles  = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT LEVEL_NAME, ROLE_NAME FROM ACCOUNT_ACCESS_LEVELS_ROLES
         WHERE CORPORATE_ACCOUNT = %s """
@@ -2948,10 +3080,7 @@ def update_account_access_levels_roles(current_user):
     failed_updates = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Process each level-role pair
@@ -3063,10 +3192,7 @@ def change_user_default_project(current_user):
     sts_description = "Default project for the user updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """UPDATE USER_ACCOUNTS SET DEFAULT_PROJECT = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND USER_ID = %s AND STATUS = %s"""
 
@@ -3112,10 +3238,7 @@ def get_user_info(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(stale_ok=False, shard=get_user_shard(user_id))
         cursor = connection.cursor()
 
         mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.USER_NAME, A.CREATED_DATE, A.UPDATED_DATE, A.ACCESS_LEVEL, A.DEFAULT_PROJECT, B.ACCOUNT_DESCRIPTION
@@ -3180,4 +3303,8 @@ def get_user_info(current_user):
 
 
 if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.register_blueprint(account_and_project_blueprint)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import Blueprint, g, jsonify, request
+
+import config
+from db_routing import current_corporate_account
+from utils import token_required, verify_token
+
+# Per-tenant admission control in front of the worker threads and the database pools. Requests
+# are sorted into classes by endpoint: heavy (list endpoints, copies, zip downloads), write and
+# auth. Each account may run only a few requests of a class at once, and a heavy class also has a
+# cap across all accounts, so one account's large lists or copies cannot occupy every thread and
+# connection. A request that finds no free slot waits up to MAX_WAIT_SECONDS in a short queue;
+# when the queue is full or the wait runs out it gets 503 with Retry-After. Single-record reads,
+# job status and the event stream are not limited. Background jobs use the JOB class, see
+# background_jobs._run_job.
+#
+# Limits are per process (one gunicorn worker), like the connection pools they protect. Requests
+# without an account (logins) share one bucket per class. Form and multipart requests (uploads) are
+# admitted before their body is read: they are keyed by the corporate_account query parameter, or
+# else by the signed-in user, so a large upload is not spooled just to find its bucket. Queueing time is sent back in a
+# Server-Timing header and summarised per class by /api/get_admission_metrics.
+
+HEAVY = 'heavy'
+WRITE = 'write'
+AUTH = 'auth'
+JOB = 'job'
+
+# Requests of a class one account may run at once
+TENANT_LIMITS = {HEAVY: 2, WRITE: 4, AUTH: 4, JOB: 2}
+TENANT_LIMITS.update(getattr(config, 'ADMISSION_TENANT_LIMITS', {}))
+
+# Requests of a class all accounts together may run at once; None for no cap. With the default
+# four threads per worker, three heavy requests leave one thread for everything else.
+CLASS_LIMITS = {HEAVY: 3, WRITE: None, AUTH: None, JOB: None}
+CLASS_LIMITS.update(getattr(config, 'ADMISSION_CLASS_LIMITS', {}))
+
+RETRY_AFTER_SECONDS = {HEAVY: 5, WRITE: 1, AUTH: 1, JOB: 5}
+RETRY_AFTER_SECONDS.update(getattr(config, 'ADMISSION_RETRY_AFTER_SECONDS', {}))
+
+# Requests that may wait for a slot, per account and class
+QUEUE_LENGTH = getattr(config, 'ADMISSION_QUEUE_LENGTH', 4)
+MAX_WAIT_SECONDS = getattr(config, 'ADMISSION_MAX_WAIT_SECONDS', 1.0)
+
+# Waits kept per class for the percentiles in the metrics
+RECENT_WAITS = 1000
+
+AUTH_ENDPOINTS = {'validate_user_credentials', 'update_user_password'}
+HEAVY_ENDPOINTS = {'download_requirement_attachments_zip', 'get_search_results_list', 'get_requirements_by_approver'}
+UNLIMITED_ENDPOINTS = {'events', 'health', 'get_job_status', 'cancel_job', 'get_admission_metrics'}
+
+admission_blueprint = Blueprint('admission', __name__)
+
+
+def endpoint_class(endpoint):
+    """Admission class of an /api/<endpoint> request, or None when it is not limited"""
+    if endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if endpoint in AUTH_ENDPOINTS:
+        return AUTH
+    if endpoint in HEAVY_ENDPOINTS or endpoint.startswith('copy_') \
+            or (endpoint.startswith('get_') and '_list' in endpoint):
+        return HEAVY
+    if endpoint.startswith(('get_', 'download_')):
+        return None
+    return WRITE
+
+
+class AdmissionLimiter:
+    """Counts running and waiting requests per (class, account) and per class"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._running = {}
+        self._class_running = {}
+        self._waiting = {}
+
+    def _has_room(self, request_class, corporate_account):
+        class_limit = CLASS_LIMITS.get(request_class)
+        return self._running.get((request_class, corporate_account), 0) < TENANT_LIMITS[request_class] \
+            and (class_limit is None or self._class_running.get(request_class, 0) < class_limit)
+
+    def acquire(self, request_class, corporate_account, timeout):
+        """Take a slot, waiting up to timeout seconds. Returns the seconds waited, or None if refused."""
+        key = (request_class, corporate_account)
+        started = time.monotonic()
+        with self._condition:
+            if not self._has_room(request_class, corporate_account):
+                if not timeout or self._waiting.get(key, 0) >= QUEUE_LENGTH:
+                    return None
+                self._waiting[key] = self._waiting.get(key, 0) + 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self._has_room(request_class, corporate_account),
+                                                        timeout)
+                finally:
+                    self._waiting[key] -= 1
+                    if not self._waiting[key]:
+                        del self._waiting[key]
+                if not admitted:
+                    return None
+
+            self._running[key] = self._running.get(key, 0) + 1
+            self._class_running[request_class] = self._class_running.get(request_class, 0) + 1
+        return time.monotonic() - started
+
+    def release(self, request_class, corporate_account):
+        key = (request_class, corporate_account)
+        with self._condition:
+            self._running[key] -= 1
+            if not self._running[key]:
+                del self._running[key]
+            self._class_running[request_class] -= 1
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return dict(self._class_running), sum(self._waiting.values())
+
+
+class AdmissionMetrics:
+    """Admitted, queued and refused counts and queueing times per class, for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._classes = {}
+
+    def _stats(self, request_class):
+        return self._classes.setdefault(request_class, {
+            'admitted': 0, 'queued': 0, 'refused': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0,
+            'recent_waits': deque(maxlen=RECENT_WAITS)
+        })
+
+    def record_admitted(self, request_class, waited):
+        with self._lock:
+            stats = self._stats(request_class)
+            stats['admitted'] += 1
+            if waited > 0.001:
+                stats['queued'] += 1
+            stats['wait_seconds_total'] += waited
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+            stats['recent_waits'].append(waited)
+
+    def record_refused(self, request_class):
+        with self._lock:
+            self._stats(request_class)['refused'] += 1
+
+    def summary(self):
+        with self._lock:
+            summary = {}
+            for request_class, stats in self._classes.items():
+                waits = sorted(stats['recent_waits'])
+                summary[request_class] = {
+                    'admitted': stats['admitted'],
+                    'queued': stats['queued'],
+                    'refused': stats['refused'],
+                    'wait_ms_avg': round(stats['wait_seconds_total'] * 1000 / stats['admitted'], 1)
+                    if stats['admitted'] else 0.0,
+                    'wait_ms_p95': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                    'wait_ms_max': round(stats['wait_seconds_max'] * 1000, 1)
+                }
+            return summary
+
+
+limiter = AdmissionLimiter()
+metrics = AdmissionMetrics()
+
+
+def _request_endpoint():
+    if not request.path.startswith('/api/'):
+        return None
+    return request.path[len('/api/'):].split('/')[0]
+
+
+def _admission_key():
+    """Bucket of the current request, without reading a form or multipart body"""
+    if request.mimetype not in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        return current_corporate_account()
+    corporate_account = request.args.get('requesting_for_corporate_account') or request.args.get('corporate_account')
+    if corporate_account:
+        return corporate_account
+    authorization = request.headers.get('Authorization', '').split(' ')
+    if len(authorization) == 2:
+        current_user, _ = verify_token(authorization[1])
+        if current_user:
+            return f"user:{current_user['user_id']}"
+    return None
+
+
+def admit_request():
+    """before_request hook: hold a slot for the request, or answer 503 when none frees up in time"""
+    if request.method == 'OPTIONS':
+        return None
+    endpoint = _request_endpoint()
+    request_class = endpoint_class(endpoint) if endpoint else None
+    if request_class is None:
+        return None
+
+    corporate_account = _admission_key()
+    waited = limiter.acquire(request_class, corporate_account, MAX_WAIT_SECONDS)
+    if waited is None:
+        metrics.record_refused(request_class)
+        logging.warning(f"Admission refused for {endpoint} ({request_class}) from account {corporate_account}")
+        response = jsonify({
+            'status': 'Failed',
+            'status_description': 'Too many requests are running for this account. Please try again shortly.',
+            'error_type': 'SERVER_BUSY'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS[request_class])
+        return response
+
+    metrics.record_admitted(request_class, waited)
+    g.admission = (request_class, corporate_account, waited)
+    return None
+
+
+def add_queueing_time(response):
+    """after_request hook: report the time spent waiting for a slot"""
+    admission = g.get('admission')
+    if admission:
+        response.headers.add('Server-Timing', f"admission;dur={admission[2] * 1000:.1f}")
+    return response
+
+
+def release_request(exception=None):
+    """teardown_request hook: give the slot back however the request ended"""
+    admission = g.pop('admission', None)
+    if admission:
+        limiter.release(admission[0], admission[1])
+
+
+def init_admission_control(app):
+    """Register admission control on the Flask app"""
+    app.before_request(admit_request)
+    app.after_request(add_queueing_time)
+    app.teardown_request(release_request)
+
+
+@admission_blueprint.route('/api/get_admission_metrics', methods=['GET'])
+@token_required
+def get_admission_metrics(current_user):
+    running, waiting = limiter.snapshot()
+    return jsonify({
+        'process_id': os.getpid(),
+        'running': running,
+        'waiting': waiting,
+        'classes': metrics.summary(),
+        'status': 'Success',
+        'status_description': 'Admission metrics retrieved successfully'
+    })
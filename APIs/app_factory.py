@@ -0,0 +1,94 @@
+import importlib
+import logging
+
+from flask import Flask
+from flask_cors import CORS
+
+from admission_control import init_admission_control
+from attachment_store import init_upload_limits
+from compression import init_compression
+from db_routing import LAST_WRITE_HEADER, init_db_routing
+from json_provider import init_json_provider
+
+# Builds the one Flask app that main.py, main_prod.py and asgi_app.py serve. The blueprint modules
+# are imported by create_app() rather than by importing this module, so scripts that only need a
+# helper from here do not pay for the whole API. benchmarks/import_budget.py keeps an eye on how
+# long create_app() takes from a cold start.
+
+LOG_FILE = 'debugging.log'
+
+# (module, blueprint), registered in this order
+BLUEPRINTS = [
+    ('initial_setup_v2', 'initialsetup_blueprint'),
+    ('account_and_project_v2', 'account_and_project_blueprint'),
+    ('requirements_v2', 'requirements_blueprint'),
+    ('base_requirements_v2', 'base_requirements_blueprint'),
+    ('integration_requirements_v2', 'integration_requirements_blueprint'),
+    ('upload_attachment', 'file_management_blueprint'),
+    ('project_management_v2', 'raid_log_blueprint'),
+    ('FeedbackSubmission', 'feedback_blueprint'),
+    ('background_jobs', 'background_jobs_blueprint'),
+    ('change_events', 'change_events_blueprint'),
+    ('admission_control', 'admission_blueprint'),
+]
+
+
+def create_app():
+    # Logging is configured here, once, instead of by whichever blueprint module happened to load first
+    logging.basicConfig(filename=LOG_FILE, level=logging.DEBUG)
+
+    app = Flask(__name__)
+
+    # Browsers only let the page read response headers that are exposed
+    CORS(app, expose_headers=[LAST_WRITE_HEADER])
+    init_compression(app)
+    init_json_provider(app)
+    init_db_routing(app)
+    init_admission_control(app)
+    init_upload_limits(app)
+
+    for module_name, blueprint_name in BLUEPRINTS:
+        app.register_blueprint(getattr(importlib.import_module(module_name), blueprint_name))
+
+    return app
+
+
+def start_background_services():
+    """
+    Per-process threads; call after create_app(), which registers the job handlers. Threads do
+    not survive fork(), so under the pre-fork server gunicorn.conf.py runs this in every worker
+    rather than once in the master. Schema changes are not made here; see migrate_schema.py.
+    """
+    from background_jobs import resume_queued_jobs
+    from email_outbox import wake_outbox_sender
+    from file_reaper import start_file_reaper
+
+    # Pick up copy jobs that were queued before the last restart
+    resume_queued_jobs()
+
+    # Deliver emails still waiting in the outbox
+    wake_outbox_sender()
+
+    # Scheduled file deletions and the orphaned attachment sweep
+    start_file_reaper()
+
+
+def warm_up():
+    """Open this worker's database pools and fill the reference caches before it takes traffic"""
+    from account_and_project_v2 import ProjectRecordsCopier
+    from attachment_store import get_storage_backend
+    from db_routing import get_read_connection, warm_up_connections
+
+    warm_up_connections()
+    get_storage_backend()
+
+    # Column metadata used by project copies
+    try:
+        connection = get_read_connection(stale_ok=False)
+        try:
+            copier = ProjectRecordsCopier(connection)
+            copier._load_table_metadata(copier.default_tables)
+        finally:
+            connection.close()
+    except Exception as e:
+        logging.error(f"Unable to load table metadata during warm-up: {str(e)}")
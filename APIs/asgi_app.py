@@ -0,0 +1,319 @@
+"""
+Async (ASGI) serving mode.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 4
+
+The Flask app from main_prod.py is served unchanged through a2wsgi's WSGIMiddleware, whose
+thread pool (ASYNC_WSGI_THREADS) runs the blueprint handlers. The endpoints that spend their time
+waiting rather than querying run natively on the event loop, over aiomysql (async_db.py) and
+aiofiles, so they hold no thread while they wait:
+  - GET /api/events: Server-Sent Events change feed; an open stream costs a queue, not a thread
+  - GET /api/download_requirement_attachment/<id>: blob downloads. Range requests and files that
+    predate the blob store are handed to the Flask handler.
+Sync mode (main.py / main_prod.py) is unaffected.
+"""
+import asyncio
+import json
+import mimetypes
+import re
+from urllib.parse import parse_qs
+
+import aiofiles
+import aiofiles.os
+from a2wsgi import WSGIMiddleware
+from werkzeug.utils import secure_filename
+
+import config
+from async_db import close_pools, connection
+from attachment_store import content_hash_from_path, get_storage_backend, local_attachment_path
+from change_events import EVENTS_AFTER_QUERY, HEARTBEAT_SECONDS, MAX_REPLAY, MAX_STREAM_SECONDS, \
+    OLDEST_EVENT_QUERY, RETRY_MILLISECONDS, SUBSCRIBER_QUEUE_SIZE, can_replay, events_to_replay, format_event, \
+    format_reconnect, format_reset, get_change_dispatcher, parse_event_id
+from db_routing import shard_for
+from foundational_v2 import get_user_api_access_level
+from app_factory import start_background_services, warm_up
+from main_prod import app as flask_app
+from upload_attachment import ACCEL_REDIRECT_PREFIX, BLOB_CACHE_MAX_AGE
+from utils import verify_stream_token, verify_token
+
+ASYNC_WSGI_THREADS = getattr(config, 'ASYNC_WSGI_THREADS', 32)
+FILE_CHUNK_SIZE = 256 * 1024
+
+# Same as flask_cors' defaults on the Flask side
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+class AsyncSubscriber:
+    """An event stream on the loop; the dispatcher thread hands it events thread-safely"""
+
+    def __init__(self, corporate_account, project_id, loop):
+        self.key = (corporate_account, project_id)
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+        self._loop = loop
+
+    def deliver(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def _query_params(scope):
+    return {key: values[0] for key, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+async def _send_json(send, status, body, headers=()):
+    payload = json.dumps(body).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(payload)).encode())] + CORS_HEADERS + list(headers)})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _load_events_after(corporate_account, project_id, last_event_id):
+    last_shard, last_event_id = last_event_id
+    shard = await asyncio.to_thread(shard_for, corporate_account)
+    if last_shard != shard:
+        return None
+    async with connection(shard=shard) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(OLDEST_EVENT_QUERY)
+            if not can_replay((await cursor.fetchone())[0], last_event_id):
+                return None
+            await cursor.execute(EVENTS_AFTER_QUERY, (corporate_account, project_id, last_event_id, MAX_REPLAY + 1))
+            return events_to_replay(await cursor.fetchall(), shard)
+
+
+async def stream_change_events(scope, receive, send):
+    """Async twin of change_events.stream_change_events"""
+    params = _query_params(scope)
+    headers = _headers(scope)
+
+    corporate_account = params.get('corporate_account')
+    project_id = params.get('project_id')
+
+    authorization = headers.get('authorization', '')
+    if ' ' in authorization:
+        current_user, message = verify_token(authorization.split(" ")[1])
+    elif params.get('stream_token'):
+        current_user, message = verify_stream_token(params['stream_token'], corporate_account, project_id)
+    else:
+        return await _send_json(send, 401, {'message': 'Token is missing!'})
+    if message:
+        return await _send_json(send, 401, {'message': message})
+    last_event_id = headers.get('last-event-id') or params.get('last_event_id')
+
+    if not corporate_account or not project_id:
+        return await _send_json(send, 400, {
+            'status': 'Failed',
+            'status_description': 'corporate_account and project_id are required'
+        })
+
+    if last_event_id is not None:
+        try:
+            last_event_id = parse_event_id(last_event_id)
+        except ValueError:
+            return await _send_json(send, 400, {
+                'status': 'Failed',
+                'status_description': 'Last-Event-ID must be an event id'
+            })
+
+    # One short check when the stream opens; it shares the access rules of the sync endpoints
+    _, _, sts, _ = await asyncio.to_thread(get_user_api_access_level, current_user['user_id'], corporate_account,
+                                           project_id, None)
+    if sts != 'Success':
+        return await _send_json(send, 403, {
+            'status': 'Failed',
+            'status_description': 'Access denied',
+            'error_type': 'INSUFFICIENT_ACCESS'
+        })
+
+    dispatcher = get_change_dispatcher()
+    # Subscribe before replaying so nothing committed in between is lost
+    subscriber = dispatcher.add_subscriber(AsyncSubscriber(corporate_account, project_id, asyncio.get_running_loop()))
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+
+    async def send_chunk(text):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                                (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')] + CORS_HEADERS})
+        await send_chunk(f"retry: {RETRY_MILLISECONDS}\n\n")
+
+        sent_ids = set()
+        if last_event_id is not None:
+            missed_events = await _load_events_after(corporate_account, project_id, last_event_id)
+            if missed_events is None:
+                await send_chunk(format_reset())
+            else:
+                for event in missed_events:
+                    sent_ids.add(event['event_id'])
+                    await send_chunk(format_event(event))
+
+        ends_at = asyncio.get_running_loop().time() + MAX_STREAM_SECONDS
+        while not disconnected.done():
+            remaining = ends_at - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                await send_chunk(format_reconnect())
+                await send({'type': 'http.response.body', 'body': b''})
+                break
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                await send_chunk(format_reset())
+
+            next_event = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=min(HEARTBEAT_SECONDS, remaining),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                if not disconnected.done():
+                    await send_chunk(": keep-alive\n\n")
+                continue
+
+            event = next_event.result()
+            if event['event_id'] in sent_ids:
+                # Already sent while replaying
+                continue
+            await send_chunk(format_event(event))
+
+    finally:
+        dispatcher.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/').strip('"') == etag for tag in tags)
+
+
+async def download_requirement_attachment(scope, receive, send, attachment_id, fallback):
+    """Async twin of upload_attachment.download_requirement_attachment for blob files"""
+    params = _query_params(scope)
+    headers = _headers(scope)
+
+    if scope['method'] != 'GET' or 'range' in headers:
+        return await fallback(scope, receive, send)
+
+    if not params.get('token'):
+        return await _send_json(send, 401, {'status': 'Error', 'message': 'Token is missing!'})
+
+    # corporate_account picks the shard; without it the default shard is searched
+    async with connection(corporate_account=params.get('corporate_account')) as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("""
+                SELECT FILE_NAME, FILE_PATH
+                FROM REQUIREMENT_ATTACHMENTS
+                WHERE ATTACHMENT_ID = %s
+            """, (attachment_id,))
+            result = await cursor.fetchone()
+
+    if not result:
+        return await _send_json(send, 404, {'status': 'Error', 'status_description': 'Attachment not found'})
+
+    file_name, file_path = result
+    content_hash = content_hash_from_path(file_path)
+    if not content_hash:
+        # send_file derives validators for pre-blob files; leave those to Flask
+        return await fallback(scope, receive, send)
+
+    cache_headers = [(b'etag', f'"{content_hash}"'.encode()),
+                     (b'cache-control', f'private, max-age={BLOB_CACHE_MAX_AGE}, immutable'.encode())]
+    disposition = f'attachment; filename="{secure_filename(file_name)}"'.encode('latin-1')
+
+    presigned_url = get_storage_backend().presigned_url(file_path, secure_filename(file_name))
+    if presigned_url:
+        await send({'type': 'http.response.start', 'status': 302,
+                    'headers': [(b'location', presigned_url.encode('latin-1'))] + CORS_HEADERS})
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    full_path = local_attachment_path(file_path)
+    if not full_path or not await aiofiles.os.path.exists(full_path):
+        return await _send_json(send, 404, {'status': 'Error', 'status_description': 'File not found on server'})
+
+    if _etag_matches(headers.get('if-none-match', ''), content_hash):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': cache_headers + CORS_HEADERS})
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    if ACCEL_REDIRECT_PREFIX:
+        accel_path = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + file_path.replace('\\', '/')
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'x-accel-redirect', accel_path.encode('latin-1')),
+                                (b'content-disposition', disposition)] + cache_headers + CORS_HEADERS})
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    file_size = (await aiofiles.os.stat(full_path)).st_size
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', content_type.encode('latin-1')),
+                            (b'content-length', str(file_size).encode()),
+                            (b'content-disposition', disposition),
+                            (b'accept-ranges', b'bytes')] + cache_headers + CORS_HEADERS})
+    async with aiofiles.open(full_path, 'rb') as attachment:
+        while True:
+            chunk = await attachment.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class AsyncApp:
+    """Routes the native async endpoints and hands every other request to the Flask app"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=ASYNC_WSGI_THREADS)
+        self.routes = [
+            (re.compile(r'^/api/events$'), stream_change_events),
+            (re.compile(r'^/api/download_requirement_attachment/(?P<attachment_id>[^/]+)$'),
+             lambda scope, receive, send, attachment_id:
+             download_requirement_attachment(scope, receive, send, attachment_id, self.wsgi)),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] != 'OPTIONS':
+            for pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    return await handler(scope, receive, send, **match.groupdict())
+
+        await self.wsgi(scope, receive, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Each uvicorn worker warms up before it takes traffic, as under gunicorn.conf.py
+                await asyncio.to_thread(warm_up)
+                start_background_services()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_pools()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app)
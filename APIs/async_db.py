@@ -0,0 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+import config
+from db_routing import resolve_shard
+
+# aiomysql connection pools for the handlers that run natively on the event loop in async serving
+# mode (asgi_app.py). Connections go to the same shard get_connection() would pick, always on
+# the shard's primary. Pools are per process and created on first use.
+
+ASYNC_DB_POOL_SIZE = getattr(config, 'ASYNC_DB_POOL_SIZE', 20)
+POOL_RECYCLE_SECONDS = 3600
+
+_pools = {}
+
+
+async def _get_pool(shard):
+    pool = _pools.get(shard.name)
+    if pool is None:
+        settings = shard.settings
+        pool = await aiomysql.create_pool(host=settings['host'],
+                                          port=settings.get('port', 3306),
+                                          user=settings['user'],
+                                          password=settings['password'],
+                                          db=settings['database'],
+                                          minsize=1,
+                                          maxsize=ASYNC_DB_POOL_SIZE,
+                                          autocommit=True,
+                                          pool_recycle=POOL_RECYCLE_SECONDS)
+        # Another coroutine may have created one meanwhile
+        existing = _pools.setdefault(shard.name, pool)
+        if existing is not pool:
+            pool.close()
+            await pool.wait_closed()
+            pool = existing
+    return pool
+
+
+@asynccontextmanager
+async def connection(corporate_account=None, shard=None, writing=False):
+    """
+    A pooled connection for the account's shard (or the named shard). Connections are in
+    autocommit mode; writers wrap their statements in begin() / commit().
+    """
+    # Resolving may refresh the shard map with a blocking query, so it runs off the loop
+    target = await asyncio.to_thread(resolve_shard, corporate_account, shard, writing)
+    pool = await _get_pool(target)
+    async with pool.acquire() as conn:
+        yield conn
+
+
+async def close_pools():
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        pool.close()
+        await pool.wait_closed()
@@ -0,0 +1,412 @@
+import hashlib
+import logging
+import os
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+from flask import Request, current_app, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import config
+from db_routing import sharding_enabled
+
+# Content-addressed blob store for requirement and feedback attachments.
+# Blobs are keyed blobs/<aa>/<bb>/<sha256> and are shared by every attachment row with the
+# same content. ATTACHMENT_BLOBS counts the rows pointing at each blob. Where the blob bytes
+# live is up to the storage backend (config.ATTACHMENTS_STORAGE_BACKEND: 'local' or 's3').
+# Uploads are always staged in a local temp folder first: UploadRequest has werkzeug write each
+# multipart file part straight into an UploadSpool there, hashing and counting bytes as the body is
+# read, and stops reading with 413 once a part or the whole body goes over the endpoint's limits.
+# With tenant shards each shard counts its own references to the shared blob files, so a blob
+# whose last reference on one shard goes away is left for the orphan sweep, which checks them all.
+# ATTACHMENT_BLOBS is created on every shard by migrate_schema.py.
+
+UPLOAD_FOLDER = config.ATTACHMENTS_FOLDER_PATH
+BLOB_FOLDER = 'blobs'
+BLOB_TMP_FOLDER = os.path.join(BLOB_FOLDER, 'tmp')
+STREAM_CHUNK_SIZE = 1024 * 1024
+FORM_OVERHEAD = 64 * 1024  # Allowance for multipart headers and the other form fields in an upload
+
+BLOBS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS ATTACHMENT_BLOBS (
+        CONTENT_HASH CHAR(64) NOT NULL PRIMARY KEY,
+        FILE_PATH VARCHAR(255) NOT NULL,
+        FILE_SIZE BIGINT NOT NULL,
+        REF_COUNT INT NOT NULL DEFAULT 0,
+        CREATED_DATE DATETIME,
+        UPDATED_DATE DATETIME
+    )
+"""
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload is rejected for crossing its size limit"""
+
+
+class StorageBackend:
+    """Where blob bytes are kept. Keys are blob relative paths."""
+
+    def put(self, temp_path, key):
+        """Move a staged local file into storage under key"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def open(self, key):
+        """Binary file-like object for reading the blob; use it as a context manager"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path of the blob, or None if it is not on local disk"""
+        return None
+
+    def presigned_url(self, key, file_name, expires_in=None):
+        """Time-limited URL a client can download the blob from directly, or None"""
+        return None
+
+
+class LocalDiskBackend(StorageBackend):
+    """Blobs on local disk, fanned out two directory levels by hash prefix"""
+
+    def __init__(self, root_folder):
+        self.root_folder = root_folder
+
+    def put(self, temp_path, key):
+        full_path = os.path.join(self.root_folder, key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(temp_path, full_path)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root_folder, key))
+
+    def delete(self, key):
+        full_path = os.path.join(self.root_folder, key)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+    def open(self, key):
+        return open(os.path.join(self.root_folder, key), 'rb')
+
+    def local_path(self, key):
+        return os.path.join(self.root_folder, key)
+
+
+class S3Backend(StorageBackend):
+    """Blobs in an S3-compatible bucket (AWS S3, MinIO, ...); needs boto3"""
+
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None, region=None, prefix='',
+                 presigned_url_expiry=300):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, aws_access_key_id=access_key,
+                                   aws_secret_access_key=secret_key, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix else ''
+        self.presigned_url_expiry = presigned_url_expiry
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def put(self, temp_path, key):
+        self.client.upload_file(temp_path, self.bucket, self._object_key(key))
+        os.remove(temp_path)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self._client_error as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def open(self, key):
+        return closing(self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body'])
+
+    def presigned_url(self, key, file_name, expires_in=None):
+        return self.client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': self._object_key(key),
+            'ResponseContentDisposition': f'attachment; filename="{file_name}"'
+        }, ExpiresIn=expires_in or self.presigned_url_expiry)
+
+
+_storage_backend = None
+
+
+def get_storage_backend():
+    """Storage backend selected by config, created on first use"""
+    global _storage_backend
+    if _storage_backend is None:
+        backend_name = getattr(config, 'ATTACHMENTS_STORAGE_BACKEND', 'local')
+        if backend_name == 's3':
+            _storage_backend = S3Backend(
+                bucket=config.ATTACHMENTS_S3_BUCKET,
+                endpoint_url=getattr(config, 'ATTACHMENTS_S3_ENDPOINT_URL', None),
+                access_key=getattr(config, 'ATTACHMENTS_S3_ACCESS_KEY', None),
+                secret_key=getattr(config, 'ATTACHMENTS_S3_SECRET_KEY', None),
+                region=getattr(config, 'ATTACHMENTS_S3_REGION', None),
+                prefix=getattr(config, 'ATTACHMENTS_S3_PREFIX', ''),
+                presigned_url_expiry=getattr(config, 'ATTACHMENTS_PRESIGNED_URL_EXPIRY', 300))
+        else:
+            _storage_backend = LocalDiskBackend(UPLOAD_FOLDER)
+    return _storage_backend
+
+
+os.makedirs(os.path.join(UPLOAD_FOLDER, BLOB_TMP_FOLDER), exist_ok=True)
+
+
+def blob_relative_path(content_hash):
+    """Relative path of a blob; two levels of fan-out keep directories small"""
+    return f"{BLOB_FOLDER}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def content_hash_from_path(relative_path):
+    """Returns the SHA-256 of a blob path, or None for files stored outside the blob store"""
+    if not relative_path:
+        return None
+    parts = relative_path.replace('\\', '/').split('/')
+    if len(parts) == 4 and parts[0] == BLOB_FOLDER and len(parts[3]) == 64:
+        return parts[3]
+    return None
+
+
+class UploadSpool:
+    """
+    Where werkzeug writes one multipart file part: a temp file in the blob store's tmp folder,
+    hashed and counted while the request body is parsed. Writing past max_size raises 413, so the
+    rest of the body is never read. The temp file is removed when the request closes unless it
+    was moved into the store by then.
+    """
+
+    def __init__(self, max_size=None):
+        self.path = os.path.join(UPLOAD_FOLDER, BLOB_TMP_FOLDER, uuid.uuid4().hex)
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(f"An uploaded file is larger than {self.max_size} bytes")
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def finish(self):
+        """Close the spooled file and return (content_hash, file_size, temp_path)"""
+        self._file.close()
+        return self._sha256.hexdigest(), self.size, self.path
+
+    def close(self):
+        self._file.close()
+        discard_temp(self.path)
+
+
+def upload_limits(max_file_size, max_files):
+    """
+    Size limits of an upload endpoint; put it right under the route decorator. UploadRequest
+    enforces them while the body is read, whichever code touches request.form first.
+    """
+    def decorator(f):
+        f.upload_limits = (max_file_size, max_files)
+        return f
+    return decorator
+
+
+class UploadRequest(Request):
+    """Request class that spools file parts with UploadSpool under the endpoint's upload_limits"""
+
+    def _endpoint_upload_limits(self):
+        view = current_app.view_functions.get(self.endpoint) if self.endpoint else None
+        return getattr(view, 'upload_limits', None)
+
+    @property
+    def max_content_length(self):
+        limits = self._endpoint_upload_limits()
+        if limits:
+            max_file_size, max_files = limits
+            return max_file_size * max_files + FORM_OVERHEAD
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limits = self._endpoint_upload_limits()
+        return UploadSpool(limits[0] if limits else None)
+
+
+def _upload_too_large(error):
+    limits = request._endpoint_upload_limits() if isinstance(request, UploadRequest) else None
+    description = 'Upload too large'
+    if limits:
+        description += f'. Maximum size is {limits[0] // (1024 * 1024)}MB per file and {limits[1]} files'
+    return jsonify({
+        'status': 'Error',
+        'status_description': description
+    }), 413
+
+
+def init_upload_limits(app):
+    """Parse uploads with UploadRequest and answer 413s as JSON"""
+    app.request_class = UploadRequest
+    app.register_error_handler(RequestEntityTooLarge, _upload_too_large)
+
+
+def stream_to_temp(file_storage, max_size=None):
+    """
+    Returns (content_hash, file_size, temp_path) for an uploaded file. Parts spooled by
+    UploadRequest were hashed and counted while the body was read; anything else is streamed
+    to a temporary file in fixed-size chunks. Raises UploadTooLarge when the file (or the part's
+    declared Content-Length) goes over max_size.
+    """
+    if isinstance(file_storage.stream, UploadSpool):
+        content_hash, file_size, temp_path = file_storage.stream.finish()
+        if max_size is not None and file_size > max_size:
+            raise UploadTooLarge(f"{file_storage.filename} is larger than {max_size} bytes")
+        return content_hash, file_size, temp_path
+
+    if max_size is not None and file_storage.content_length and file_storage.content_length > max_size:
+        raise UploadTooLarge(f"{file_storage.filename} declares {file_storage.content_length} bytes")
+
+    temp_path = os.path.join(UPLOAD_FOLDER, BLOB_TMP_FOLDER, uuid.uuid4().hex)
+    sha256 = hashlib.sha256()
+    file_size = 0
+
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            while True:
+                chunk = file_storage.stream.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if max_size is not None and file_size > max_size:
+                    raise UploadTooLarge(f"{file_storage.filename} is larger than {max_size} bytes")
+                sha256.update(chunk)
+                temp_file.write(chunk)
+    except BaseException:
+        discard_temp(temp_path)
+        raise
+
+    return sha256.hexdigest(), file_size, temp_path
+
+
+def open_attachment(relative_path):
+    """Open any stored attachment for reading, whether it is a blob or an older local file"""
+    if content_hash_from_path(relative_path):
+        return get_storage_backend().open(relative_path)
+    return open(os.path.join(UPLOAD_FOLDER, relative_path), 'rb')
+
+
+def local_attachment_path(relative_path):
+    """Local filesystem path of a stored attachment, or None when its blob is held remotely"""
+    if content_hash_from_path(relative_path):
+        return get_storage_backend().local_path(relative_path)
+    return os.path.join(UPLOAD_FOLDER, relative_path)
+
+
+def attachment_exists(relative_path):
+    if content_hash_from_path(relative_path):
+        return get_storage_backend().exists(relative_path)
+    return os.path.exists(os.path.join(UPLOAD_FOLDER, relative_path))
+
+
+def discard_temp(temp_path):
+    """Remove a temporary upload that was not added to the store"""
+    if temp_path and os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+def add_blob_reference(cursor, content_hash, file_size, temp_path=None):
+    """
+    Add one reference to a blob inside the caller's transaction and return its relative path.
+    When temp_path is given it is moved into place (or discarded if the blob already exists).
+    The caller must commit; the blob row stays locked until then.
+    """
+    relative_path = blob_relative_path(content_hash)
+
+    cursor.execute("""
+        INSERT INTO ATTACHMENT_BLOBS (CONTENT_HASH, FILE_PATH, FILE_SIZE, REF_COUNT, CREATED_DATE, UPDATED_DATE)
+        VALUES (%s, %s, %s, 1, %s, %s)
+        ON DUPLICATE KEY UPDATE REF_COUNT = REF_COUNT + 1, UPDATED_DATE = VALUES(UPDATED_DATE)
+    """, (content_hash, relative_path, file_size, datetime.now(), datetime.now()))
+
+    if temp_path:
+        storage = get_storage_backend()
+        if storage.exists(relative_path):
+            discard_temp(temp_path)
+        else:
+            storage.put(temp_path, relative_path)
+
+    return relative_path
+
+
+def release_blob_reference(cursor, relative_path):
+    """
+    Drop one reference to the blob at relative_path inside the caller's transaction.
+    Returns (is_blob, unreferenced_path). is_blob is False when relative_path is not a blob,
+    so the caller can remove the file itself. unreferenced_path is set when the last reference
+    went away: once the transaction has committed, pass it to delete_unreferenced_blob. The file
+    is never removed before then, so a rollback leaves the attachment intact.
+    """
+    content_hash = content_hash_from_path(relative_path)
+    if content_hash is None:
+        return False, None
+
+    cursor.execute("SELECT REF_COUNT FROM ATTACHMENT_BLOBS WHERE CONTENT_HASH = %s FOR UPDATE", (content_hash,))
+    result = cursor.fetchone()
+
+    if not result:
+        logging.warning(f"No blob row found for {relative_path}")
+        return True, None
+
+    ref_count = result['REF_COUNT'] if isinstance(result, dict) else result[0]
+
+    if ref_count > 1:
+        cursor.execute("""UPDATE ATTACHMENT_BLOBS SET REF_COUNT = REF_COUNT - 1, UPDATED_DATE = %s
+            WHERE CONTENT_HASH = %s""", (datetime.now(), content_hash))
+        return True, None
+
+    cursor.execute("DELETE FROM ATTACHMENT_BLOBS WHERE CONTENT_HASH = %s", (content_hash,))
+    # With shards a blob may still be referenced from another shard; the orphan sweep decides
+    return True, None if sharding_enabled() else relative_path
+
+
+def delete_unreferenced_blob(connection, relative_path):
+    """
+    Remove a blob file after the transaction that dropped its last reference has committed,
+    unless an upload of the same content has referenced it again since. The recheck locks the
+    blob's key (a gap lock when the row is gone), so such an upload waits until the file is
+    removed and then puts it back. Failures are logged; the orphan sweep removes the file later.
+    """
+    content_hash = content_hash_from_path(relative_path)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT REF_COUNT FROM ATTACHMENT_BLOBS WHERE CONTENT_HASH = %s FOR UPDATE", (content_hash,))
+        if cursor.fetchone() is None:
+            get_storage_backend().delete(relative_path)
+            logging.info(f"Removed blob {content_hash}, no references left")
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Unable to remove unreferenced blob {relative_path}: {str(e)}")
+    finally:
+        cursor.close()
@@ -0,0 +1,415 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mysql.connector
+from flask import request, jsonify, Blueprint
+
+import config
+from admission_control import JOB, limiter
+from db_routing import use_corporate_account
+from foundational_v2 import get_user_api_access_level
+from utils import token_required
+
+# Create a blueprint for job status routes
+background_jobs_blueprint = Blueprint('background_jobs', __name__)
+
+
+JOB_WORKERS = getattr(config, 'JOB_WORKERS', 4)
+# How long a job waits before trying again when its account already has its share of the workers
+JOB_DEFER_SECONDS = 5
+# Running jobs get UPDATED_DATE refreshed this often by the process running them. One that has not
+# been refreshed for JOB_STALE_SECONDS belonged to a process that died; resume_queued_jobs fails it.
+JOB_HEARTBEAT_SECONDS = 60
+JOB_STALE_SECONDS = getattr(config, 'JOB_STALE_SECONDS', 10 * 60)
+
+# BACKGROUND_JOBS lives on the default shard and is created by migrate_schema.py
+JOBS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS BACKGROUND_JOBS (
+        JOB_ID VARCHAR(32) NOT NULL PRIMARY KEY,
+        JOB_TYPE VARCHAR(100) NOT NULL,
+        CORPORATE_ACCOUNT VARCHAR(100) NOT NULL,
+        PROJECT_ID VARCHAR(100),
+        PAYLOAD LONGTEXT,
+        STATUS VARCHAR(20) NOT NULL,
+        PROGRESS_DONE INT DEFAULT 0,
+        PROGRESS_TOTAL INT DEFAULT 0,
+        PROGRESS_MESSAGE VARCHAR(500),
+        CANCEL_REQUESTED BOOLEAN DEFAULT FALSE,
+        RESULT LONGTEXT,
+        ERROR_MESSAGE TEXT,
+        CREATED_BY VARCHAR(100),
+        CREATED_DATE DATETIME,
+        STARTED_DATE DATETIME,
+        FINISHED_DATE DATETIME,
+        UPDATED_DATE DATETIME,
+        INDEX IDX_BACKGROUND_JOBS_STATUS (STATUS, CREATED_DATE),
+        INDEX IDX_BACKGROUND_JOBS_ACCOUNT (CORPORATE_ACCOUNT, PROJECT_ID)
+    )
+"""
+
+# Job statuses
+QUEUED = 'Queued'
+RUNNING = 'Running'
+COMPLETED = 'Completed'
+FAILED = 'Failed'
+CANCELLED = 'Cancelled'
+
+_job_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_running_jobs = set()
+_running_jobs_lock = threading.Lock()
+_heartbeat = None
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job handler when the job has been cancelled. A handler that stops with part of
+    its work committed sets result to describe it; that is stored as the job's result.
+    """
+    result = None
+
+
+def _get_connection():
+    return mysql.connector.connect(host=config.host,
+                                   database=config.database,
+                                   user=config.user,
+                                   password=config.password)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='background-job')
+        return _executor
+
+
+def register_job_handler(job_type, handler):
+    """
+    Register the function that runs jobs of job_type.
+    The handler is called as handler(job_context, **payload) and must return a JSON-serialisable dict.
+    """
+    _job_handlers[job_type] = handler
+
+
+class JobContext:
+    """Handed to job handlers for progress reporting and cooperative cancellation"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def report_progress(self, done, total, message=None):
+        """Persist progress and raise JobCancelled if a cancel was requested"""
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""UPDATE BACKGROUND_JOBS SET PROGRESS_DONE = %s, PROGRESS_TOTAL = %s, PROGRESS_MESSAGE = %s,
+                UPDATED_DATE = %s WHERE JOB_ID = %s""", (done, total, message, datetime.now(), self.job_id))
+            cursor.execute("SELECT CANCEL_REQUESTED FROM BACKGROUND_JOBS WHERE JOB_ID = %s", (self.job_id,))
+            result = cursor.fetchone()
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+        if result and result[0]:
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+
+def enqueue_job(job_type, corporate_account, project_id, created_by, payload):
+    """Persist a job and hand it to the worker pool. Returns the new job id."""
+    if job_type not in _job_handlers:
+        raise ValueError(f"No handler registered for job type {job_type}")
+
+    job_id = uuid.uuid4().hex
+    connection = _get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""INSERT INTO BACKGROUND_JOBS (JOB_ID, JOB_TYPE, CORPORATE_ACCOUNT, PROJECT_ID, PAYLOAD, STATUS,
+            CREATED_BY, CREATED_DATE, UPDATED_DATE) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                       (job_id, job_type, corporate_account, project_id, json.dumps(payload), QUEUED, created_by,
+                        datetime.now(), datetime.now()))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    _get_executor().submit(_run_job, job_id, corporate_account)
+    logging.info(f"Queued background job {job_id} of type {job_type}")
+    return job_id
+
+
+def _finish_job(job_id, status, result=None, error_message=None):
+    connection = _get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""UPDATE BACKGROUND_JOBS SET STATUS = %s, RESULT = %s, ERROR_MESSAGE = %s, FINISHED_DATE = %s,
+            UPDATED_DATE = %s WHERE JOB_ID = %s""",
+                       (status, json.dumps(result, default=str) if result is not None else None, error_message,
+                        datetime.now(), datetime.now(), job_id))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def _send_heartbeats():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _running_jobs_lock:
+            job_ids = list(_running_jobs)
+        if not job_ids:
+            continue
+        try:
+            connection = _get_connection()
+            try:
+                cursor = connection.cursor()
+                placeholders = ', '.join(['%s'] * len(job_ids))
+                cursor.execute(f"""UPDATE BACKGROUND_JOBS SET UPDATED_DATE = %s
+                    WHERE JOB_ID IN ({placeholders}) AND STATUS = %s""", [datetime.now()] + job_ids + [RUNNING])
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+        except Exception as e:
+            logging.error(f"Unable to refresh running background jobs: {str(e)}")
+
+
+def _start_heartbeat():
+    global _heartbeat
+    with _running_jobs_lock:
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_send_heartbeats, name='background-job-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+def _run_job(job_id, corporate_account):
+    # At most TENANT_LIMITS[JOB] jobs per account run at once, so other accounts' jobs get workers too
+    if limiter.acquire(JOB, corporate_account, 0) is None:
+        timer = threading.Timer(JOB_DEFER_SECONDS, _get_executor().submit, (_run_job, job_id, corporate_account))
+        timer.daemon = True
+        timer.start()
+        return
+    try:
+        _execute_job(job_id)
+    finally:
+        limiter.release(JOB, corporate_account)
+
+
+def _execute_job(job_id):
+    try:
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+            # Claim the job; only one worker (in any process) can move it out of Queued
+            cursor.execute("""UPDATE BACKGROUND_JOBS SET STATUS = %s, STARTED_DATE = %s, UPDATED_DATE = %s
+                WHERE JOB_ID = %s AND STATUS = %s AND CANCEL_REQUESTED = FALSE""",
+                           (RUNNING, datetime.now(), datetime.now(), job_id, QUEUED))
+            claimed = cursor.rowcount == 1
+            cursor.execute("SELECT JOB_TYPE, CORPORATE_ACCOUNT, PAYLOAD FROM BACKGROUND_JOBS WHERE JOB_ID = %s",
+                           (job_id,))
+            job_type, corporate_account, payload = cursor.fetchone()
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+        if not claimed:
+            return
+
+        _start_heartbeat()
+        with _running_jobs_lock:
+            _running_jobs.add(job_id)
+        try:
+            # The handler's own connections go to the account's shard
+            with use_corporate_account(corporate_account):
+                result = _job_handlers[job_type](JobContext(job_id), **json.loads(payload))
+        finally:
+            with _running_jobs_lock:
+                _running_jobs.discard(job_id)
+        _finish_job(job_id, COMPLETED, result=result)
+        logging.info(f"Background job {job_id} completed")
+
+    except JobCancelled as e:
+        _finish_job(job_id, CANCELLED, result=e.result, error_message=str(e))
+        logging.info(f"Background job {job_id} cancelled")
+
+    except Exception as e:
+        logging.error(f"Background job {job_id} failed: {str(e)}")
+        try:
+            _finish_job(job_id, FAILED, error_message=str(e))
+        except Exception as finish_error:
+            logging.error(f"Unable to record failure of background job {job_id}: {str(finish_error)}")
+
+
+def resume_queued_jobs():
+    """
+    Re-submit jobs still Queued in the table, e.g. after a restart, and fail Running jobs whose
+    process stopped refreshing them. Safe to call from every process.
+    """
+    try:
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+
+            # Not re-run: a handler may have committed part of its work before its process died
+            cursor.execute("""UPDATE BACKGROUND_JOBS SET STATUS = %s, ERROR_MESSAGE = %s, FINISHED_DATE = %s,
+                UPDATED_DATE = %s WHERE STATUS = %s AND UPDATED_DATE < %s""",
+                           (FAILED, 'Interrupted: the server running the job stopped. Please start it again.',
+                            datetime.now(), datetime.now(), RUNNING,
+                            datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)))
+            if cursor.rowcount:
+                logging.warning(f"Marked {cursor.rowcount} interrupted background job(s) as failed")
+            connection.commit()
+
+            cursor.execute("""SELECT JOB_ID, JOB_TYPE, CORPORATE_ACCOUNT FROM BACKGROUND_JOBS WHERE STATUS = %s
+                ORDER BY CREATED_DATE""", (QUEUED,))
+            queued_jobs = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+    except Exception as e:
+        logging.error(f"Unable to resume queued background jobs: {str(e)}")
+        return
+
+    for job_id, job_type, corporate_account in queued_jobs:
+        if job_type in _job_handlers:
+            _get_executor().submit(_run_job, job_id, corporate_account)
+
+
+@background_jobs_blueprint.route('/api/get_job_status', methods=['GET', 'POST'])
+@token_required
+def get_job_status(current_user):
+    data = request.json
+    job_id = data.get('job_id')
+    corporate_account = data.get('corporate_account')
+
+    sts = "Success"
+    sts_description = "Job status retrieved successfully"
+    job_details = None
+
+    if not job_id:
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'Job Id is required'
+        })
+
+    try:
+        connection = _get_connection()
+        cursor = connection.cursor()
+
+        mySql_select_query = """SELECT JOB_ID, JOB_TYPE, PROJECT_ID, STATUS, PROGRESS_DONE, PROGRESS_TOTAL, PROGRESS_MESSAGE,
+            CANCEL_REQUESTED, RESULT, ERROR_MESSAGE, CREATED_BY, CREATED_DATE, STARTED_DATE, FINISHED_DATE
+            FROM BACKGROUND_JOBS WHERE JOB_ID = %s AND CORPORATE_ACCOUNT = %s"""
+        cursor.execute(mySql_select_query, (job_id, corporate_account))
+        result = cursor.fetchone()
+
+        if result:
+            # Only users of the job's account (or its project) may see it
+            _, _, access_sts, _ = get_user_api_access_level(current_user['user_id'], corporate_account, result[2],
+                                                            None)
+            if access_sts != 'Success':
+                return jsonify({
+                    'status': 'Failed',
+                    'status_description': 'Access denied',
+                    'error_type': 'INSUFFICIENT_ACCESS'
+                }), 403
+
+            job_details = {
+                'job_id': result[0],
+                'job_type': result[1],
+                'project_id': result[2],
+                'job_status': result[3],
+                'progress_done': result[4],
+                'progress_total': result[5],
+                'progress_message': result[6],
+                'cancel_requested': bool(result[7]),
+                'result': json.loads(result[8]) if result[8] else None,
+                'error_message': result[9],
+                'created_by': result[10],
+                'created_date': result[11].strftime('%Y-%m-%d %H:%M:%S') if result[11] else None,
+                'started_date': result[12].strftime('%Y-%m-%d %H:%M:%S') if result[12] else None,
+                'finished_date': result[13].strftime('%Y-%m-%d %H:%M:%S') if result[13] else None
+            }
+        else:
+            sts = "Failed"
+            sts_description = "No matching job found"
+
+    except mysql.connector.Error as error:
+        sts = "Failed"
+        sts_description = f"Failed to retrieve the job status: {error}"
+        logging.info(error)
+
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    return jsonify({
+        'job': job_details,
+        'status': sts,
+        'status_description': sts_description
+    })
+
+
+@background_jobs_blueprint.route('/api/cancel_job', methods=['PUT', 'POST'])
+@token_required
+def cancel_job(current_user):
+    data = request.json
+    job_id = data.get('job_id')
+    corporate_account = data.get('corporate_account')
+
+    sts = "Success"
+    sts_description = "Job cancellation requested"
+    rows_impacted = 0
+
+    if not job_id:
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'Job Id is required'
+        })
+
+    try:
+        connection = _get_connection()
+        cursor = connection.cursor()
+
+        # Queued jobs are cancelled immediately; running jobs stop at their next progress report
+        cursor.execute("""UPDATE BACKGROUND_JOBS SET STATUS = %s, CANCEL_REQUESTED = TRUE, FINISHED_DATE = %s, UPDATED_DATE = %s
+            WHERE JOB_ID = %s AND CORPORATE_ACCOUNT = %s AND CREATED_BY = %s AND STATUS = %s""",
+                       (CANCELLED, datetime.now(), datetime.now(), job_id, corporate_account,
+                        current_user['user_id'], QUEUED))
+        rows_impacted = cursor.rowcount
+
+        if rows_impacted == 0:
+            cursor.execute("""UPDATE BACKGROUND_JOBS SET CANCEL_REQUESTED = TRUE, UPDATED_DATE = %s
+                WHERE JOB_ID = %s AND CORPORATE_ACCOUNT = %s AND CREATED_BY = %s AND STATUS = %s""",
+                           (datetime.now(), job_id, corporate_account, current_user['user_id'], RUNNING))
+            rows_impacted = cursor.rowcount
+
+        if rows_impacted == 0:
+            sts = "Failed"
+            sts_description = "No queued or running job found to cancel"
+
+        connection.commit()
+
+    except mysql.connector.Error as error:
+        sts = "Failed"
+        sts_description = f"Failed to cancel the job: {error}"
+        logging.info(error)
+
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    return jsonify({
+        'status': sts,
+        'status_description': sts_description,
+        'rows_impacted': rows_impacted
+    })
@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint
 import mysql.connector
 from datetime import datetime
-import config
+from db_routing import get_connection, get_read_connection
 import logging
 from utils import token_required
+from list_etags import conditional_list, report_list_status
+from delta_sync import parse_updated_since, get_sync_watermark, get_deleted_records, changed_requirements_condition, \
+    FUNCTIONAL_LEVEL
 from access_validation_at_api_level import validate_access
 from foundational_v2 import generate_next_sequence, validate_functional_domain, validate_level_id, validate_req_id, validate_status, validate_user_id, is_user_authorized_to_approve, validate_project_id, validate_product_id,get_functional_level_children
 from foundational_v2 import validate_corporate_account, validate_usecase_id
@@ -13,9 +16,6 @@ from foundational_v2 import validate_corporate_account, validate_usecase_id
 base_requirements_blueprint = Blueprint('base_requirements', __name__)
 
 
-app = Flask(__name__)
-
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 
 
 
@@ -75,10 +75,7 @@ def create_product(current_user):
     sts_description = "Product added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """INSERT INTO PRODUCTS_BY_PROJECT 
@@ -170,10 +167,7 @@ def update_product(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -297,10 +291,7 @@ def delete_product(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -371,10 +362,7 @@ def get_product_list(current_user):
     product_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query
@@ -463,10 +451,7 @@ def get_product_details(current_user):
     product_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         query = """SELECT PROJECT_ID, PRODUCT_ID, PRODUCT_NAME, PRODUCT_DESCRIPTION, 
@@ -573,10 +558,7 @@ def update_requirement_classification(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -666,6 +648,7 @@ def update_requirement_classification(current_user):
 
 @base_requirements_blueprint.route('/api/get_requirements_list', methods=['GET', 'POST'])
 @token_required
+@conditional_list('requirements')
 def get_requirements_list(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -683,11 +666,26 @@ def get_requirements_list(current_user):
     updated_date_start = data.get('updated_date_start')
     updated_date_end = data.get('updated_date_end')
     include_child_levels_flag = data.get('include_child_levels_flag', False)
+    updated_since = data.get('updated_since')
 
 
 
     logging.info(f"data : {data}")
 
+    if updated_since:
+        try:
+            updated_since = parse_updated_since(updated_since)
+        except ValueError:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'updated_since is not a valid date'
+            })
+        # A delta covers the whole project so a requirement that moved out of the client's filters
+        # is still reported; the client applies its filters locally
+        level_id = search_query = None
+        filter_by_status = requirement_criticality = requirement_priority = []
+        created_date_start = created_date_end = updated_date_start = updated_date_end = None
+
     # if not filter_by_status or not isinstance(filter_by_status, list):
     #     return jsonify({
     #         'status': 'Failed',
@@ -698,14 +696,18 @@ def get_requirements_list(current_user):
     sts_description = "Requirements retrieved successfully"
     requirement_details = {}
     requirement_list = []
+    deleted_records = []
+    sync_watermark = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
+        sync_watermark = get_sync_watermark(cursor)
+        if updated_since:
+            deleted_records = get_deleted_records(cursor, corporate_account, project_id, [FUNCTIONAL_LEVEL],
+                                                  updated_since)
+
         level_condition = ""
         child_levels_list = []
         if level_id and include_child_levels_flag:
@@ -751,6 +753,12 @@ def get_requirements_list(current_user):
 
         params = [corporate_account, project_id]
 
+        if updated_since:
+            delta_condition, delta_params = changed_requirements_condition('A', 'REQUIREMENTS', 'REQ_ID',
+                                                                           corporate_account, project_id, updated_since)
+            mySql_select_query += delta_condition
+            params.extend(delta_params)
+
         if filter_by_status and isinstance(filter_by_status, list) and len(
                     filter_by_status) > 0:
                 placeholders = ','.join(['%s'] * len(filter_by_status))
@@ -975,7 +983,7 @@ def get_requirements_list(current_user):
             }
             requirement_list.append(requirement_details)
 
-        if len(requirement_list) == 0:
+        if len(requirement_list) == 0 and not updated_since:
             sts = "Failed"
             sts_description = "No matching requirements found"
 
@@ -989,8 +997,11 @@ def get_requirements_list(current_user):
             cursor.close()
             connection.close()
 
+    report_list_status(sts)
     return jsonify({
         'requirement_list': requirement_list,
+        'deleted_records': deleted_records,
+        'sync_watermark': sync_watermark,
         'status': sts,
         'status_description': sts_description
     })
@@ -1043,10 +1054,7 @@ def create_product_level_user_setup(current_user):
     sts_description = "Product level user setup added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Check if the user setup already exists
@@ -1139,10 +1147,7 @@ def update_product_level_user_setup(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -1270,10 +1275,7 @@ def delete_product_level_user_setup(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -1347,10 +1349,7 @@ def get_product_level_users_list(current_user):
     user_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query
@@ -1451,10 +1450,7 @@ def get_product_level_user_details(current_user):
     user_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         query = """SELECT P.PROJECT_ID, P.PRODUCT_ID, P.USER_CORPORATE_ACCOUNT, P.USER_ID, P.ACCESS_LEVEL, 
@@ -1529,10 +1525,7 @@ def get_user_level_products_list(current_user):
     product_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query  = """SELECT A.CORPORATE_ACCOUNT, A.PROJECT_ID, A.PRODUCT_ID, A.PRODUCT_NAME, A.PRODUCT_COMPANY, B.ACCESS_LEVEL
@@ -1583,6 +1576,10 @@ def get_user_level_products_list(current_user):
     })
 
 if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.register_blueprint(base_requirements_blueprint)
     app.run(debug=True)
 
 
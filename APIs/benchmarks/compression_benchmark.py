@@ -0,0 +1,64 @@
+"""
+Compression benchmark: size and time of gzip, brotli and zstd at several levels on a
+requirements-list style JSON payload. Brotli and zstd are skipped if not installed.
+
+Run from the APIs folder:
+    python benchmarks/compression_benchmark.py --rows 500 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import available_encodings, compress_bytes
+
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 5, 11], 'zstd': [1, 3, 10]}
+STATUSES = ['Draft', 'In Review', 'Approved', 'Rejected']
+
+
+def make_payload(rows):
+    """Shape of a get_requirements_list response"""
+    random.seed(rows)
+    requirements = [{
+        'req_id': 1000 + i,
+        'req_id_with_prefix': f"REQ-{1000 + i}",
+        'level_id': random.randint(1, 40),
+        'req_description': ' '.join(random.choice(['system', 'shall', 'user', 'report', 'approve', 'invoice',
+                                                   'export', 'within', 'seconds', 'the', 'data', 'ledger'])
+                                    for _ in range(random.randint(10, 60))),
+        'status': random.choice(STATUSES),
+        'req_criticality': random.choice(['High', 'Medium', 'Low']),
+        'req_priority': random.choice(['P1', 'P2', 'P3']),
+        'created_date': '2025-01-15 10:22:31',
+        'updated_date': '2025-03-02 17:05:12'
+    } for i in range(rows)]
+    return json.dumps({'requirements': requirements, 'status': 'Success', 'status_description': ''}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'encoding':>8} {'level':>5} {'bytes':>10} {'ratio':>7} {'ms':>8} {'MB/s':>8}")
+    for rows in args.rows:
+        payload = make_payload(rows)
+        print(f"{rows:>6} {'identity':>8} {'-':>5} {len(payload):>10} {1:>7.2f}")
+        for encoding in available_encodings():
+            for level in LEVELS[encoding]:
+                start_time = time.perf_counter()
+                for _ in range(args.repeat):
+                    compressed = compress_bytes(payload, encoding, level)
+                elapsed = (time.perf_counter() - start_time) / args.repeat
+                print(f"{rows:>6} {encoding:>8} {level:>5} {len(compressed):>10} "
+                      f"{len(payload) / len(compressed):>7.2f} {elapsed * 1000:>8.2f} "
+                      f"{len(payload) / elapsed / (1024 * 1024):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
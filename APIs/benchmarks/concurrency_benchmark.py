@@ -0,0 +1,176 @@
+"""
+Concurrency benchmark: requests that spend their time waiting on the database, served by a
+fixed pool of threads (sync mode) versus coroutines on one event loop sharing a connection pool
+(async mode, asgi_app.py). Each request runs --queries queries of --latency-ms each, while
+--streams idle /api/events streams stay open: a thread each in sync mode, a coroutine in async mode.
+
+By default the waits are simulated with sleeps. With --mysql they are real SELECT SLEEP(...)
+queries against the default shard, over mysql.connector and aiomysql.
+
+Run from the APIs folder:
+    python benchmarks/concurrency_benchmark.py --concurrency 10 100 1000 --streams 0 24
+    python benchmarks/concurrency_benchmark.py --mysql --concurrency 10 50 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(label, concurrency, started, latencies):
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8} {concurrency:>6} {len(latencies) / elapsed:>10.0f} req/s "
+          f"{percentile(latencies, 0.5) * 1000:>9.0f} ms p50 {percentile(latencies, 0.95) * 1000:>9.0f} ms p95")
+
+
+def run_sync(args, concurrency, streams, query):
+    """Clients queue on the server's threads; a request's latency includes that wait"""
+    if streams >= args.threads:
+        print(f"{'sync':<8} {concurrency:>6} no thread left for requests")
+        return
+
+    def handle(arrived):
+        for _ in range(args.queries):
+            query()
+        return time.perf_counter() - arrived
+
+    closed = threading.Event()
+    with ThreadPoolExecutor(max_workers=args.threads) as server:
+        for _ in range(streams):
+            server.submit(closed.wait)
+        started = time.perf_counter()
+        latencies = []
+        for batch_start in range(0, args.requests, concurrency):
+            batch = min(concurrency, args.requests - batch_start)
+            arrived = time.perf_counter()
+            latencies.extend(server.map(handle, [arrived] * batch))
+        report('sync', concurrency, started, latencies)
+        closed.set()
+
+
+def run_async(args, concurrency, streams, open_query):
+    """Every request is a coroutine; only the connection pool limits concurrent queries"""
+    async def bench():
+        query = await open_query()
+        closed = asyncio.Event()
+        open_streams = [asyncio.ensure_future(closed.wait()) for _ in range(streams)]
+
+        async def handle(arrived):
+            for _ in range(args.queries):
+                await query()
+            return time.perf_counter() - arrived
+
+        started = time.perf_counter()
+        latencies = []
+        for batch_start in range(0, args.requests, concurrency):
+            batch = min(concurrency, args.requests - batch_start)
+            arrived = time.perf_counter()
+            latencies.extend(await asyncio.gather(*(handle(arrived) for _ in range(batch))))
+        report('async', concurrency, started, latencies)
+        closed.set()
+        await asyncio.gather(*open_streams)
+        await query.close()
+
+    asyncio.run(bench())
+
+
+class SimulatedPool:
+    """Sleeps for the query latency while holding one of pool_size slots"""
+
+    def __init__(self, pool_size, latency):
+        self._slots = asyncio.Semaphore(pool_size)
+        self._latency = latency
+
+    async def __call__(self):
+        async with self._slots:
+            await asyncio.sleep(self._latency)
+
+    async def close(self):
+        pass
+
+
+class MySQLPool:
+    def __init__(self, pool, latency):
+        self._pool = pool
+        self._latency = latency
+
+    async def __call__(self):
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT SLEEP(%s)", (self._latency,))
+                await cursor.fetchone()
+
+    async def close(self):
+        self._pool.close()
+        await self._pool.wait_closed()
+
+
+def mysql_queries(args, latency):
+    import aiomysql
+    import mysql.connector
+
+    from db_routing import DEFAULT_SHARD, resolve_shard
+
+    settings = resolve_shard(shard_name=DEFAULT_SHARD).settings
+
+    def sync_query():
+        # One connection per call, as each sync request opens its own
+        conn = mysql.connector.connect(**settings)
+        cursor = conn.cursor()
+        cursor.execute("SELECT SLEEP(%s)", (latency,))
+        cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+    async def open_async_query():
+        pool = await aiomysql.create_pool(host=settings['host'], port=settings.get('port', 3306),
+                                          user=settings['user'], password=settings['password'],
+                                          db=settings['database'], minsize=1, maxsize=args.pool_size)
+        return MySQLPool(pool, latency)
+
+    return sync_query, open_async_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=3, help='queries per request')
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--streams', type=int, nargs='+', default=[0], help='idle event streams held open')
+    parser.add_argument('--threads', type=int, default=32, help='sync server threads')
+    parser.add_argument('--pool-size', type=int, default=20, help='async connection pool size')
+    parser.add_argument('--mysql', action='store_true', help='run SELECT SLEEP against the default shard')
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    if args.mysql:
+        sync_query, open_async_query = mysql_queries(args, latency)
+    else:
+        def sync_query():
+            time.sleep(latency)
+
+        async def open_async_query():
+            return SimulatedPool(args.pool_size, latency)
+
+    print(f"{args.requests} requests x {args.queries} queries x {args.latency_ms:g} ms, "
+          f"{args.threads} threads vs pool of {args.pool_size}, {'MySQL' if args.mysql else 'simulated'}")
+    for streams in args.streams:
+        print(f"-- {streams} open event streams")
+        for concurrency in args.concurrency:
+            run_sync(args, concurrency, streams, sync_query)
+            run_async(args, concurrency, streams, open_async_query)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Import-time budget: runs `python -X importtime` on a fresh interpreter that builds the app with
+app_factory.create_app(), prints the slowest imports, and exits with status 1 when the total goes
+over --budget-ms or when a module that should load on first use (argon2, smtplib, boto3, ...) is
+imported at startup. Meant for CI, so cold-start regressions show up on the commit that causes them.
+
+Run from the APIs folder:
+    python benchmarks/import_budget.py --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_CODE = "from app_factory import create_app; create_app()"
+
+# Modules that are loaded when first needed, never while the app starts
+DEFERRED_MODULES = ['argon2', 'smtplib', 'email.mime.multipart', 'boto3']
+
+
+def measure():
+    """{module: (self us, cumulative us, nesting depth)} for one cold start"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+                            cwd=APP_FOLDER, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"create_app() failed:\n{result.stderr}")
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports[module] = (int(self_us), int(cumulative_us), depth)
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--runs', type=int, default=3, help='the fastest run is reported')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = [sum(cumulative for _, cumulative, depth in imports.values() if depth == 0) for imports in runs]
+    imports, total_us = min(zip(runs, totals), key=lambda run: run[1])
+
+    print(f"{'module':<40} {'self ms':>9} {'cumulative ms':>14}")
+    slowest = sorted(imports.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for module, (self_us, cumulative_us, depth) in slowest:
+        print(f"{'  ' * depth + module:<40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>14.1f}")
+    print(f"{'total':<40} {'':>9} {total_us / 1000:>14.1f}   (budget {args.budget_ms:g} ms)")
+
+    failures = []
+    if total_us / 1000 > args.budget_ms:
+        failures.append(f"startup imports take {total_us / 1000:.0f} ms, over the {args.budget_ms:g} ms budget")
+    for module in DEFERRED_MODULES:
+        if module in imports:
+            failures.append(f"{module} is imported at startup")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
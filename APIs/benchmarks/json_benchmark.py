@@ -0,0 +1,85 @@
+"""
+JSON benchmark: serialising a 50k-row requirement list (with datetime and Decimal values)
+through Flask's stdlib-based encoding versus json_provider.dumps_bytes, plus decoding.
+
+Run from the APIs folder:
+    python benchmarks/json_benchmark.py --rows 50000
+"""
+import argparse
+import decimal
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.http import http_date as werkzeug_http_date
+
+import json_provider
+from json_provider import dumps_bytes, json_default
+
+
+def make_requirements(rows):
+    random.seed(rows)
+    base_date = datetime(2025, 1, 1, 9, 0, 0)
+    return {
+        'requirements': [{
+            'req_id': 1000 + i,
+            'req_id_with_prefix': f"REQ-{1000 + i}",
+            'level_id': random.randint(1, 40),
+            'req_description': f"The system shall process record {i} within {random.randint(1, 9)} seconds",
+            'status': random.choice(['Draft', 'In Review', 'Approved']),
+            'req_criticality': random.choice(['High', 'Medium', 'Low']),
+            'estimate_hours': decimal.Decimal(random.randint(1, 4000)) / 10,
+            'created_date': base_date + timedelta(minutes=i),
+            'updated_date': base_date + timedelta(minutes=i, seconds=30)
+        } for i in range(rows)],
+        'status': 'Success',
+        'status_description': 'Requirements retrieved successfully'
+    }
+
+
+def flask_default(o):
+    """Flask's own default hook: werkzeug's http_date for dates"""
+    if isinstance(o, (datetime, date)):
+        return werkzeug_http_date(o)
+    return json_default(o)
+
+
+def stdlib_dumps(obj):
+    """What Flask's DefaultJSONProvider does for jsonify"""
+    return json.dumps(obj, default=flask_default, sort_keys=True, ensure_ascii=True).encode('utf-8')
+
+
+def timed(label, repeat, func):
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start_time) / repeat
+    print(f"{label:<28} {elapsed * 1000:>9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    payload = make_requirements(args.rows)
+    print(f"{args.rows} rows, fast encoder: {'orjson' if json_provider.orjson else 'stdlib fallback'}")
+
+    encoded = timed('stdlib dumps', args.repeat, lambda: stdlib_dumps(payload))
+    fast_encoded = timed('json_provider dumps', args.repeat, lambda: dumps_bytes(payload))
+    print(f"{'sizes (bytes)':<28} {len(encoded)} / {len(fast_encoded)}")
+
+    timed('stdlib loads', args.repeat, lambda: json.loads(encoded))
+    if json_provider.orjson:
+        timed('orjson loads', args.repeat, lambda: json_provider.orjson.loads(encoded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Upload benchmark: a multipart request body parsed the way the endpoints used to handle it
+(werkzeug's default spooling, then the size check on the stored copy) against UploadRequest's
+path (each file part written straight into an UploadSpool, with the endpoint's limits enforced
+while the body is read). For every upload size it reports time, throughput, peak Python memory
+and how much of the request body was read before the upload was stored or rejected, with a
+declared Content-Length and with a chunked body that has none.
+
+Run from the APIs folder:
+    python benchmarks/upload_benchmark.py --sizes 1 10 50 --limit 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import default_stream_factory, parse_form_data
+
+import attachment_store
+from attachment_store import FORM_OVERHEAD, UploadSpool, UploadTooLarge, discard_temp, stream_to_temp
+
+MB = 1024 * 1024
+BOUNDARY = 'benchmarkboundary'
+
+
+class CountingStream:
+    """The request body, counting how many bytes the parser pulls from it"""
+
+    def __init__(self, file):
+        self._file = file
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self._file.readline(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def make_body(size_mb):
+    """A multipart/form-data body with one text field and one file of size_mb, on disk"""
+    body = tempfile.TemporaryFile()
+    body.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="req_id"\r\n\r\n1001\r\n'.encode())
+    body.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files[]"; filename="bench.bin"\r\n'
+               f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+    block = os.urandom(MB)
+    for _ in range(size_mb):
+        body.write(block)
+    body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+    return body
+
+
+def environ_for(body, chunked):
+    body.seek(0, os.SEEK_END)
+    length = body.tell()
+    body.seek(0)
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+        'wsgi.input': CountingStream(body),
+    }
+    if chunked:
+        environ['wsgi.input_terminated'] = True
+    else:
+        environ['CONTENT_LENGTH'] = str(length)
+    return environ
+
+
+def buffered_upload(environ, limit):
+    """Before: werkzeug spools the whole part, then it is copied out and checked"""
+    _, _, files = parse_form_data(environ, stream_factory=default_stream_factory)
+    temp_path = None
+    try:
+        _, _, temp_path = stream_to_temp(files['files[]'], limit)
+        return 'stored'
+    except UploadTooLarge:
+        return 'rejected'
+    finally:
+        discard_temp(temp_path)
+        files['files[]'].close()
+
+
+def spooled_upload(environ, limit):
+    """Now: the part lands in an UploadSpool; the limits stop the parser as they are crossed"""
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        return UploadSpool(limit)
+
+    try:
+        _, _, files = parse_form_data(environ, stream_factory=stream_factory,
+                                      max_content_length=limit + FORM_OVERHEAD)
+    except RequestEntityTooLarge:
+        return 'rejected'
+    try:
+        stream_to_temp(files['files[]'], limit)
+        return 'stored'
+    finally:
+        files['files[]'].close()
+
+
+def measure(label, size_mb, environ, upload):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    outcome = upload()
+    elapsed = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    body_read = environ['wsgi.input'].bytes_read / MB
+    throughput = body_read / elapsed if elapsed else float('inf')
+    print(f"{label:<20} {size_mb:>6} MB {elapsed * 1000:>10.1f} ms {throughput:>10.1f} MB/s "
+          f"{peak / MB:>8.2f} MB peak {body_read:>8.1f} MB read  {outcome}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help='upload sizes in MB')
+    parser.add_argument('--limit', type=int, default=10, help='per-file limit in MB')
+    parser.add_argument('--folder', help='attachments folder to use instead of config.ATTACHMENTS_FOLDER_PATH')
+    args = parser.parse_args()
+
+    if args.folder:
+        attachment_store.UPLOAD_FOLDER = args.folder
+        os.makedirs(os.path.join(args.folder, attachment_store.BLOB_TMP_FOLDER), exist_ok=True)
+
+    limit = args.limit * MB
+    print(f"per-file limit {args.limit} MB")
+    for size_mb in args.sizes:
+        with make_body(size_mb) as body:
+            for chunked in (False, True):
+                suffix = ', chunked' if chunked else ''
+                environ = environ_for(body, chunked)
+                measure(f'buffered{suffix}', size_mb, environ, lambda: buffered_upload(environ, limit))
+                environ = environ_for(body, chunked)
+                measure(f'spooled{suffix}', size_mb, environ, lambda: spooled_upload(environ, limit))
+
+
+if __name__ == '__main__':
+    main()
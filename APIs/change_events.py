@@ -0,0 +1,491 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from functools import wraps
+
+import mysql.connector
+from flask import Blueprint, Response, g, jsonify, request
+
+import config
+from db_routing import DEFAULT_SHARD, get_connection, get_read_connection, shard_for, shard_names
+from foundational_v2 import get_user_api_access_level
+from utils import STREAM_TOKEN_SECONDS, issue_stream_token, stream_token_required, token_required
+
+# Per-project change feed. Write endpoints append a row to CHANGE_EVENTS in the same transaction
+# as the change itself, so an event exists exactly when the change does; /api/events streams those
+# rows to browsers as Server-Sent Events so a tab refetches only the lists that changed instead of
+# polling them all. One dispatcher thread per process polls the table and fans new events out to
+# the streams open in that process.
+#
+# CHANGE_EVENTS lives on every shard (migrate_schema.py creates it), next to the data it describes,
+# and the dispatcher polls them all. Event ids are per shard: events from a tenant shard are sent
+# with ids of the form <shard>:<id>. A client resuming with an id from another shard (the account
+# has moved since) is told to refetch everything.
+#
+# In sync mode an open stream holds a worker thread, so each process serves at most
+# MAX_STREAMS_PER_PROCESS of them (more get 503 with Retry-After) and every stream ends after
+# MAX_STREAM_SECONDS. Before ending it sends a "reconnect" event: the page asks
+# /api/get_events_token for a new stream token and opens the stream again with last_event_id, so
+# nothing is missed. EventSource URLs carry that short-lived stream token, not the session token.
+
+change_events_blueprint = Blueprint('change_events', __name__)
+
+POLL_SECONDS = getattr(config, 'CHANGE_EVENTS_POLL_SECONDS', 1)
+RETENTION_DAYS = getattr(config, 'CHANGE_EVENTS_RETENTION_DAYS', 7)
+HEARTBEAT_SECONDS = 15  # Comment line that keeps proxies from closing an idle stream
+RETRY_MILLISECONDS = 3000  # Reconnect delay suggested to the browser
+MAX_REPLAY = 1000  # A client further behind than this is told to refetch everything
+SUBSCRIBER_QUEUE_SIZE = 1000
+PRUNE_INTERVAL_SECONDS = 60 * 60
+
+# Streams one process serves at once; keep it below the worker's thread count (gunicorn.conf.py)
+MAX_STREAMS_PER_PROCESS = getattr(config, 'CHANGE_EVENTS_MAX_STREAMS', 2)
+MAX_STREAM_SECONDS = getattr(config, 'CHANGE_EVENTS_MAX_STREAM_SECONDS', 5 * 60)
+STREAM_RETRY_AFTER_SECONDS = 10
+
+# Events from transactions that commit out of EVENT_ID order are picked up by re-reading this
+# recent window on every poll
+LATE_COMMIT_WINDOW_SECONDS = 10
+
+# Event actions
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+CHANGE_EVENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS CHANGE_EVENTS (
+        EVENT_ID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        CORPORATE_ACCOUNT VARCHAR(100) NOT NULL,
+        PROJECT_ID VARCHAR(100),
+        ENTITY VARCHAR(100) NOT NULL,
+        ACTION VARCHAR(20) NOT NULL,
+        RECORD_IDS TEXT,
+        USER_ID VARCHAR(100),
+        CREATED_DATE DATETIME NOT NULL,
+        INDEX IDX_CHANGE_EVENTS_PROJECT (CORPORATE_ACCOUNT, PROJECT_ID, EVENT_ID),
+        INDEX IDX_CHANGE_EVENTS_CREATED (CREATED_DATE)
+    )
+"""
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS_PER_PROCESS)
+
+
+def record_change_event(cursor, corporate_account, project_id, entity, action, record_ids, user_id):
+    """
+    Append a change event inside the caller's transaction, on the cursor that makes the change,
+    and return its EVENT_ID. Call wake_change_dispatcher() once the transaction has committed.
+    """
+    cursor.execute("""
+        INSERT INTO CHANGE_EVENTS (CORPORATE_ACCOUNT, PROJECT_ID, ENTITY, ACTION, RECORD_IDS, USER_ID, CREATED_DATE)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (corporate_account, project_id, entity, action, json.dumps(record_ids, default=str), user_id,
+          datetime.now()))
+    return cursor.lastrowid
+
+
+def _record_ids(request_data, extra_ids):
+    """The *_id / *_ids fields of the request plus extra_ids, which identify what was changed"""
+    record_ids = {}
+    for source in (request_data, extra_ids):
+        for key, value in source.items():
+            if key in ('corporate_account', 'project_id') or value in (None, '', []):
+                continue
+            if key.endswith('_id') or key.endswith('_ids'):
+                record_ids[key] = value
+    return record_ids
+
+
+def publishes_change(entity, action):
+    """
+    Decorator for write endpoints (below @validate_access) declaring the change they make. The
+    handler records it with record_change() on its own cursor just before it commits; the
+    dispatcher is woken once the handler has returned.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.change_event = (entity, action)
+            g.change_recorded = False
+            try:
+                return f(*args, **kwargs)
+            finally:
+                if g.change_recorded:
+                    wake_change_dispatcher()
+
+        return decorated
+
+    return decorator
+
+
+def record_change(cursor, **record_ids):
+    """
+    Record the change declared by the endpoint's @publishes_change on the handler's cursor, before
+    its commit, so the event commits or rolls back with the change. The event names the request's
+    *_id fields plus record_ids, e.g. the id of a record the handler has just created.
+    """
+    entity, action = g.change_event
+    request_data = request.get_json(silent=True) or {}
+    # Copy endpoints name the changed project to_project_id
+    project_id = request_data.get('project_id') or request_data.get('to_project_id')
+    record_change_event(cursor, request_data.get('corporate_account'), project_id, entity, action,
+                        _record_ids(request_data, record_ids), g.current_user['user_id'])
+    g.change_recorded = True
+
+
+def format_event_id(shard, event_id):
+    return event_id if shard == DEFAULT_SHARD else f"{shard}:{event_id}"
+
+
+def parse_event_id(value):
+    """(shard, EVENT_ID) from an id sent by format_event_id; ValueError for anything else"""
+    shard, _, event_id = str(value).rpartition(':')
+    return shard or DEFAULT_SHARD, int(event_id)
+
+
+def _event_from_row(row, shard):
+    event_id, entity, action, record_ids, user_id, created_date = row
+    return {
+        'event_id': format_event_id(shard, event_id),
+        'entity': entity,
+        'action': action,
+        'record_ids': json.loads(record_ids) if record_ids else {},
+        'user_id': user_id,
+        'created_date': created_date.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+class Subscriber:
+    """One open event stream"""
+
+    def __init__(self, corporate_account, project_id):
+        self.key = (corporate_account, project_id)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # The stream fell too far behind; it tells the client to refetch everything
+            self.overflowed = True
+
+
+class ChangeEventDispatcher(threading.Thread):
+    """Polls CHANGE_EVENTS and hands new events to the subscribers of their project"""
+
+    def __init__(self):
+        super().__init__(name='change-event-dispatcher', daemon=True)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_event_ids = {}  # Per shard
+        self._recent_ids = deque(maxlen=5000)
+        self._recent_id_set = set()
+        self._next_prune = 0.0
+
+    def subscribe(self, corporate_account, project_id):
+        return self.add_subscriber(Subscriber(corporate_account, project_id))
+
+    def add_subscriber(self, subscriber):
+        with self._lock:
+            self._subscribers.setdefault(subscriber.key, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.key)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.key]
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            try:
+                self._poll()
+                if time.time() >= self._next_prune:
+                    self._next_prune = time.time() + PRUNE_INTERVAL_SECONDS
+                    prune_change_events()
+            except Exception as e:
+                logging.error(f"Change event dispatcher error: {str(e)}")
+                time.sleep(POLL_SECONDS)
+
+    def _remember(self, key):
+        if len(self._recent_ids) == self._recent_ids.maxlen:
+            self._recent_id_set.discard(self._recent_ids[0])
+        self._recent_ids.append(key)
+        self._recent_id_set.add(key)
+
+    def _poll(self):
+        for shard in shard_names():
+            try:
+                self._poll_shard(shard)
+            except mysql.connector.Error as e:
+                logging.error(f"Unable to poll change events on the {shard} shard: {str(e)}")
+
+    def _poll_shard(self, shard):
+        connection = get_read_connection(stale_ok=False, shard=shard)
+        try:
+            cursor = connection.cursor()
+
+            last_event_id = self._last_event_ids.get(shard)
+            if last_event_id is None:
+                # Streams start from "now"; older events are only sent on an explicit resume
+                cursor.execute("SELECT COALESCE(MAX(EVENT_ID), 0) FROM CHANGE_EVENTS")
+                self._last_event_ids[shard] = cursor.fetchone()[0]
+                cursor.close()
+                return
+
+            cursor.execute("""
+                SELECT EVENT_ID, CORPORATE_ACCOUNT, PROJECT_ID, ENTITY, ACTION, RECORD_IDS, USER_ID, CREATED_DATE
+                FROM CHANGE_EVENTS
+                WHERE EVENT_ID > %s OR CREATED_DATE >= %s
+                ORDER BY EVENT_ID
+            """, (last_event_id, datetime.now() - timedelta(seconds=LATE_COMMIT_WINDOW_SECONDS)))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        for row in rows:
+            event_id, corporate_account, project_id = row[0], row[1], row[2]
+            if (shard, event_id) in self._recent_id_set:
+                continue
+            self._remember((shard, event_id))
+            self._last_event_ids[shard] = max(self._last_event_ids[shard], event_id)
+
+            event = _event_from_row((event_id,) + tuple(row[3:]), shard)
+            with self._lock:
+                subscribers = list(self._subscribers.get((corporate_account, project_id), ()))
+            for subscriber in subscribers:
+                subscriber.deliver(event)
+
+
+def get_change_dispatcher():
+    """This process's dispatcher thread, started on first use"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = ChangeEventDispatcher()
+            _dispatcher.start()
+        return _dispatcher
+
+
+def wake_change_dispatcher():
+    if _dispatcher is not None:
+        _dispatcher.wake()
+
+
+def prune_change_events():
+    """Delete events older than RETENTION_DAYS on every shard, in small batches"""
+    cutoff = datetime.now() - timedelta(days=RETENTION_DAYS)
+    for shard in shard_names():
+        connection = get_connection(shard=shard)
+        try:
+            cursor = connection.cursor()
+            while True:
+                cursor.execute("DELETE FROM CHANGE_EVENTS WHERE CREATED_DATE < %s LIMIT 5000", (cutoff,))
+                connection.commit()
+                if cursor.rowcount < 5000:
+                    break
+            cursor.close()
+        finally:
+            connection.close()
+
+
+OLDEST_EVENT_QUERY = "SELECT MIN(EVENT_ID) FROM CHANGE_EVENTS"
+
+EVENTS_AFTER_QUERY = """
+    SELECT EVENT_ID, ENTITY, ACTION, RECORD_IDS, USER_ID, CREATED_DATE FROM CHANGE_EVENTS
+    WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND EVENT_ID > %s
+    ORDER BY EVENT_ID LIMIT %s
+"""
+
+
+def can_replay(oldest_event_id, last_event_id):
+    """False once events after last_event_id have been pruned"""
+    return oldest_event_id is None or last_event_id >= oldest_event_id - 1
+
+
+def events_to_replay(rows, shard):
+    """Events from EVENTS_AFTER_QUERY rows, or None if the client missed too many of them"""
+    if len(rows) > MAX_REPLAY:
+        return None
+    return [_event_from_row(row, shard) for row in rows]
+
+
+def _load_events_after(corporate_account, project_id, last_event_id):
+    """
+    Events of the project after last_event_id (shard, EVENT_ID), or None if the client has to
+    refetch everything because too many were missed, they have already been pruned, or the id is
+    from a shard the account no longer lives on
+    """
+    last_shard, last_event_id = last_event_id
+    shard = shard_for(corporate_account)
+    if last_shard != shard:
+        return None
+
+    connection = get_read_connection(stale_ok=False, corporate_account=corporate_account)
+    try:
+        cursor = connection.cursor()
+
+        cursor.execute(OLDEST_EVENT_QUERY)
+        if not can_replay(cursor.fetchone()[0], last_event_id):
+            cursor.close()
+            return None
+
+        cursor.execute(EVENTS_AFTER_QUERY, (corporate_account, project_id, last_event_id, MAX_REPLAY + 1))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    return events_to_replay(rows, shard)
+
+
+def format_event(event):
+    data = json.dumps({key: value for key, value in event.items() if key != 'event_id'}, separators=(',', ':'))
+    return f"id: {event['event_id']}\nevent: change\ndata: {data}\n\n"
+
+
+def format_reset():
+    # No id line, so the client's Last-Event-ID stays where it was
+    return "event: reset\ndata: {}\n\n"
+
+
+def format_reconnect():
+    # Sent before the server ends a stream that reached MAX_STREAM_SECONDS
+    return "event: reconnect\ndata: {}\n\n"
+
+
+def _event_stream(corporate_account, project_id, last_event_id):
+    dispatcher = get_change_dispatcher()
+    # Subscribe before replaying so nothing committed in between is lost. This happens inside the
+    # generator so that a stream which never starts leaves no subscriber behind.
+    subscriber = dispatcher.subscribe(corporate_account, project_id)
+    sent_ids = set()
+    ends_at = time.monotonic() + MAX_STREAM_SECONDS
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+
+        if last_event_id is not None:
+            missed_events = _load_events_after(corporate_account, project_id, last_event_id)
+            if missed_events is None:
+                yield format_reset()
+            else:
+                for event in missed_events:
+                    sent_ids.add(event['event_id'])
+                    yield format_event(event)
+
+        while True:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                yield format_reconnect()
+                return
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                yield format_reset()
+            try:
+                event = subscriber.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if event['event_id'] in sent_ids:
+                # Already sent while replaying
+                continue
+            yield format_event(event)
+
+    finally:
+        dispatcher.unsubscribe(subscriber)
+
+
+@change_events_blueprint.route('/api/events', methods=['GET'])
+@stream_token_required
+def stream_change_events(current_user):
+    corporate_account = request.args.get('corporate_account')
+    project_id = request.args.get('project_id')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    if not corporate_account or not project_id:
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'corporate_account and project_id are required'
+        }), 400
+
+    if last_event_id is not None:
+        try:
+            last_event_id = parse_event_id(last_event_id)
+        except ValueError:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'Last-Event-ID must be an event id'
+            }), 400
+
+    # Any user of the project may follow its changes
+    _, _, sts, _ = get_user_api_access_level(current_user['user_id'], corporate_account, project_id, None)
+    if sts != 'Success':
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'Access denied',
+            'error_type': 'INSUFFICIENT_ACCESS'
+        }), 403
+
+    if not _stream_slots.acquire(blocking=False):
+        logging.warning(f"Refused an event stream for project {project_id}: "
+                        f"{MAX_STREAMS_PER_PROCESS} streams already open in this process")
+        response = jsonify({
+            'status': 'Failed',
+            'status_description': 'Too many event streams are open. Please try again shortly.',
+            'error_type': 'SERVER_BUSY'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER_SECONDS)
+        return response
+
+    response = Response(_event_stream(corporate_account, project_id, last_event_id), mimetype='text/event-stream')
+    # The server closes the response however the stream ended, even one that never started
+    response.call_on_close(_stream_slots.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+@change_events_blueprint.route('/api/get_events_token', methods=['POST'])
+@token_required
+def get_events_token(current_user):
+    """Stream token for /api/events?stream_token=..., valid for STREAM_TOKEN_SECONDS"""
+    data = request.get_json(silent=True) or {}
+    corporate_account = data.get('corporate_account')
+    project_id = data.get('project_id')
+
+    if not corporate_account or not project_id:
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'corporate_account and project_id are required'
+        }), 400
+
+    _, _, sts, _ = get_user_api_access_level(current_user['user_id'], corporate_account, project_id, None)
+    if sts != 'Success':
+        return jsonify({
+            'status': 'Failed',
+            'status_description': 'Access denied',
+            'error_type': 'INSUFFICIENT_ACCESS'
+        }), 403
+
+    return jsonify({
+        'stream_token': issue_stream_token(current_user['user_id'], corporate_account, project_id),
+        'expires_in': STREAM_TOKEN_SECONDS,
+        'status': 'Success',
+        'status_description': 'Stream token issued'
+    })
@@ -0,0 +1,134 @@
+import gzip
+import logging
+import zlib
+
+from flask import request
+
+import config
+
+# Negotiated response compression. gzip is always available; brotli ('br') and zstandard
+# ('zstd') are used when their packages are installed. Small bodies, already-compressed
+# content types, partial and streamed-event responses are sent as they are.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = getattr(config, 'COMPRESSION_MIN_SIZE', 1024)
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 5, 'gzip': 6}
+COMPRESSION_LEVELS.update(getattr(config, 'COMPRESSION_LEVELS', {}))
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'text/xml',
+}
+
+
+def available_encodings():
+    """Encodings this process can produce, in server preference order"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def compress_bytes(data, encoding, level=None):
+    """Compress a whole body in one call"""
+    level = COMPRESSION_LEVELS[encoding] if level is None else level
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level=None):
+    """Compress an iterable of chunks, flushing after each so streamed output is not held back"""
+    level = COMPRESSION_LEVELS[encoding] if level is None else level
+
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def _should_compress(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    if response.direct_passthrough:
+        # send_file responses; attachments are served as stored
+        return False
+    if not response.is_streamed and response.content_length is not None \
+            and response.content_length < COMPRESSION_MIN_SIZE:
+        return False
+    return True
+
+
+def compress_response(response):
+    """after_request hook that compresses the response for the client's Accept-Encoding"""
+    try:
+        if not _should_compress(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if not encoding:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < COMPRESSION_MIN_SIZE:
+                return response
+            response.set_data(compress_bytes(data, encoding))
+
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag names the identity bytes; the compressed variant only matches weakly
+        etag, is_weak = response.get_etag()
+        if etag and not is_weak:
+            response.set_etag(etag, weak=True)
+
+    except Exception as e:
+        logging.error(f"Response compression failed, sending uncompressed: {e}")
+
+    return response
+
+
+def init_compression(app):
+    """Register response compression on the Flask app"""
+    app.after_request(compress_response)
+    logging.info(f"Response compression enabled: {', '.join(available_encodings())}")
@@ -1,6 +1,7 @@
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import logging
+import time
 from dataclasses import dataclass
 
 # Configure logging
@@ -8,6 +9,10 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Rows copied per chunk; each chunk of a keyed table is committed on its own
+COPY_CHUNK_SIZE = 5000
+
+
 @dataclass
 class CopyResult:
     """Result of copying operation for a single table"""
@@ -15,19 +20,26 @@ class CopyResult:
     records_copied: int
     success: bool
     error_message: Optional[str] = None
+    elapsed_ms: float = 0.0
+    chunks: int = 0
 
 
 class ProjectRecordsCopier:
     """API class for copying records between projects"""
 
-    def __init__(self, db_connection):
+    # table name -> (column names, primary key column names); table layouts do not change at runtime
+    _table_metadata_cache: Dict[str, Tuple[List[str], List[str]]] = {}
+
+    def __init__(self, db_connection, chunk_size: int = COPY_CHUNK_SIZE):
         """
         Initialize with database connection
 
         Args:
             db_connection: Your database connection object (e.g., SQLAlchemy session, psycopg2 connection, etc.)
+            chunk_size: Maximum number of rows moved by one INSERT ... SELECT statement
         """
         self.db_connection = db_connection
+        self.chunk_size = chunk_size
         self.default_tables = [
             'ACCOUNT_STATUSES',
             'USER_PROJECTS',
@@ -45,6 +57,10 @@ class ProjectRecordsCopier:
         """
         Copy records from one project to another across specified tables
 
+        Each chunk of each table is committed on its own, so locks are held for one chunk at a time.
+        Rows whose key already exists in the target project are skipped, so a copy that failed part
+        way can be run again and carries on where it left off.
+
         Args:
             corporate_account: The corporate account identifier
             copy_from_project_id: Source project ID to copy from
@@ -80,45 +96,33 @@ class ProjectRecordsCopier:
 
         logger.info(f"Starting copy operation from project {copy_from_project_id} to {copy_to_project_id}")
 
-        try:
-            # Begin transaction
-            self.db_connection.begin()
-
-            for table_name in tables_to_process:
-                try:
-                    result = self._copy_table_records(
-                        table_name,
-                        corporate_account,
-                        copy_from_project_id,
-                        copy_to_project_id
-                    )
-                    results.append(result)
-
-                    if result.success:
-                        total_records_copied += result.records_copied
-                        logger.info(f"Successfully copied {result.records_copied} records from {table_name}")
-                    else:
-                        failed_tables.append(table_name)
-                        logger.error(f"Failed to copy records from {table_name}: {result.error_message}")
-
-                except Exception as e:
-                    error_msg = f"Error copying table {table_name}: {str(e)}"
-                    logger.error(error_msg)
-                    results.append(CopyResult(table_name, 0, False, error_msg))
+        for table_name in tables_to_process:
+            try:
+                result = self._copy_table_records(
+                    table_name,
+                    corporate_account,
+                    copy_from_project_id,
+                    copy_to_project_id
+                )
+                results.append(result)
+
+                if result.success:
+                    total_records_copied += result.records_copied
+                    logger.info(f"Successfully copied {result.records_copied} records from {table_name} "
+                                f"in {result.elapsed_ms:.1f} ms ({result.chunks} chunks)")
+                else:
                     failed_tables.append(table_name)
+                    logger.error(f"Failed to copy records from {table_name}: {result.error_message}")
 
-            # Commit transaction if no failures, otherwise rollback
-            if not failed_tables:
-                self.db_connection.commit()
-                logger.info("All tables copied successfully. Transaction committed.")
-            else:
-                self.db_connection.rollback()
-                logger.warning(f"Some tables failed to copy: {failed_tables}. Transaction rolled back.")
+            except Exception as e:
+                error_msg = f"Error copying table {table_name}: {str(e)}"
+                logger.error(error_msg)
+                results.append(CopyResult(table_name, 0, False, error_msg))
+                failed_tables.append(table_name)
 
-        except Exception as e:
-            self.db_connection.rollback()
-            logger.error(f"Transaction failed: {str(e)}")
-            raise
+        if failed_tables:
+            logger.warning(f"Some tables failed to copy: {failed_tables}. The chunks already copied are kept; "
+                           f"running the copy again resumes it.")
 
         return {
             'success': len(failed_tables) == 0,
@@ -131,7 +135,8 @@ class ProjectRecordsCopier:
                 'copy_to_project_id': copy_to_project_id,
                 'tables_processed': len(tables_to_process),
                 'tables_succeeded': len(tables_to_process) - len(failed_tables),
-                'tables_failed': len(failed_tables)
+                'tables_failed': len(failed_tables),
+                'elapsed_ms': round(sum(r.elapsed_ms for r in results), 1)
             }
         }
 
@@ -149,83 +154,168 @@ class ProjectRecordsCopier:
         Returns:
             CopyResult object with operation details
         """
+        start_time = time.perf_counter()
+        chunks = 0
+        records_copied = 0
         try:
             # Get table columns to build dynamic query
-            columns_info = self._get_table_columns(table_name)
+            columns_info, key_columns = self._get_table_metadata(table_name)
 
             if not columns_info:
                 return CopyResult(table_name, 0, False, "Could not retrieve table schema")
 
-            # Build SELECT query for source records
+            # Build SELECT list for source records; the rows are copied inside the database and never fetched
             select_columns = []
+            select_params = []
             for column in columns_info:
                 if column.lower() == 'project_id':
-                    select_columns.append(f"'{copy_to_project_id}' as project_id")
+                    select_columns.append(f"%s as {column}")
+                    select_params.append(copy_to_project_id)
                 elif column.lower() in ['created_date', 'updated_date']:
                     select_columns.append(f"CURRENT_TIMESTAMP as {column}")
                 else:
                     select_columns.append(column)
 
-            select_query = f"""
+            insert_select_query = f"""
+                INSERT INTO {table_name} ({', '.join(columns_info)})
                 SELECT {', '.join(select_columns)}
-                FROM {table_name}
+                FROM {table_name} source_rows
                 WHERE corporate_account = %s 
                 AND project_id = %s
             """
+            source_params = [corporate_account, copy_from_project_id]
 
-            # Execute SELECT to get records to copy
             cursor = self.db_connection.cursor()
-            cursor.execute(select_query, (corporate_account, copy_from_project_id))
-            records_to_copy = cursor.fetchall()
 
-            if not records_to_copy:
-                return CopyResult(table_name, 0, True, "No records found to copy")
-
-            # Build INSERT query
-            column_placeholders = ', '.join(['%s'] * len(columns_info))
-            insert_query = f"""
-                INSERT INTO {table_name} ({', '.join(columns_info)})
-                VALUES ({column_placeholders})
+            # Tables without a key to page on go in one statement
+            if not key_columns:
+                self.db_connection.begin()
+                cursor.execute(insert_select_query, select_params + source_params)
+                records_copied = cursor.rowcount
+                self.db_connection.commit()
+                return CopyResult(table_name, records_copied, True,
+                                  None if records_copied else "No records found to copy",
+                                  self._elapsed_ms(start_time), 1)
+
+            # Rows already in the target project, from an earlier run of this copy, are skipped
+            insert_select_query += f"""
+                AND NOT EXISTS (
+                    SELECT 1 FROM {table_name} copied_rows
+                    WHERE copied_rows.corporate_account = source_rows.corporate_account
+                    AND copied_rows.project_id = %s
+                    AND {' AND '.join(f'copied_rows.{key} = source_rows.{key}' for key in key_columns)}
+                )
             """
+            source_params.append(copy_to_project_id)
+
+            # Copied in primary-key ordered chunks, each in its own short transaction
+            key_list = ', '.join(key_columns)
+            key_placeholders = ', '.join(['%s'] * len(key_columns))
+            last_key = None
 
-            # Execute INSERT for all records
-            cursor.executemany(insert_query, records_to_copy)
-            records_copied = cursor.rowcount
+            while True:
+                lower_bound = f" AND ({key_list}) > ({key_placeholders})" if last_key else ""
+                lower_params = list(last_key) if last_key else []
 
-            return CopyResult(table_name, records_copied, True)
+                self.db_connection.begin()
+                try:
+                    cursor.execute(f"""
+                        SELECT {key_list} FROM {table_name}
+                        WHERE corporate_account = %s AND project_id = %s{lower_bound}
+                        ORDER BY {key_list}
+                        LIMIT 1 OFFSET {self.chunk_size - 1}
+                    """, [corporate_account, copy_from_project_id] + lower_params)
+                    upper_key = cursor.fetchone()
+                    cursor.fetchall()
+
+                    upper_bound = f" AND ({key_list}) <= ({key_placeholders})" if upper_key else ""
+                    upper_params = list(upper_key) if upper_key else []
+
+                    cursor.execute(insert_select_query + lower_bound + upper_bound,
+                                   select_params + source_params + lower_params + upper_params)
+                    chunk_copied = cursor.rowcount
+                    self.db_connection.commit()
+                except Exception:
+                    self.db_connection.rollback()
+                    raise
+                records_copied += chunk_copied
+                chunks += 1
+
+                if not upper_key:
+                    break
+                last_key = upper_key
+
+            return CopyResult(table_name, records_copied, True,
+                              None if records_copied else "No records found to copy",
+                              self._elapsed_ms(start_time), chunks)
 
         except Exception as e:
-            return CopyResult(table_name, 0, False, str(e))
+            return CopyResult(table_name, records_copied, False, str(e), self._elapsed_ms(start_time), chunks)
 
-    def _get_table_columns(self, table_name: str) -> List[str]:
+    @staticmethod
+    def _elapsed_ms(start_time: float) -> float:
+        return round((time.perf_counter() - start_time) * 1000, 1)
+
+    def _get_table_metadata(self, table_name: str) -> Tuple[List[str], List[str]]:
         """
-        Get column names for a table
+        Get column names and primary key columns for a table, cached per process
 
         Args:
             table_name: Name of the table
 
         Returns:
-            List of column names
+            Tuple of (column names, primary key column names other than corporate_account/project_id)
         """
+        if table_name in self._table_metadata_cache:
+            return self._table_metadata_cache[table_name]
+
         try:
-            # This query works for PostgreSQL, MySQL, and most SQL databases
-            # Adjust based on your specific database system
-            query = """
+            # Only the current schema, so a same-named table in another database is not picked up
+            cursor = self.db_connection.cursor()
+            cursor.execute("""
                 SELECT column_name 
                 FROM information_schema.columns 
                 WHERE table_name = %s 
+                AND table_schema = DATABASE()
                 ORDER BY ordinal_position
-            """
-
-            cursor = self.db_connection.cursor()
-            cursor.execute(query, (table_name.lower(),))
+            """, (table_name.lower(),))
             columns = [row[0] for row in cursor.fetchall()]
 
-            return columns
+            cursor.execute("""
+                SELECT kcu.column_name
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage kcu
+                  ON tc.constraint_name = kcu.constraint_name
+                 AND tc.table_schema = kcu.table_schema
+                 AND tc.table_name = kcu.table_name
+                WHERE tc.constraint_type = 'PRIMARY KEY'
+                AND tc.table_name = %s
+                AND tc.table_schema = DATABASE()
+                ORDER BY kcu.ordinal_position
+            """, (table_name.lower(),))
+            key_columns = [row[0] for row in cursor.fetchall()
+                           if row[0].lower() not in ('corporate_account', 'project_id')]
+
+            if columns:
+                self._table_metadata_cache[table_name] = (columns, key_columns)
+
+            return columns, key_columns
 
         except Exception as e:
             logger.error(f"Error getting columns for table {table_name}: {str(e)}")
-            return []
+            return [], []
+
+    def _get_table_columns(self, table_name: str) -> List[str]:
+        """
+        Get column names for a table
+
+        Args:
+            table_name: Name of the table
+
+        Returns:
+            List of column names
+        """
+        return self._get_table_metadata(table_name)[0]
 
     def validate_parameters(self, corporate_account: str, copy_from_project_id: str,
                             copy_to_project_id: str) -> Dict[str, Any]:
@@ -0,0 +1,455 @@
+import contextvars
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector.pooling import MySQLConnectionPool
+from flask import g, has_request_context, request
+
+import config
+
+# Connection routing for MySQL, by tenant and by read/write.
+#
+# Tenants: every account lives on one shard. The default shard is the database in config.host /
+# config.database; config.shards names further MySQL instances, and TENANT_SHARDS (kept on the
+# default shard, created by migrate_schema.py) maps accounts onto them. Accounts without a row
+# stay on the default shard. The account comes from the corporate_account argument, else
+# use_corporate_account(), else the request (requesting_for_corporate_account, then
+# corporate_account). move_account_shard.py moves accounts between shards; while one is moving its
+# writes are refused with AccountUnavailable.
+# Tables in GLOBAL_TABLES are not per tenant and always live on the default shard.
+#
+# Reads: write paths call get_connection() and always talk to a shard's primary. Read-only
+# handlers and validators call get_read_connection(), which hands out a connection to one of the
+# shard's replicas. A read still goes to the primary when:
+#   - no replica is configured, reachable, replicating, or within REPLICA_MAX_LAG_SECONDS;
+#   - the user opened a write connection in this request or in the last READ_YOUR_WRITES_SECONDS
+#     (read-your-writes). A writing request answers with the time of the write in the X-Last-Write
+#     header and the last_write_at cookie; the client's next requests carry it back, so whichever
+#     process serves them knows. Clients that do not keep cookies echo the header. Each process
+#     also remembers its own recent writers, for clients that send neither;
+#   - the request is for a write endpoint (anything but get_* and download_*), so the validators
+#     it runs check what it refers to against current data;
+#   - the caller asks for current data with stale_ok=False (access checks, logins).
+#
+# config.replicas lists the default shard's replicas; a shard in config.shards lists its own under
+# 'replicas'. Keys left out default to the primary's settings. For two local instances, primary on
+# 3306 and a replica of it on 3307:
+#     port = 3306
+#     replicas = [{'host': '127.0.0.1', 'port': 3307}]
+# and for a tenant shard:
+#     shards = {'tenant_db_1': {'host': 'tenant-db-1', 'replicas': [{'host': 'tenant-db-1-replica'}]}}
+# Lag comes from SHOW REPLICA STATUS, so the replica user needs the REPLICATION CLIENT privilege.
+# A server that reports no replication status is not used as a replica.
+#
+# Pools: each process keeps DB_POOL_SIZE open connections per server (primary or replica), opened
+# together on first use or by warm_up_connections(). close() hands a connection back to the pool.
+# When all of them are checked out the caller gets a plain connection instead of waiting. A pool
+# is never carried across fork(): a forked worker opens its own. DB_POOL_SIZE = 0 turns pooling off.
+
+DEFAULT_SHARD = 'default'
+SHARDS = getattr(config, 'shards', {})
+REPLICAS = getattr(config, 'replicas', [])
+REPLICA_MAX_LAG_SECONDS = getattr(config, 'REPLICA_MAX_LAG_SECONDS', 5)
+# How long a replica's lag reading (or failure) is trusted before it is checked again
+REPLICA_CHECK_INTERVAL_SECONDS = getattr(config, 'REPLICA_CHECK_INTERVAL_SECONDS', 5)
+READ_YOUR_WRITES_SECONDS = getattr(config, 'READ_YOUR_WRITES_SECONDS', 10)
+DB_POOL_SIZE = getattr(config, 'DB_POOL_SIZE', 8)  # mysql.connector allows at most 32
+# How stale this process's copy of TENANT_SHARDS may get
+SHARD_MAP_REFRESH_SECONDS = getattr(config, 'SHARD_MAP_REFRESH_SECONDS', 30)
+
+# Tables shared by all tenants, kept on the default shard
+GLOBAL_TABLES = {'TENANT_SHARDS', 'BACKGROUND_JOBS', 'EMAIL_OUTBOX', 'PENDING_FILE_DELETIONS', 'FEEDBACK_SUBMISSIONS',
+                 'FEEDBACK_ATTACHMENTS'}
+
+# Tenant shard statuses
+ACTIVE = 'Active'
+MOVING = 'Moving'
+
+TENANT_SHARDS_DDL = """
+    CREATE TABLE IF NOT EXISTS TENANT_SHARDS (
+        CORPORATE_ACCOUNT VARCHAR(100) NOT NULL PRIMARY KEY,
+        SHARD_NAME VARCHAR(100) NOT NULL,
+        STATUS VARCHAR(20) NOT NULL,
+        UPDATED_BY VARCHAR(100),
+        UPDATED_DATE DATETIME
+    )
+"""
+
+_MAX_TRACKED_WRITERS = 10000
+
+LAST_WRITE_HEADER = 'X-Last-Write'
+LAST_WRITE_COOKIE = 'last_write_at'
+READ_ENDPOINT_PREFIXES = ('get_', 'download_')
+
+
+class AccountUnavailable(mysql.connector.Error):
+    """The account's shard cannot take this connection right now"""
+
+
+def _primary_settings():
+    settings = {'host': config.host,
+                'database': config.database,
+                'user': config.user,
+                'password': config.password}
+    if hasattr(config, 'port'):
+        settings['port'] = config.port
+    return settings
+
+
+def _replication_lag(connection):
+    """Seconds the server is behind its source, or None if it is not replicating"""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    if not rows:
+        return None
+    # One row per replication channel; NULL while the replication threads are stopped
+    lags = [row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master')) for row in rows]
+    if any(lag is None for lag in lags):
+        return None
+    return max(lags)
+
+
+class ServerPool:
+    """This process's pooled connections to one MySQL server"""
+
+    def __init__(self, name, settings):
+        # Pool names only take letters, digits and . : - * $ #
+        self.name = re.sub(r'[^a-zA-Z0-9.:\-]', '-', name)[:64]
+        self.settings = settings
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if not DB_POOL_SIZE:
+            return mysql.connector.connect(**self.settings)
+
+        pid = os.getpid()
+        if self._pool_pid != pid:
+            with self._lock:
+                if self._pool_pid != pid:
+                    self._pool = MySQLConnectionPool(pool_name=self.name, pool_size=DB_POOL_SIZE, **self.settings)
+                    self._pool_pid = pid
+
+        try:
+            return self._pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            # All pooled connections are checked out; this one really closes on close()
+            return mysql.connector.connect(**self.settings)
+
+
+class Replica:
+    def __init__(self, primary_settings, settings):
+        self.settings = {**primary_settings, **settings}
+        self.name = f"{self.settings['host']}:{self.settings.get('port', 3306)}"
+        self.pool = ServerPool(f"replica-{self.name}", self.settings)
+        self.usable = True
+        self.checked_at = None
+        self._check_lock = threading.Lock()
+
+    def _check_due(self):
+        return self.checked_at is None or time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL_SECONDS
+
+    def _mark(self, usable, reason=None):
+        if usable != self.usable:
+            if usable:
+                logging.info(f"Replica {self.name} is back in rotation")
+            else:
+                logging.warning(f"Replica {self.name} taken out of rotation: {reason}")
+        self.usable = usable
+        self.checked_at = time.monotonic()
+
+    def connect(self):
+        """A connection to this replica, or None if it is down or lagging"""
+        if not self.usable and not self._check_due():
+            return None
+
+        try:
+            connection = self.pool.connect()
+        except mysql.connector.Error as error:
+            self._mark(False, error)
+            return None
+
+        # One request re-checks the lag when it is due; concurrent ones go by the last reading
+        if self._check_due() and self._check_lock.acquire(blocking=False):
+            try:
+                lag = _replication_lag(connection)
+                if lag is None:
+                    self._mark(False, "not replicating")
+                elif lag > REPLICA_MAX_LAG_SECONDS:
+                    self._mark(False, f"{lag}s behind")
+                else:
+                    self._mark(True)
+            except mysql.connector.Error as error:
+                self._mark(False, error)
+            finally:
+                self._check_lock.release()
+
+        if not self.usable:
+            connection.close()
+            return None
+        return connection
+
+
+class Shard:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = {**_primary_settings(), **{key: value for key, value in settings.items() if key != 'replicas'}}
+        self.replicas = [Replica(self.settings, replica) for replica in settings.get('replicas', [])]
+        self.pool = ServerPool(f"shard-{name}", self.settings)
+        self._next_replica = itertools.count()
+
+    def connect(self):
+        return self.pool.connect()
+
+    def connect_replica(self):
+        """A connection to a healthy replica, tried round-robin, or None"""
+        start = next(self._next_replica)
+        for offset in range(len(self.replicas)):
+            connection = self.replicas[(start + offset) % len(self.replicas)].connect()
+            if connection is not None:
+                return connection
+        return None
+
+
+_shards = {DEFAULT_SHARD: Shard(DEFAULT_SHARD, {'replicas': REPLICAS})}
+_shards.update({name: Shard(name, settings) for name, settings in SHARDS.items()})
+
+_shard_map = {}
+_shard_map_loaded_at = None
+_shard_map_lock = threading.Lock()
+
+_corporate_account = contextvars.ContextVar('corporate_account', default=None)
+
+_last_writes = {}
+_last_writes_lock = threading.Lock()
+
+
+def sharding_enabled():
+    return bool(SHARDS)
+
+
+def shard_names():
+    return list(_shards)
+
+
+def has_replicas():
+    return any(shard.replicas for shard in _shards.values())
+
+
+def load_shard_map(cursor):
+    """TENANT_SHARDS as {corporate_account: (shard name, status)}, read on the default shard"""
+    cursor.execute("SELECT CORPORATE_ACCOUNT, SHARD_NAME, STATUS FROM TENANT_SHARDS")
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+def refresh_shard_map():
+    global _shard_map, _shard_map_loaded_at
+    connection = _shards[DEFAULT_SHARD].connect()
+    try:
+        cursor = connection.cursor()
+        shard_map = load_shard_map(cursor)
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    _shard_map, _shard_map_loaded_at = shard_map, time.monotonic()
+
+
+def _shard_entry(corporate_account):
+    if not SHARDS or not corporate_account:
+        return DEFAULT_SHARD, ACTIVE
+
+    if _shard_map_loaded_at is None or time.monotonic() - _shard_map_loaded_at >= SHARD_MAP_REFRESH_SECONDS:
+        # One thread reloads; the others carry on with the map they have, unless there is none yet
+        if _shard_map_lock.acquire(blocking=_shard_map_loaded_at is None):
+            try:
+                refresh_shard_map()
+            except mysql.connector.Error as error:
+                if _shard_map_loaded_at is None:
+                    raise
+                logging.error(f"Unable to refresh the tenant shard map, keeping the old one: {error}")
+            finally:
+                _shard_map_lock.release()
+
+    return _shard_map.get(corporate_account, (DEFAULT_SHARD, ACTIVE))
+
+
+def shard_for(corporate_account):
+    return _shard_entry(corporate_account)[0]
+
+
+@contextmanager
+def use_corporate_account(corporate_account):
+    """Route connections opened outside a request (jobs, scripts) to the account's shard"""
+    token = _corporate_account.set(corporate_account)
+    try:
+        yield
+    finally:
+        _corporate_account.reset(token)
+
+
+def current_corporate_account():
+    """The account in use_corporate_account(), else the one the current request is for, else None"""
+    corporate_account = _corporate_account.get()
+    if corporate_account is None and has_request_context():
+        sources = [request.get_json(silent=True) or {}, request.args]
+        if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+            sources.append(request.form)
+        for source in sources:
+            # Super admin requests act on the account they are requesting for
+            corporate_account = source.get('requesting_for_corporate_account') or source.get('corporate_account')
+            if corporate_account:
+                break
+    return corporate_account
+
+
+def resolve_shard(corporate_account=None, shard_name=None, writing=False):
+    """The Shard that connections for the account (or the named shard) go to"""
+    if shard_name is None:
+        corporate_account = corporate_account or current_corporate_account()
+        shard_name, status = _shard_entry(corporate_account)
+        if writing and status == MOVING:
+            raise AccountUnavailable(msg=f"Account {corporate_account} is being moved to another database. "
+                                         f"Please try again in a few minutes.")
+    try:
+        return _shards[shard_name]
+    except KeyError:
+        raise AccountUnavailable(msg=f"Database shard {shard_name} is not configured")
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    current_user = g.get('current_user')
+    return current_user['user_id'] if current_user else None
+
+
+def _note_write(user_id):
+    now = time.monotonic()
+    with _last_writes_lock:
+        _last_writes[user_id] = now
+        if len(_last_writes) > _MAX_TRACKED_WRITERS:
+            for stale_user_id in [key for key, written_at in _last_writes.items()
+                                  if now - written_at > READ_YOUR_WRITES_SECONDS]:
+                del _last_writes[stale_user_id]
+
+
+def _client_last_write():
+    """Epoch seconds of the client's last write, from the header or cookie set by _send_last_write"""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def in_write_request():
+    """True while handling a request for an endpoint that changes data"""
+    if not has_request_context() or request.endpoint is None:
+        return False
+    return not request.endpoint.split('.')[-1].startswith(READ_ENDPOINT_PREFIXES)
+
+
+def _recently_wrote(user_id):
+    if has_request_context():
+        if g.get('db_wrote'):
+            return True
+        client_written_at = _client_last_write()
+        if client_written_at is not None and time.time() - client_written_at <= READ_YOUR_WRITES_SECONDS:
+            return True
+    if user_id is None:
+        return False
+    written_at = _last_writes.get(user_id)
+    return written_at is not None and time.monotonic() - written_at <= READ_YOUR_WRITES_SECONDS
+
+
+def get_connection(corporate_account=None, shard=None):
+    """Connection to the primary of the account's shard (or the named shard), for anything that writes"""
+    connection = resolve_shard(corporate_account, shard, writing=True).connect()
+    user_id = _current_user_id()
+    if user_id is not None:
+        g.db_wrote = True
+        _note_write(user_id)
+    return connection
+
+
+def get_read_connection(stale_ok=True, corporate_account=None, shard=None):
+    """
+    Connection for read-only work on the account's shard (or the named shard): a replica when one
+    is healthy, the request is not for a write endpoint and the user has no recent writes,
+    otherwise the primary. Pass stale_ok=False when the read must see every committed write.
+    """
+    target = resolve_shard(corporate_account, shard, writing=False)
+    if stale_ok and target.replicas and not in_write_request() and not _recently_wrote(_current_user_id()):
+        connection = target.connect_replica()
+        if connection is not None:
+            return connection
+    return target.connect()
+
+
+def set_tenant_shard(cursor, corporate_account, shard_name, status, updated_by):
+    """Upsert an account's TENANT_SHARDS row; cursor must be on the default shard"""
+    cursor.execute("""
+        INSERT INTO TENANT_SHARDS (CORPORATE_ACCOUNT, SHARD_NAME, STATUS, UPDATED_BY, UPDATED_DATE)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE SHARD_NAME = VALUES(SHARD_NAME), STATUS = VALUES(STATUS),
+            UPDATED_BY = VALUES(UPDATED_BY), UPDATED_DATE = VALUES(UPDATED_DATE)
+    """, (corporate_account, shard_name, status, updated_by, datetime.now()))
+
+
+def warm_up_connections():
+    """
+    Fill this process's pools, take a first lag reading from every replica and load the shard map,
+    so the first requests do not pay for them. Servers that are down are logged and skipped.
+    """
+    for shard in _shards.values():
+        try:
+            shard.connect().close()
+        except mysql.connector.Error as error:
+            logging.error(f"Unable to connect to the {shard.name} shard: {error}")
+        for replica in shard.replicas:
+            connection = replica.connect()
+            if connection is not None:
+                connection.close()
+
+    if SHARDS:
+        try:
+            refresh_shard_map()
+        except mysql.connector.Error as error:
+            logging.error(f"Unable to load the tenant shard map: {error}")
+
+
+def init_db_routing(app):
+    """Start the read-your-writes window when a writing request finishes, not when it started"""
+    @app.after_request
+    def _send_last_write(response):
+        # Handed back by the client on its next requests, whichever process serves them
+        if g.get('db_wrote'):
+            written_at = f"{time.time():.3f}"
+            response.headers[LAST_WRITE_HEADER] = written_at
+            response.set_cookie(LAST_WRITE_COOKIE, written_at, max_age=READ_YOUR_WRITES_SECONDS, httponly=True,
+                                samesite='Lax', secure=request.is_secure)
+        return response
+
+    @app.teardown_request
+    def _note_request_writes(exception=None):
+        if g.get('db_wrote'):
+            user_id = _current_user_id()
+            if user_id is not None:
+                _note_write(user_id)
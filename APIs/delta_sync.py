@@ -0,0 +1,151 @@
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import config
+
+# Delta sync support for list endpoints. A client passes the sync_watermark from its previous
+# response as updated_since and gets back only the rows changed since then, plus tombstones from
+# DELETION_LOG for records that were hard-deleted in the meantime.
+#
+# DELETION_LOG and the SYNC_INDEXES are created by migrate_schema.py, run once per deployment
+# before the API that needs them, like every other table the API adds.
+
+# Rows written by a transaction that commits after the watermark was read can carry an earlier
+# UPDATED_DATE (it is set from the app server clock when the statement runs), so the watermark
+# handed out lags the database clock. Deltas overlap a little; clients upsert by id.
+SYNC_WATERMARK_LAG_SECONDS = getattr(config, 'SYNC_WATERMARK_LAG_SECONDS', 60)
+
+SYNC_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Deleted record types
+FUNCTIONAL_LEVEL = 'functional_level'
+USECASE = 'usecase'
+COMMENT = 'comment'
+REQUIREMENT_APPROVER = 'requirement_approver'
+KEY_ATTRIBUTE_LIST_REQUIREMENT = 'key_attribute_list_requirement'
+RAID_LOG_ASSIGNEE = 'raid_log_assignee'
+
+DELETION_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS DELETION_LOG (
+        DELETION_ID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        CORPORATE_ACCOUNT VARCHAR(100) NOT NULL,
+        PROJECT_ID VARCHAR(100) NOT NULL,
+        RECORD_TYPE VARCHAR(50) NOT NULL,
+        RECORD_ID VARCHAR(100) NOT NULL,
+        PARENT_ID VARCHAR(100),
+        DELETED_BY VARCHAR(100),
+        DELETED_DATE DATETIME NOT NULL,
+        INDEX IDX_DELETION_LOG_SYNC (CORPORATE_ACCOUNT, PROJECT_ID, RECORD_TYPE, DELETED_DATE)
+    )
+"""
+
+# (table, index name, columns) backing the updated_since lookups
+SYNC_INDEXES = [
+    ('REQUIREMENTS', 'IDX_REQUIREMENTS_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('INTEGRATION_REQUIREMENTS', 'IDX_INTEGRATION_REQUIREMENTS_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('RAID_LOG', 'IDX_RAID_LOG_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('RAID_LOG_ASSIGNEES', 'IDX_RAID_LOG_ASSIGNEES_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('REQUIREMENTS_COMMENTS', 'IDX_REQUIREMENTS_COMMENTS_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('REQUIREMENT_CLASSIFICATION', 'IDX_REQUIREMENT_CLASSIFICATION_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('KEY_ATTRIBUTES_LIST_REQUIREMENTS', 'IDX_KEY_ATTRIBUTES_LIST_REQUIREMENTS_SYNC',
+     'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+    ('REQUIREMENTS_APPROVERS', 'IDX_REQUIREMENTS_APPROVERS_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, CREATED_DATE'),
+    ('FUNCTIONAL_LEVELS', 'IDX_FUNCTIONAL_LEVELS_SYNC', 'CORPORATE_ACCOUNT, PROJECT_ID, UPDATED_DATE'),
+]
+
+def parse_updated_since(value):
+    """
+    Accept the sync_watermark format, ISO 8601, or an HTTP date as found in list responses.
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Invalid updated_since value: {value!r}")
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid updated_since value: {value!r}")
+    # Stored dates are naive
+    return parsed.replace(tzinfo=None)
+
+
+def get_sync_watermark(cursor):
+    """Watermark for the response; read it before the list query so nothing falls between two deltas"""
+    cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (SYNC_WATERMARK_LAG_SECONDS,))
+    return cursor.fetchone()[0].strftime(SYNC_TIMESTAMP_FORMAT)
+
+
+def log_deletions(cursor, record_type, table, id_column, where_clause, params, deleted_by, parent_column=None):
+    """
+    Write a tombstone for every row of `table` matching where_clause (which must include the
+    CORPORATE_ACCOUNT and PROJECT_ID conditions). Call it just before the DELETE, on the same cursor,
+    so tombstones commit or roll back with the delete.
+    """
+    cursor.execute(f"""
+        INSERT INTO DELETION_LOG (CORPORATE_ACCOUNT, PROJECT_ID, RECORD_TYPE, RECORD_ID, PARENT_ID, DELETED_BY,
+        DELETED_DATE)
+        SELECT CORPORATE_ACCOUNT, PROJECT_ID, %s, {id_column}, {parent_column or 'NULL'}, %s, NOW()
+        FROM {table} WHERE {where_clause}
+    """, (record_type, deleted_by) + tuple(params))
+
+
+def get_deleted_records(cursor, corporate_account, project_id, record_types, updated_since):
+    """Tombstones of the given record types logged at or after updated_since"""
+    if not record_types:
+        return []
+
+    placeholders = ', '.join(['%s'] * len(record_types))
+    cursor.execute(f"""
+        SELECT RECORD_TYPE, RECORD_ID, PARENT_ID, DELETED_DATE FROM DELETION_LOG
+        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RECORD_TYPE IN ({placeholders}) AND DELETED_DATE >= %s
+        ORDER BY DELETION_ID
+    """, (corporate_account, project_id, *record_types, updated_since))
+
+    return [{
+        'record_type': result[0],
+        'record_id': result[1],
+        'parent_id': result[2],
+        'deleted_date': result[3]
+    } for result in cursor.fetchall()]
+
+
+def changed_requirements_condition(alias, table, id_column, corporate_account, project_id, updated_since):
+    """
+    SQL condition and params limiting a requirements or integrations list query (table aliased as
+    `alias`) to records whose own row, functional level, product classifications, key attributes or
+    approvers changed at or after updated_since
+    """
+    scope = "CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"
+    condition = f""" AND {alias}.{id_column} IN (
+        SELECT {id_column} FROM {table} WHERE {scope} AND UPDATED_DATE >= %s
+        UNION SELECT R.{id_column} FROM {table} R, FUNCTIONAL_LEVELS L
+            WHERE R.CORPORATE_ACCOUNT = L.CORPORATE_ACCOUNT AND R.PROJECT_ID = L.PROJECT_ID AND R.LEVEL_ID = L.LEVEL_ID
+            AND L.CORPORATE_ACCOUNT = %s AND L.PROJECT_ID = %s AND L.UPDATED_DATE >= %s
+        UNION SELECT REQ_ID FROM REQUIREMENT_CLASSIFICATION WHERE {scope} AND UPDATED_DATE >= %s
+        UNION SELECT REQ_ID FROM KEY_ATTRIBUTES_LIST_REQUIREMENTS WHERE {scope} AND UPDATED_DATE >= %s
+        UNION SELECT REQ_ID FROM REQUIREMENTS_APPROVERS WHERE {scope} AND CREATED_DATE >= %s
+        UNION SELECT PARENT_ID FROM DELETION_LOG WHERE {scope} AND RECORD_TYPE IN (%s, %s) AND DELETED_DATE >= %s
+    ) """
+    scope_params = [corporate_account, project_id, updated_since]
+    params = scope_params * 5 + [corporate_account, project_id, REQUIREMENT_APPROVER, KEY_ATTRIBUTE_LIST_REQUIREMENT,
+                                 updated_since]
+    return condition, params
+
+
+def changed_raid_log_condition(corporate_account, project_id, updated_since):
+    """SQL condition and params limiting the RAID log list query (aliased R) to entries whose own row or assignees changed"""
+    scope = "CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"
+    condition = f""" AND R.RAID_ID IN (
+        SELECT RAID_ID FROM RAID_LOG WHERE {scope} AND UPDATED_DATE >= %s
+        UNION SELECT RAID_ID FROM RAID_LOG_ASSIGNEES WHERE {scope} AND UPDATED_DATE >= %s
+        UNION SELECT PARENT_ID FROM DELETION_LOG WHERE {scope} AND RECORD_TYPE = %s AND DELETED_DATE >= %s
+    ) """
+    scope_params = [corporate_account, project_id, updated_since]
+    params = scope_params * 2 + [corporate_account, project_id, RAID_LOG_ASSIGNEE, updated_since]
+    return condition, params
+
@@ -0,0 +1,262 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import config
+from attachment_store import open_attachment
+
+# Transactional outbox for outgoing email. Callers add a row in the same transaction as the
+# data the email is about; a single background sender per process delivers pending rows over
+# one reused SMTP connection, retrying with exponential backoff. EMAIL_OUTBOX lives on the default
+# shard and is created by migrate_schema.py.
+
+SMTP_SERVER = config.SMTP_SERVER
+SMTP_PORT = config.SMTP_PORT
+SENDER_EMAIL = config.EMAIL_ID
+EMAIL_PASSWORD = config.EMAIL_PASSWORD
+SMTP_USE_SSL = getattr(config, 'SMTP_USE_SSL', True)  # False for a plain local SMTP server such as aiosmtpd
+
+BATCH_SIZE = getattr(config, 'EMAIL_OUTBOX_BATCH_SIZE', 20)
+MAX_ATTEMPTS = getattr(config, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+RETRY_BASE_SECONDS = getattr(config, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30)
+RETRY_MAX_SECONDS = 6 * 60 * 60
+POLL_SECONDS = getattr(config, 'EMAIL_OUTBOX_POLL_SECONDS', 30)
+SMTP_IDLE_SECONDS = 60  # Idle connections are closed after this long
+CLAIM_TIMEOUT_MINUTES = 15  # Rows left in Sending by a crashed process are retried after this long
+
+# Delivery statuses
+PENDING = 'Pending'
+SENDING = 'Sending'
+SENT = 'Sent'
+FAILED = 'Failed'
+
+OUTBOX_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS EMAIL_OUTBOX (
+        OUTBOX_ID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        REFERENCE_TYPE VARCHAR(50),
+        REFERENCE_ID VARCHAR(100),
+        RECIPIENT VARCHAR(255) NOT NULL,
+        REPLY_TO VARCHAR(255),
+        SUBJECT VARCHAR(500) NOT NULL,
+        HTML_BODY LONGTEXT,
+        ATTACHMENTS TEXT,
+        STATUS VARCHAR(20) NOT NULL,
+        ATTEMPTS INT NOT NULL DEFAULT 0,
+        NEXT_ATTEMPT_DATE DATETIME,
+        CLAIM_TOKEN VARCHAR(32),
+        CLAIMED_DATE DATETIME,
+        LAST_ERROR TEXT,
+        CREATED_DATE DATETIME,
+        SENT_DATE DATETIME,
+        INDEX IDX_EMAIL_OUTBOX_STATUS (STATUS, NEXT_ATTEMPT_DATE),
+        INDEX IDX_EMAIL_OUTBOX_CLAIM (CLAIM_TOKEN)
+    )
+"""
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def _get_connection():
+    return mysql.connector.connect(host=config.host,
+                                   database=config.database,
+                                   user=config.user,
+                                   password=config.password)
+
+
+def queue_email(cursor, recipient, subject, html_body, reply_to=None, attachments=None, reference_type=None,
+                reference_id=None):
+    """
+    Add an email to the outbox inside the caller's transaction and return its OUTBOX_ID.
+    attachments is a list of {'file_name': ..., 'relative_path': ...} pointing at stored attachments.
+    Call wake_outbox_sender() after the transaction commits.
+    """
+    cursor.execute("""
+        INSERT INTO EMAIL_OUTBOX (REFERENCE_TYPE, REFERENCE_ID, RECIPIENT, REPLY_TO, SUBJECT, HTML_BODY, ATTACHMENTS,
+        STATUS, ATTEMPTS, NEXT_ATTEMPT_DATE, CREATED_DATE)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 0, %s, %s)
+    """, (reference_type, reference_id, recipient, reply_to, subject, html_body,
+          json.dumps(attachments or []), PENDING, datetime.now(), datetime.now()))
+    return cursor.lastrowid
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after `attempts` failures"""
+    return min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+
+
+def build_message(row):
+    """MIME message for an outbox row; attachments are read and encoded here, in the sender thread"""
+    # The email and smtplib modules are only needed by the sender, so they load on its first batch
+    from email import encoders
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = row['RECIPIENT']
+    msg['Subject'] = row['SUBJECT']
+
+    if row['REPLY_TO']:
+        msg['Reply-To'] = row['REPLY_TO']
+
+    msg.attach(MIMEText(row['HTML_BODY'] or '', 'html'))
+
+    for attachment in json.loads(row['ATTACHMENTS'] or '[]'):
+        try:
+            with open_attachment(attachment['relative_path']) as file:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(file.read())
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', f'attachment; filename= {attachment["file_name"]}')
+            msg.attach(part)
+        except Exception as e:
+            logging.error(f"Error attaching file {attachment['file_name']} to outbox email {row['OUTBOX_ID']}: {e}")
+
+    return msg
+
+
+class OutboxSender(threading.Thread):
+    """Background thread that drains EMAIL_OUTBOX over one persistent SMTP connection"""
+
+    def __init__(self):
+        super().__init__(name='email-outbox-sender', daemon=True)
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._smtp = None
+        self._smtp_last_used = 0.0
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                # Keep draining while full batches come back
+                while self.send_batch() == BATCH_SIZE and not self._stop_event.is_set():
+                    pass
+            except Exception as e:
+                logging.error(f"Email outbox sender error: {e}")
+
+            if self._smtp and time.monotonic() - self._smtp_last_used > SMTP_IDLE_SECONDS:
+                self._close_smtp()
+
+            self._wake_event.wait(POLL_SECONDS)
+            self._wake_event.clear()
+
+        self._close_smtp()
+
+    def send_batch(self):
+        """Claim and send one batch of due emails. Returns how many were claimed."""
+        rows = self._claim_batch()
+        for row in rows:
+            try:
+                self._send(row)
+                self._record_result(row, SENT)
+                logging.info(f"Outbox email {row['OUTBOX_ID']} sent to {row['RECIPIENT']}")
+            except Exception as e:
+                self._close_smtp()
+                attempts = row['ATTEMPTS'] + 1
+                status = FAILED if attempts >= MAX_ATTEMPTS else PENDING
+                self._record_result(row, status, str(e))
+                logging.warning(f"Outbox email {row['OUTBOX_ID']} attempt {attempts} failed: {e}")
+        return len(rows)
+
+    def _claim_batch(self):
+        claim_token = uuid.uuid4().hex
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor(dictionary=True)
+
+            # Only one sender, in any process, can claim a row
+            cursor.execute("""
+                UPDATE EMAIL_OUTBOX SET STATUS = %s, CLAIM_TOKEN = %s, CLAIMED_DATE = %s
+                WHERE (STATUS = %s AND NEXT_ATTEMPT_DATE <= %s) OR (STATUS = %s AND CLAIMED_DATE < %s)
+                ORDER BY OUTBOX_ID LIMIT %s
+            """, (SENDING, claim_token, datetime.now(), PENDING, datetime.now(), SENDING,
+                  datetime.now() - timedelta(minutes=CLAIM_TIMEOUT_MINUTES), BATCH_SIZE))
+            connection.commit()
+
+            if cursor.rowcount == 0:
+                return []
+
+            cursor.execute("""
+                SELECT OUTBOX_ID, RECIPIENT, REPLY_TO, SUBJECT, HTML_BODY, ATTACHMENTS, ATTEMPTS
+                FROM EMAIL_OUTBOX WHERE CLAIM_TOKEN = %s ORDER BY OUTBOX_ID
+            """, (claim_token,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            connection.close()
+
+    def _record_result(self, row, status, error_message=None):
+        attempts = row['ATTEMPTS'] + 1
+        next_attempt = datetime.now() + timedelta(seconds=retry_delay(attempts)) if status == PENDING else None
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                UPDATE EMAIL_OUTBOX SET STATUS = %s, ATTEMPTS = %s, NEXT_ATTEMPT_DATE = %s, LAST_ERROR = %s,
+                SENT_DATE = %s, CLAIM_TOKEN = NULL WHERE OUTBOX_ID = %s
+            """, (status, attempts, next_attempt, error_message, datetime.now() if status == SENT else None,
+                  row['OUTBOX_ID']))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+    def _send(self, row):
+        import smtplib
+
+        msg = build_message(row)
+        smtp = self._get_smtp()
+        try:
+            smtp.sendmail(SENDER_EMAIL, row['RECIPIENT'], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the reused connection; reconnect once
+            self._close_smtp()
+            smtp = self._get_smtp()
+            smtp.sendmail(SENDER_EMAIL, row['RECIPIENT'], msg.as_string())
+        self._smtp_last_used = time.monotonic()
+
+    def _get_smtp(self):
+        import smtplib
+
+        if self._smtp is None:
+            if SMTP_USE_SSL:
+                self._smtp = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT)
+            else:
+                self._smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            if EMAIL_PASSWORD:
+                self._smtp.login(SENDER_EMAIL, EMAIL_PASSWORD)
+            self._smtp_last_used = time.monotonic()
+        return self._smtp
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+def wake_outbox_sender():
+    """Start this process's sender if needed and have it check the outbox now"""
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = OutboxSender()
+            _sender.start()
+        _sender.wake()
@@ -0,0 +1,278 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import config
+from attachment_store import UPLOAD_FOLDER, BLOB_TMP_FOLDER, content_hash_from_path
+from db_routing import get_read_connection, shard_names
+
+# One reaper thread per process deletes files whose time has come. Pending deletions are kept in
+# a heap ordered by due time and persisted in PENDING_FILE_DELETIONS, so a restart picks them up
+# again. The same thread periodically sweeps ATTACHMENTS_FOLDER_PATH for orphaned files; every
+# process schedules the sweep, and a MySQL named lock lets only one of them run it at a time.
+
+ORPHAN_SWEEP_HOURS = getattr(config, 'ATTACHMENTS_ORPHAN_SWEEP_HOURS', 24)  # 0 disables the sweep
+ORPHAN_MIN_AGE_HOURS = 24  # Younger files may belong to an upload that has not committed yet
+SWEEP_BATCH_SIZE = 500
+RELOAD_MINUTES = 10  # How often overdue rows left by other processes are picked up
+SWEEP_LOCK_NAME = 'attachments_orphan_sweep'
+
+# PENDING_FILE_DELETIONS lives on the default shard and is created by migrate_schema.py
+DELETIONS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS PENDING_FILE_DELETIONS (
+        DELETION_ID BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        FILE_PATH VARCHAR(1000) NOT NULL,
+        DELETE_AFTER DATETIME NOT NULL,
+        CREATED_DATE DATETIME,
+        INDEX IDX_PENDING_FILE_DELETIONS_DUE (DELETE_AFTER)
+    )
+"""
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _get_connection():
+    return mysql.connector.connect(host=config.host,
+                                   database=config.database,
+                                   user=config.user,
+                                   password=config.password)
+
+
+def _delete_file(file_path):
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logging.info(f"Deleted file: {file_path}")
+    except Exception as e:
+        logging.error(f"Error deleting file {file_path}: {e}")
+
+
+class FileReaper(threading.Thread):
+    """Deletes scheduled files when due and sweeps for orphaned attachment files"""
+
+    def __init__(self):
+        super().__init__(name='file-reaper', daemon=True)
+        self._heap = []  # (due epoch seconds, deletion id, file path)
+        self._condition = threading.Condition()
+        self._stop_requested = False
+        self._next_reload = 0.0
+        self._next_sweep = time.time() + 60 if ORPHAN_SWEEP_HOURS else None
+
+    def schedule(self, deletion_id, file_path, due):
+        with self._condition:
+            heapq.heappush(self._heap, (due, deletion_id, file_path))
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stop_requested = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                if self._stop_requested:
+                    return
+                now = time.time()
+                wake_times = [self._next_reload]
+                if self._heap:
+                    wake_times.append(self._heap[0][0])
+                if self._next_sweep:
+                    wake_times.append(self._next_sweep)
+                wake_at = min(wake_times)
+                if wake_at > now:
+                    self._condition.wait(wake_at - now)
+                    continue
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+
+            try:
+                if due:
+                    self._reap(due)
+                if now >= self._next_reload:
+                    self._next_reload = now + RELOAD_MINUTES * 60
+                    self._reload_overdue()
+                if self._next_sweep and now >= self._next_sweep:
+                    self._next_sweep = now + ORPHAN_SWEEP_HOURS * 60 * 60
+                    sweep_orphaned_files()
+            except Exception as e:
+                logging.error(f"File reaper error: {e}")
+
+    def _reap(self, due):
+        for _, _, file_path in due:
+            _delete_file(file_path)
+
+        deletion_ids = [deletion_id for _, deletion_id, _ in due if deletion_id is not None]
+        if deletion_ids:
+            connection = _get_connection()
+            try:
+                cursor = connection.cursor()
+                placeholders = ', '.join(['%s'] * len(deletion_ids))
+                cursor.execute(f"DELETE FROM PENDING_FILE_DELETIONS WHERE DELETION_ID IN ({placeholders})",
+                               deletion_ids)
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+
+    def _reload_overdue(self):
+        """Queue rows persisted before a restart, or by a process that has gone away"""
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""SELECT DELETION_ID, FILE_PATH, DELETE_AFTER FROM PENDING_FILE_DELETIONS
+                WHERE DELETE_AFTER <= %s""", (datetime.now(),))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        with self._condition:
+            queued_ids = {deletion_id for _, deletion_id, _ in self._heap}
+            for deletion_id, file_path, delete_after in rows:
+                if deletion_id not in queued_ids:
+                    heapq.heappush(self._heap, (delete_after.timestamp(), deletion_id, file_path))
+            self._condition.notify()
+
+
+def start_file_reaper():
+    """Start this process's reaper thread if it is not running"""
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = FileReaper()
+            _reaper.start()
+        return _reaper
+
+
+def schedule_file_deletion(file_paths, delay=60):
+    """Delete the given files after `delay` seconds, surviving restarts"""
+    if not file_paths:
+        return
+
+    due = datetime.now() + timedelta(seconds=delay)
+    scheduled = []
+
+    try:
+        connection = _get_connection()
+        try:
+            cursor = connection.cursor()
+            for file_path in file_paths:
+                cursor.execute("""INSERT INTO PENDING_FILE_DELETIONS (FILE_PATH, DELETE_AFTER, CREATED_DATE)
+                    VALUES (%s, %s, %s)""", (file_path, due, datetime.now()))
+                scheduled.append((cursor.lastrowid, file_path))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+    except Exception as e:
+        # Still delete them from this process; only the restart guarantee is lost
+        logging.error(f"Unable to persist scheduled file deletions: {e}")
+        scheduled = [(None, file_path) for file_path in file_paths]
+
+    reaper = start_file_reaper()
+    for deletion_id, file_path in scheduled:
+        reaper.schedule(deletion_id, file_path, due.timestamp())
+
+
+def _find_referenced(cursor, relative_paths):
+    """Subset of relative_paths that an attachment row or blob row still points at"""
+    hashes = [content_hash_from_path(path) for path in relative_paths if content_hash_from_path(path)]
+
+    # Rows written on Windows hold backslash paths. Look up both spellings so FILE_PATH is compared
+    # as stored (and its index stays usable), then report matches in the '/' form of relative_paths
+    spellings = list(relative_paths) + [path.replace('/', '\\') for path in relative_paths if '/' in path]
+    placeholders = ', '.join(['%s'] * len(spellings))
+    cursor.execute(f"""
+        SELECT FILE_PATH FROM REQUIREMENT_ATTACHMENTS WHERE FILE_PATH IN ({placeholders})
+        UNION
+        SELECT FILE_PATH FROM FEEDBACK_ATTACHMENTS WHERE FILE_PATH IN ({placeholders})
+    """, spellings + spellings)
+    referenced = {row[0].replace('\\', '/') for row in cursor.fetchall()}
+
+    # ATTACHMENT_BLOBS exists whenever a blob file does, since the row is written first
+    if hashes:
+        hash_placeholders = ', '.join(['%s'] * len(hashes))
+        cursor.execute(f"SELECT FILE_PATH FROM ATTACHMENT_BLOBS WHERE CONTENT_HASH IN ({hash_placeholders})", hashes)
+        referenced.update(row[0] for row in cursor.fetchall())
+
+    return referenced
+
+
+def sweep_orphaned_files():
+    """
+    Delete files under ATTACHMENTS_FOLDER_PATH that no FEEDBACK_ATTACHMENTS, REQUIREMENT_ATTACHMENTS
+    or ATTACHMENT_BLOBS row on any shard points at, plus stale upload temp files. Only files older
+    than ORPHAN_MIN_AGE_HOURS are considered. Returns the number of files removed, or None when
+    another process is already sweeping.
+    """
+    cutoff = time.time() - ORPHAN_MIN_AGE_HOURS * 60 * 60
+    tmp_folder = os.path.join(UPLOAD_FOLDER, BLOB_TMP_FOLDER)
+    removed = 0
+
+    # Held on the default shard's primary for the whole sweep; released when lock_connection closes
+    lock_connection = _get_connection()
+    connections = []
+    try:
+        lock_cursor = lock_connection.cursor()
+        lock_cursor.execute("SELECT GET_LOCK(%s, 0)", (SWEEP_LOCK_NAME,))
+        if lock_cursor.fetchone()[0] != 1:
+            logging.info("Orphaned attachment sweep skipped: another process is sweeping")
+            return None
+
+        for shard in shard_names():
+            connections.append(get_read_connection(stale_ok=False, shard=shard))
+        cursors = [connection.cursor() for connection in connections]
+
+        batch = []
+        for root, _, file_names in os.walk(UPLOAD_FOLDER):
+            for file_name in file_names:
+                full_path = os.path.join(root, file_name)
+                try:
+                    if os.path.getmtime(full_path) > cutoff:
+                        continue
+                except OSError:
+                    continue
+
+                if os.path.dirname(full_path) == tmp_folder:
+                    _delete_file(full_path)
+                    removed += 1
+                    continue
+
+                batch.append(os.path.relpath(full_path, UPLOAD_FOLDER).replace(os.sep, '/'))
+                if len(batch) >= SWEEP_BATCH_SIZE:
+                    removed += _remove_unreferenced(cursors, batch)
+                    batch = []
+
+        if batch:
+            removed += _remove_unreferenced(cursors, batch)
+
+        for cursor in cursors:
+            cursor.close()
+    finally:
+        for connection in connections:
+            connection.close()
+        lock_connection.close()
+
+    logging.info(f"Orphaned attachment sweep removed {removed} file(s)")
+    return removed
+
+
+def _remove_unreferenced(cursors, relative_paths):
+    referenced = set()
+    for cursor in cursors:
+        referenced.update(_find_referenced(cursor, relative_paths))
+    removed = 0
+    for relative_path in relative_paths:
+        if relative_path not in referenced:
+            logging.info(f"Removing orphaned attachment file: {relative_path}")
+            _delete_file(os.path.join(UPLOAD_FOLDER, relative_path))
+            removed += 1
+    return removed
@@ -1,14 +1,14 @@
 import mysql.connector
 from datetime import datetime
 from flask import jsonify
-import config
+from db_routing import get_connection, get_read_connection, sharding_enabled, shard_names, shard_for
 import logging
 import re
 
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 
 
-def generate_next_sequence(corporate_account, project_id, sequence_key):
+def generate_next_sequence(corporate_account, project_id, sequence_key, count=1):
+    # count > 1 reserves a contiguous block; the returned number is the first one in the block
     sts = "Success"
     sts_description = "Next sequence number generated successfully"
     rows_impacted = 0
@@ -16,10 +16,7 @@ def generate_next_sequence(corporate_account, project_id, sequence_key):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = """SELECT NEXT_SEQUENCE_NO FROM UNIQUE_SEQUENCE_GENERATION WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND SEQUENCE_KEY = %s FOR UPDATE"""
@@ -29,8 +26,8 @@ def generate_next_sequence(corporate_account, project_id, sequence_key):
 
         if result:
             next_sequence_no = result[0] + 1
-            mySql_update_query = """UPDATE UNIQUE_SEQUENCE_GENERATION SET NEXT_SEQUENCE_NO = NEXT_SEQUENCE_NO + 1, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND SEQUENCE_KEY = %s"""
-            record = (datetime.now(), corporate_account, project_id, sequence_key)
+            mySql_update_query = """UPDATE UNIQUE_SEQUENCE_GENERATION SET NEXT_SEQUENCE_NO = NEXT_SEQUENCE_NO + %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND SEQUENCE_KEY = %s"""
+            record = (count, datetime.now(), corporate_account, project_id, sequence_key)
             cursor2.execute(mySql_update_query, record)
             connection2.commit()
             rows_impacted = cursor2.rowcount
@@ -41,7 +38,7 @@ def generate_next_sequence(corporate_account, project_id, sequence_key):
         else:
             mySql_insert_query = """INSERT INTO UNIQUE_SEQUENCE_GENERATION(CORPORATE_ACCOUNT, PROJECT_ID, SEQUENCE_KEY, NEXT_SEQUENCE_NO, CREATED_DATE, UPDATED_DATE)
                                            VALUES (%s, %s, %s, %s, %s, %s) """
-            record = (corporate_account, project_id, sequence_key, next_sequence_no, datetime.now(), datetime.now())
+            record = (corporate_account, project_id, sequence_key, next_sequence_no + count - 1, datetime.now(), datetime.now())
 
             cursor2.execute(mySql_insert_query, record)
             connection2.commit()
@@ -77,10 +74,7 @@ def get_link_details(corporate_account, project_id, record_type, record_id):
     logging.info(f"record_id: {record_id}")
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         if record_type == "REQUIREMENT" or record_type == "INTEGRATION_REQUIREMENT":
@@ -136,10 +130,7 @@ def validate_corporate_account(corporate_account):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM CORPORATE_ACCOUNTS WHERE CORPORATE_ACCOUNT = %s"
@@ -174,10 +165,7 @@ def validate_project_id(corporate_account, project_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM CORPORATE_ACCOUNT_PROJECTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"
@@ -212,10 +200,7 @@ def validate_level_id(corporate_account, project_id, level_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         logging.info(f"corporate_account: {corporate_account}")
@@ -254,10 +239,7 @@ def validate_req_id(corporate_account, project_id, req_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM REQUIREMENTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s"
@@ -309,10 +291,7 @@ def validate_status(corporate_account, project_id, entity, status):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM ACCOUNT_STATUSES WHERE ENTITY = %s AND STATUS = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"
@@ -348,10 +327,7 @@ def validate_user_id(corporate_account, user_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM USER_ACCOUNTS WHERE CORPORATE_ACCOUNT = %s AND USER_ID = %s"
@@ -387,10 +363,7 @@ def validate_usecase_id(corporate_account, project_id, usecase_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM REQUIREMENTS_USECASES WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND USECASE_ID = %s"
@@ -425,10 +398,7 @@ def validate_raid_log_entry(corporate_account, project_id, raid_type, raid_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM RAID_LOG WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_TYPE = %s AND RAID_ID = %s"
@@ -465,10 +435,7 @@ def validate_testcase_id(corporate_account, project_id, testcase_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT STATUS FROM REQUIREMENTS_TESTCASES WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND TESTCASE_ID = %s"
@@ -503,10 +470,7 @@ def validate_key_attribute_list_id(corporate_account, project_id, key_attribute_
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT * FROM KEY_ATTRIBUTES_LIST WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND KEY_ATTRIBUTE_LIST_ID = %s"
@@ -541,10 +505,7 @@ def validate_integration_system_id(corporate_account, project_id, system_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT * FROM INTEGRATION_SYSTEMS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND SYSTEM_ID = %s"
@@ -579,10 +540,7 @@ def validate_integration_id(corporate_account, project_id, integration_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT * FROM INTEGRATION_REQUIREMENTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID = %s"
@@ -613,6 +571,77 @@ def validate_integration_id(corporate_account, project_id, integration_id):
     return sts
 
 
+def get_existing_record_ids(cursor, table_name, id_column, corporate_account, project_id, record_ids,
+                            for_update=False, filters=None):
+    """
+    Returns the string form of every id in record_ids that exists in table_name for the project,
+    using a single IN query on the caller's cursor so it can share the caller's transaction.
+    filters is an optional {column: value} dict of extra equality conditions.
+    """
+    if not record_ids:
+        return set()
+
+    filters = filters or {}
+    placeholders = ','.join(['%s'] * len(record_ids))
+    filter_conditions = ''.join(f" AND {column} = %s" for column in filters)
+    mySql_select_query = f"""SELECT {id_column} FROM {table_name}
+        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s{filter_conditions} AND {id_column} IN ({placeholders})"""
+    if for_update:
+        mySql_select_query += " FOR UPDATE"
+
+    record = [corporate_account, project_id]
+    record.extend(filters.values())
+    record.extend(record_ids)
+    cursor.execute(mySql_select_query, record)
+    logging.info(f" executed SQL is: {cursor._executed}")
+
+    return {str(result[0]) for result in cursor.fetchall()}
+
+
+def get_invalid_record_ids(corporate_account, project_id, req_type, record_ids):
+    """
+    Batch form of validate_integration_id / validate_req_id / validate_usecase_id / validate_raid_log_entry.
+    Returns the ids in record_ids that do not exist for req_type, with one IN query per table.
+    """
+    connection2 = None
+    invalid_record_ids = list(record_ids)
+
+    if not record_ids:
+        return invalid_record_ids
+
+    try:
+        connection2 = get_read_connection(stale_ok=False, corporate_account=corporate_account)
+        cursor2 = connection2.cursor()
+
+        if req_type == 'INTEGRATION':
+            existing_ids = get_existing_record_ids(cursor2, 'INTEGRATION_REQUIREMENTS', 'INTEGRATION_ID',
+                                                   corporate_account, project_id, record_ids)
+        elif req_type == 'REQUIREMENT':
+            existing_ids = get_existing_record_ids(cursor2, 'REQUIREMENTS', 'REQ_ID',
+                                                   corporate_account, project_id, record_ids)
+            remaining_ids = [record_id for record_id in record_ids if str(record_id) not in existing_ids]
+            existing_ids |= get_existing_record_ids(cursor2, 'INTEGRATION_REQUIREMENTS', 'INTEGRATION_ID',
+                                                    corporate_account, project_id, remaining_ids)
+        elif req_type == 'USECASE':
+            existing_ids = get_existing_record_ids(cursor2, 'REQUIREMENTS_USECASES', 'USECASE_ID',
+                                                   corporate_account, project_id, record_ids)
+        else:
+            existing_ids = get_existing_record_ids(cursor2, 'RAID_LOG', 'RAID_ID', corporate_account,
+                                                   project_id, record_ids, filters={'RAID_TYPE': req_type})
+
+        invalid_record_ids = [record_id for record_id in record_ids if str(record_id) not in existing_ids]
+
+    except mysql.connector.Error as error:
+        logging.info(error)
+
+    finally:
+        if connection2 and connection2.is_connected():
+            cursor2.close()
+            connection2.close()
+
+    return invalid_record_ids
+
+
 def is_valid_field_name(field_name):
     # Regular expression to allow only alphanumeric characters and underscores
     pattern = r'^[a-zA-Z0-9_]+$'
@@ -623,10 +652,7 @@ def validate_integration_field(corporate_account, project_id, field_name, integr
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         sts = True
@@ -707,10 +733,7 @@ def validate_product_id(corporate_account, project_id, product_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
 
         mySql_select_query = "SELECT * FROM PRODUCTS_BY_PROJECT WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND PRODUCT_ID = %s"
@@ -745,10 +768,7 @@ def validate_req_classification(req_classification):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection()
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT * FROM REQUIREMENT_CLASSIFICATION WHERE REQ_CLASSIFICATION = %s"
 
@@ -791,7 +811,7 @@ def is_user_authorized_to_approve(
     # Connect to the database
     # Note: In a production environment, use connection pooling
     logging.info("Authorization validation - 0")
-    conn = get_database_connection()
+    conn = get_database_connection(corporate_account)
     logging.info("Authorization validation - 1")
     try:
         with conn.cursor() as cursor:
@@ -818,15 +838,125 @@ def is_user_authorized_to_approve(
         conn.close()
 
 
-def get_database_connection():
-    return mysql.connector.connect(
-        host=config.host,
-        user=config.user,
-        password=config.password,
-        database=config.database
-        # charset='utf8mb4',
-        # cursorclass=pymysql.cursors.DictCursor
-    )
+def get_approval_authorization(corporate_account, project_id, approval_user_id, req_ids):
+    """
+    Set-based counterpart of is_user_authorized_to_approve for a list of requirement ids.
+    Loads the approver's grants once, resolves every requirement level in one query and walks
+    the project's level tree in memory, so the number of queries does not grow with req_ids.
+    Returns (invalid_req_ids, unauthorized_req_ids), both in the order they were supplied.
+    """
+    invalid_req_ids = []
+    unauthorized_req_ids = []
+
+    if not req_ids:
+        return invalid_req_ids, unauthorized_req_ids
+
+    placeholders = ','.join(['%s'] * len(req_ids))
+    conn = get_database_connection(corporate_account)
+    try:
+        with conn.cursor() as cursor:
+            # 1. Every grant held by the approver in this project
+            cursor.execute("""
+                SELECT REQ_ID, LEVEL_ID FROM REQUIREMENTS_APPROVERS
+                WHERE CORPORATE_ACCOUNT = %s
+                AND PROJECT_ID = %s
+                AND APPROVAL_USER_ID = %s
+                """, (corporate_account, project_id, approval_user_id))
+            grants = cursor.fetchall()
+
+            project_level_grant = any(str(req_id) == '0' and str(level_id) == '0' for req_id, level_id in grants)
+            req_grants = {str(req_id) for req_id, level_id in grants if str(req_id) != '0' and str(level_id) == '0'}
+            level_grants = {str(level_id) for req_id, level_id in grants if str(req_id) == '0' and str(level_id) != '0'}
+
+            # 2. Functional level of every requirement; REQUIREMENTS wins over INTEGRATION_REQUIREMENTS
+            cursor.execute(f"""
+                SELECT INTEGRATION_ID, LEVEL_ID, 2 FROM INTEGRATION_REQUIREMENTS
+                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN ({placeholders})
+                UNION ALL
+                SELECT REQ_ID, LEVEL_ID, 1 FROM REQUIREMENTS
+                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN ({placeholders})
+                """, (corporate_account, project_id) + tuple(req_ids) + (corporate_account, project_id) + tuple(req_ids))
+            logging.info(f" executed SQL is: {cursor._executed}")
+
+            req_levels = {}
+            for req_id, req_level_id, source in sorted(cursor.fetchall(), key=lambda row: -row[2]):
+                req_levels[str(req_id)] = str(req_level_id)
+
+            invalid_req_ids = [req_id for req_id in req_ids if str(req_id) not in req_levels]
+            if project_level_grant:
+                return invalid_req_ids, unauthorized_req_ids
+
+            # 3. The project's level tree, only when a level grant could apply
+            parent_levels = {}
+            if level_grants:
+                cursor.execute("""
+                    SELECT LEVEL_ID, PARENT_LEVEL_ID FROM FUNCTIONAL_LEVELS
+                    WHERE CORPORATE_ACCOUNT = %s
+                    AND PROJECT_ID = %s
+                    """, (corporate_account, project_id))
+                parent_levels = {str(level_id): str(parent_level_id) for level_id, parent_level_id in cursor.fetchall()}
+
+            authorized_levels = {}
+            for req_id in req_ids:
+                if str(req_id) not in req_levels or str(req_id) in req_grants:
+                    continue
+
+                # Same walk as get_level_hierarchy_path, against the in-memory tree
+                current_level_id = req_levels[str(req_id)]
+                visited_levels = []
+                authorized = False
+                depth = 0
+                while current_level_id != '0' and depth < 100:
+                    if current_level_id in authorized_levels:
+                        authorized = authorized_levels[current_level_id]
+                        break
+                    visited_levels.append(current_level_id)
+                    if current_level_id in level_grants:
+                        authorized = True
+                        break
+                    if current_level_id not in parent_levels:
+                        break
+                    current_level_id = parent_levels[current_level_id]
+                    depth += 1
+
+                for visited_level_id in visited_levels:
+                    authorized_levels[visited_level_id] = authorized
+
+                if not authorized:
+                    unauthorized_req_ids.append(req_id)
+    finally:
+        conn.close()
+
+    return invalid_req_ids, unauthorized_req_ids
+
+
+def get_database_connection(corporate_account=None):
+    # Approval authorization reads access rules, which must not lag behind the primary
+    return get_read_connection(stale_ok=False, corporate_account=corporate_account)
+
+
+def get_user_shard(user_id):
+    """
+    Shard holding the user's USER_ACCOUNTS row, for lookups by user id alone (login, user info,
+    uniqueness). None when the user is not found or all accounts share one database.
+    """
+    if not sharding_enabled():
+        return None
+
+    for shard in shard_names():
+        connection = get_read_connection(stale_ok=False, shard=shard)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT CORPORATE_ACCOUNT FROM USER_ACCOUNTS WHERE USER_ID = %s", (user_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        # Rows of an account being moved exist on both shards until the source is purged
+        if any(shard_for(row[0]) == shard for row in rows):
+            return shard
+
+    return None
 
 
 def get_user_api_access_level(user_id, corporate_account, project_id, api_name):
@@ -841,10 +971,7 @@ def get_user_api_access_level(user_id, corporate_account, project_id, api_name):
     cursor3 = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(stale_ok=False, corporate_account=corporate_account)
         cursor1 = connection.cursor()
 
         # First query - check USER_PROJECTS
@@ -1063,10 +1190,7 @@ def validate_functional_domain(corporate_account, functional_domain):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT * FROM FUNCTIONAL_DOMAINS WHERE FUNCTIONAL_DOMAIN = %s AND CORPORATE_ACCOUNT = %s"
 
@@ -1096,10 +1220,7 @@ def validate_project_prefix(corporate_account, project_id, project_prefix):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT COUNT(*) FROM CORPORATE_ACCOUNT_PROJECTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID != %s AND PROJECT_PREFIX = %s"
 
@@ -1133,10 +1254,7 @@ def get_project_prefix(corporate_account, project_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT PROJECT_PREFIX FROM CORPORATE_ACCOUNT_PROJECTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"
 
@@ -1165,10 +1283,7 @@ def validate_functional_level(corporate_account, project_id, level_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT * FROM FUNCTIONAL_LEVELS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND LEVEL_ID = %s"
 
@@ -1211,10 +1326,7 @@ def get_functional_level_dependency_details(corporate_account, project_id, level
     sub_level_count = 0
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(corporate_account=corporate_account)
         cursor = connection.cursor()
 
         mySql_select_query = """WITH RECURSIVE SUBLEVEL_TREE AS
@@ -1304,10 +1416,7 @@ def get_functional_level_children(corporate_account, project_id, level_id):
         return []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection(corporate_account=corporate_account)
         cursor = connection.cursor()
 
         # Query to get all child level IDs
@@ -1342,10 +1451,7 @@ def validate_functional_attribute_category(corporate_account, project_id, attrib
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = "SELECT * FROM KEY_ATTRIBUTES_HEADER WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND ATTRIBUTE_CATEGORY = %s"
 
@@ -1379,10 +1485,7 @@ def get_functional_level_details(corporate_account, project_id, level_id):
     connection2 = None
 
     try:
-        connection2 = mysql.connector.connect(host=config.host,
-                                              database=config.database,
-                                              user=config.user,
-                                              password=config.password)
+        connection2 = get_read_connection(corporate_account=corporate_account)
         cursor2 = connection2.cursor()
         mySql_select_query = """
             SELECT LEVEL_ID, LEVEL_DESCRIPTION, PARENT_LEVEL_ID
@@ -0,0 +1,59 @@
+# gunicorn.conf.py
+#
+# Production server for main_prod.py: a gunicorn master that pre-forks worker processes, each
+# serving requests on a pool of threads. Run from the APIs folder with either of
+#     gunicorn main_prod:app
+#     python main_prod.py
+#
+# The master imports the app once (preload_app) and forks the workers from it. Each worker then
+# opens its database pools, fills the reference caches and starts its background threads (see
+# app_factory.warm_up / start_background_services) before it accepts its first connection.
+#
+# Reloading without dropping requests (the master's pid is in PIDFILE):
+#   kill -HUP <pid>    new workers are started and warmed, then the old ones finish their in-flight
+#                      requests (up to graceful_timeout) and exit. Picks up changes to this file but
+#                      not to the code, which the master loaded once.
+#   kill -USR2 <pid>   for a code deploy: starts a second master on the new code alongside the old
+#                      one. Once it is serving, `kill -QUIT <old pid>` drains and stops the old one.
+#   kill -TERM <pid>   graceful shutdown.
+#
+# Open /api/events streams hold a worker thread each. change_events caps them per worker
+# (CHANGE_EVENTS_MAX_STREAMS) and ends each after CHANGE_EVENTS_MAX_STREAM_SECONDS; streams still
+# open at a reload are cut at graceful_timeout. Either way the page resumes with last_event_id.
+# Deployments with many streams should use asgi_app.py.
+import os
+
+import config
+
+
+def _cpu_count():
+    # CPUs this process may run on, which is what a container limit shows up as
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+pidfile = getattr(config, 'PIDFILE', None)
+
+# Requests mostly wait on MySQL, so each CPU gets two processes and each process a few threads.
+# db_routing.DB_POOL_SIZE should be at least the thread count.
+workers = getattr(config, 'WEB_WORKERS', None) or _cpu_count() * 2 + 1
+worker_class = 'gthread'
+threads = getattr(config, 'WEB_THREADS', 4)
+
+preload_app = True
+timeout = getattr(config, 'WEB_TIMEOUT', 120)
+graceful_timeout = getattr(config, 'WEB_GRACEFUL_TIMEOUT', 30)
+keepalive = 5
+
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # Runs in the new worker after the fork and before its first request
+    from app_factory import start_background_services, warm_up
+
+    warm_up()
+    start_background_services()
+    worker.log.info(f"Worker {worker.pid} warmed up")
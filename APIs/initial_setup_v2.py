@@ -1,13 +1,11 @@
 import re
-from flask import Flask, request, jsonify, Blueprint
-from flask_cors import CORS
+from flask import request, jsonify, Blueprint
 import mysql.connector
-import config
+from db_routing import get_connection, get_read_connection
 from datetime import datetime, timedelta
 import logging
 import jwt
 from config import TOKEN_EXPIRY_DAYS
-from argon2 import PasswordHasher
 from functools import wraps
 from access_validation_at_api_level import validate_access
 
@@ -16,6 +14,9 @@ from access_validation_at_api_level import validate_access
 from config import SECRET_KEY
 from foundational_v2 import generate_next_sequence , validate_corporate_account, validate_project_id, validate_functional_domain,  validate_user_id, validate_functional_level, get_functional_level_dependency_details, validate_functional_attribute_category, get_functional_level_details, validate_level_id
 from utils import token_required
+from change_events import publishes_change, record_change, CREATED, UPDATED, DELETED
+from list_etags import conditional_list, report_list_status
+from delta_sync import log_deletions, FUNCTIONAL_LEVEL
 
 
 # Create a blueprint for user-related routes
@@ -23,15 +24,13 @@ initialsetup_blueprint = Blueprint('initialsetup', __name__)
 
 
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": ["http://localhost:3000"]}})
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 
 
 
 @initialsetup_blueprint.route('/api/create_business_team', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('business_team', CREATED)
 def create_business_team(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -66,10 +65,7 @@ def create_business_team(current_user):
     sts_description = "Business team added successfully"
     business_team_id = None
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO BUSINESS_TEAMS (CORPORATE_ACCOUNT, PROJECT_ID, BUSINESS_TEAM_ID, BUSINESS_TEAM_DESCRIPTION, 
         STATUS, CREATED_DATE, UPDATED_DATE)
@@ -86,6 +82,7 @@ def create_business_team(current_user):
             })
         record = (corporate_account, project_id, business_team_id,  business_team_description, 'Active', datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, business_team_id=business_team_id)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -115,6 +112,7 @@ def create_business_team(current_user):
 @initialsetup_blueprint.route('/api/update_business_team', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('business_team', UPDATED)
 def update_business_team(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -156,10 +154,7 @@ def update_business_team(current_user):
     sts = "Success"
     sts_description = "Business team details updated successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """UPDATE BUSINESS_TEAMS SET BUSINESS_TEAM_DESCRIPTION = %s, UPDATED_DATE = %s WHERE 
         CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND BUSINESS_TEAM_ID = %s """
@@ -167,10 +162,12 @@ def update_business_team(current_user):
 
         record = (business_team_description, datetime.now(), corporate_account, project_id, business_team_id)
         cursor.execute(mySql_insert_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
 
-        rows_impacted = cursor.rowcount
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching business team found to update"
@@ -202,6 +199,7 @@ def update_business_team(current_user):
 @initialsetup_blueprint.route('/api/delete_business_team', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('business_team', DELETED)
 def delete_business_team(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -242,10 +240,7 @@ def delete_business_team(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -269,6 +264,7 @@ def delete_business_team(current_user):
             sts_description = "No matching business teams found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} business team(s)"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -310,10 +306,7 @@ def get_business_team_details(current_user):
     updated_date = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT BUSINESS_TEAM_DESCRIPTION, STATUS, CREATED_DATE, UPDATED_DATE FROM BUSINESS_TEAMS 
         WHERE BUSINESS_TEAM_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -371,10 +364,7 @@ def get_business_team_list(current_user):
     business_team_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT BUSINESS_TEAM_ID, BUSINESS_TEAM_DESCRIPTION,
         STATUS, CREATED_DATE, UPDATED_DATE FROM BUSINESS_TEAMS
@@ -425,6 +415,7 @@ def get_business_team_list(current_user):
 
 @initialsetup_blueprint.route('/api/get_functional_levels', methods=['GET', 'POST'])
 @token_required
+@conditional_list('functional_levels')
 def get_functional_levels(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -451,10 +442,7 @@ def get_functional_levels(current_user):
     parent_of_parent = '0'
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         logging.info(f"Before the first IF -->> parent level Id: {parent_level_id}")
 
@@ -654,6 +642,7 @@ def get_functional_levels(current_user):
             cursor.close()
             connection.close()
 
+    report_list_status(sts)
     return jsonify({
         'functional_level_list': functional_level_list,
         'parent_of_parent': parent_of_parent,
@@ -682,10 +671,7 @@ def get_functional_level_path(current_user):
     hierarchy_path = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         current_level = get_functional_level_details(corporate_account, project_id, level_id)
@@ -732,6 +718,7 @@ def get_functional_level_path(current_user):
 @initialsetup_blueprint.route('/api/create_functional_level', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('functional_level', CREATED)
 def create_functional_level(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -778,10 +765,7 @@ def create_functional_level(current_user):
     sts_description = "Functional level added successfully"
     level_id = None
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_select_query = f"""SELECT COUNT(*) FROM FUNCTIONAL_LEVELS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s """
@@ -824,6 +808,7 @@ def create_functional_level(current_user):
             })
         record = (corporate_account, project_id, level_id,   parent_level_id, level_description, 'Active', datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, level_id=level_id)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -856,6 +841,7 @@ def create_functional_level(current_user):
 @initialsetup_blueprint.route('/api/update_functional_level', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('functional_level', UPDATED)
 def update_functional_level(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -895,10 +881,7 @@ def update_functional_level(current_user):
     sts = "Success"
     sts_description = "Functional level updated successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """UPDATE FUNCTIONAL_LEVELS SET LEVEL_DESCRIPTION = %s, UPDATED_DATE = %s WHERE 
         CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND LEVEL_ID = %s """
@@ -906,10 +889,12 @@ def update_functional_level(current_user):
 
         record = (level_description, datetime.now(), corporate_account, project_id, level_id)
         cursor.execute(mySql_insert_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
 
-        rows_impacted = cursor.rowcount
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching functional level found to update"
@@ -943,6 +928,7 @@ def update_functional_level(current_user):
 @initialsetup_blueprint.route('/api/delete_functional_level', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('functional_level', DELETED)
 def delete_functional_level(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1004,10 +990,7 @@ def delete_functional_level(current_user):
     deleted_count = 0
     connection = None
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -1015,14 +998,18 @@ def delete_functional_level(current_user):
 
         # Prepare the SQL query with multiple placeholders
         placeholders = ','.join(['%s'] * len(level_ids))
-        mySql_delete_query = f"""DELETE FROM FUNCTIONAL_LEVELS
-            WHERE CORPORATE_ACCOUNT = %s 
+        where_clause = f"""CORPORATE_ACCOUNT = %s 
             AND PROJECT_ID = %s 
             AND LEVEL_ID IN ({placeholders})"""
+        mySql_delete_query = f"""DELETE FROM FUNCTIONAL_LEVELS
+            WHERE {where_clause}"""
 
         # Prepare parameters: corporate_account, project_id, followed by all level_ids
         record = (corporate_account, project_id, *level_ids)
 
+        # Tombstones for delta sync, committed with the delete
+        log_deletions(cursor, FUNCTIONAL_LEVEL, 'FUNCTIONAL_LEVELS', 'LEVEL_ID', where_clause, record,
+                      current_user['user_id'], parent_column='PARENT_LEVEL_ID')
         cursor.execute(mySql_delete_query, record)
         deleted_count = cursor.rowcount
 
@@ -1031,6 +1018,7 @@ def delete_functional_level(current_user):
             sts_description = "No matching functional levels found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} functional level(s)"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -1125,10 +1113,7 @@ def get_key_functional_attribute_categories(current_user):
     attribute_category_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT ATTRIBUTE_CATEGORY, CATEGORY_DESCRIPTION,
         CREATED_DATE, UPDATED_DATE FROM KEY_ATTRIBUTES_HEADER
@@ -1203,10 +1188,7 @@ def get_key_functional_attributes(current_user):
     attribute_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT ATTRIBUTE_CATEGORY, ATTRIBUTE_NAME, ATTRIBUTE_DESCRIPTION,
         CREATED_DATE, UPDATED_DATE, KEY_ATTRIBUTE_LIST_ID FROM KEY_ATTRIBUTES_LIST
@@ -1270,6 +1252,7 @@ def get_key_functional_attributes(current_user):
 @initialsetup_blueprint.route('/api/create_key_functional_attribute_categories', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute_category', CREATED)
 def create_key_functional_attribute_categories(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1310,16 +1293,14 @@ def create_key_functional_attribute_categories(current_user):
     sts_description = "Exception category added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO KEY_ATTRIBUTES_HEADER (CORPORATE_ACCOUNT, PROJECT_ID, ATTRIBUTE_CATEGORY, CATEGORY_DESCRIPTION, CREATED_DATE, UPDATED_DATE)
         VALUES (%s, %s, %s, %s, %s, %s) """
 
         record = (corporate_account, project_id, attribute_category, category_description,datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1349,6 +1330,7 @@ def create_key_functional_attribute_categories(current_user):
 @initialsetup_blueprint.route('/api/create_key_functional_attribute', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute', CREATED)
 def create_key_functional_attribute(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1410,10 +1392,7 @@ def create_key_functional_attribute(current_user):
     sts_description = "Exception value added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Using parameterized query to prevent SQL injection
@@ -1437,6 +1416,7 @@ def create_key_functional_attribute(current_user):
         )
 
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1468,6 +1448,7 @@ def create_key_functional_attribute(current_user):
 @initialsetup_blueprint.route('/api/update_key_functional_attribute_categories', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute_category', UPDATED)
 def update_key_functional_attribute_categories(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1518,10 +1499,7 @@ def update_key_functional_attribute_categories(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """UPDATE KEY_ATTRIBUTES_HEADER SET CATEGORY_DESCRIPTION = %s, UPDATED_DATE = %s WHERE 
@@ -1530,10 +1508,12 @@ def update_key_functional_attribute_categories(current_user):
 
         record = (category_description, datetime.now(), corporate_account, project_id, attribute_category)
         cursor.execute(mySql_insert_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
 
-        rows_impacted = cursor.rowcount
         if rows_impacted == 0:
             logging.info('hello 1')
             sts = "Failed"
@@ -1567,6 +1547,7 @@ def update_key_functional_attribute_categories(current_user):
 @initialsetup_blueprint.route('/api/update_key_functional_attribute', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute', UPDATED)
 def update_key_functional_attribute(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1627,19 +1608,18 @@ def update_key_functional_attribute(current_user):
     #sts = "Failed"
     sts_description = "Exception value updated successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """UPDATE KEY_ATTRIBUTES_LIST SET ATTRIBUTE_DESCRIPTION = %s,  ATTRIBUTE_CATEGORY = %s, ATTRIBUTE_NAME = %s, UPDATED_DATE = %s WHERE 
 CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND KEY_ATTRIBUTE_LIST_ID = %s  """
 
         record = (attribute_description, attribute_category, attribute_name, datetime.now(), corporate_account, project_id, key_attribute_list_id)
         cursor.execute(mySql_insert_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
-        rows_impacted = cursor.rowcount
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching exception found to update"
@@ -1673,6 +1653,7 @@ CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND KEY_ATTRIBUTE_LIST_ID = %s  """
 @initialsetup_blueprint.route('/api/delete_key_functional_attribute_categories', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute_category', DELETED)
 def delete_key_functional_attribute_categories(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1716,10 +1697,7 @@ def delete_key_functional_attribute_categories(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -1740,6 +1718,7 @@ def delete_key_functional_attribute_categories(current_user):
             sts_description = "No matching exception categories found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} exception categories"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -1768,6 +1747,7 @@ def delete_key_functional_attribute_categories(current_user):
 @initialsetup_blueprint.route('/api/delete_key_functional_attribute', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_functional_attribute', DELETED)
 def delete_key_functional_attribute(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1824,10 +1804,7 @@ def delete_key_functional_attribute(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -1848,6 +1825,7 @@ def delete_key_functional_attribute(current_user):
             sts_description = "No matching exception values found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} exception value(s)"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -1874,6 +1852,7 @@ def delete_key_functional_attribute(current_user):
 @initialsetup_blueprint.route('/api/create_status', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('status', CREATED)
 def create_status(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1916,16 +1895,14 @@ def create_status(current_user):
     sts_description = "Status added successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """insert into ACCOUNT_STATUSES (CORPORATE_ACCOUNT, PROJECT_ID, ENTITY, STATUS, CREATED_DATE, UPDATED_DATE)
         values (%s, %s, %s, %s, %s , %s ) """
 
         record = (corporate_account, project_id,  entity, status,datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1954,6 +1931,7 @@ def create_status(current_user):
 @initialsetup_blueprint.route('/api/delete_status', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('status', DELETED)
 def delete_status(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2000,10 +1978,7 @@ def delete_status(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -2046,6 +2021,7 @@ def delete_status(current_user):
             sts_description = "No matching statuses found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} status(es)"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -2071,6 +2047,7 @@ def delete_status(current_user):
 @initialsetup_blueprint.route('/api/delete_requirement_status', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('status', DELETED)
 def delete_requirement_status(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2116,10 +2093,7 @@ def delete_requirement_status(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -2140,6 +2114,7 @@ def delete_requirement_status(current_user):
             sts_description = "No matching statuses found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} statuses"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -2166,6 +2141,7 @@ def delete_requirement_status(current_user):
 
 @initialsetup_blueprint.route('/api/get_statuses', methods=['GET', 'POST'])
 @token_required
+@conditional_list('statuses')
 def get_statuses(current_user):
 
     data = request.json
@@ -2185,10 +2161,7 @@ def get_statuses(current_user):
     status_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT  STATUS, CREATED_DATE, UPDATED_DATE FROM ACCOUNT_STATUSES WHERE ENTITY = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s  """
 
@@ -2228,6 +2201,7 @@ def get_statuses(current_user):
             cursor.close()
             connection.close()
 
+    report_list_status(sts)
     return jsonify({
         'entity_statuses': status_list,
         'status': sts,
@@ -2250,10 +2224,7 @@ def get_status_headers(current_user):
     status_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT  DISTINCT ENTITY FROM ACCOUNT_STATUSES WHERE  CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s """
         record = (corporate_account, project_id)
@@ -2293,6 +2264,10 @@ def get_status_headers(current_user):
 
 
 if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.register_blueprint(initialsetup_blueprint)
     app.run(debug=True)
 
 
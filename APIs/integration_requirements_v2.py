@@ -1,11 +1,17 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint
 import mysql.connector
 from datetime import datetime
-import config
+from db_routing import get_connection, get_read_connection
 import logging
 from foundational_v2 import generate_next_sequence, validate_project_id, validate_level_id, validate_req_id, validate_status, validate_user_id, is_valid_field_name, get_functional_level_children, validate_product_id
 from foundational_v2 import validate_corporate_account, validate_usecase_id, validate_testcase_id,  validate_key_attribute_list_id, validate_integration_system_id, validate_integration_id, validate_integration_field
 from utils import token_required
+from change_events import publishes_change, record_change, record_change_event, wake_change_dispatcher, CREATED, \
+    UPDATED, DELETED
+from delta_sync import parse_updated_since, get_sync_watermark, get_deleted_records, changed_requirements_condition, \
+    FUNCTIONAL_LEVEL
+from upload_attachment import copy_requirement_attachments
+from background_jobs import enqueue_job, register_job_handler, JobCancelled
 from access_validation_at_api_level import validate_access
 import os
 import uuid
@@ -13,9 +19,6 @@ import uuid
 # Create a blueprint for user-related routes
 integration_requirements_blueprint = Blueprint('integration_requirements', __name__)
 
-app = Flask(__name__)
-
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 
 @integration_requirements_blueprint.route('/api/create_integration_system_OLD', methods=['POST'])
 @token_required
@@ -59,10 +62,7 @@ def create_integration_system_OLD(current_user):
     sts_description = "System name added successfully"
     system_id = None
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO INTEGRATION_SYSTEMS (CORPORATE_ACCOUNT, PROJECT_ID, SYSTEM_ID, SYSTEM_NAME, SYSTEM_DESCRIPTION, SYSTEM_ACRONYM, STATUS, CREATED_DATE, UPDATED_DATE)
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) """
@@ -153,10 +153,7 @@ def update_integration_system_OLD(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE INTEGRATION_SYSTEMS SET SYSTEM_NAME = %s, SYSTEM_DESCRIPTION = %s, SYSTEM_ACRONYM = %s, STATUS = %s, UPDATED_DATE = %s WHERE SYSTEM_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
         record = (system_name, system_description, system_acronym, status, datetime.now(), system_id, corporate_account, project_id )
@@ -228,10 +225,7 @@ def get_integration_systems_list_OLD(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = f"""SELECT A.SYSTEM_ID, A.SYSTEM_NAME, A.SYSTEM_DESCRIPTION, A.SYSTEM_ACRONYM, A.STATUS,
@@ -305,10 +299,7 @@ def get_integration_system_details_OLD(current_user):
     integration_system_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT SYSTEM_ID, CORPORATE_ACCOUNT, PROJECT_ID, SYSTEM_NAME, SYSTEM_DESCRIPTION, SYSTEM_ACRONYM, STATUS, CREATED_DATE, UPDATED_DATE 
         FROM INTEGRATION_SYSTEMS WHERE SYSTEM_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -379,10 +370,7 @@ def delete_integration_system_OLD(current_user):
     sts = "Success"
     sts_description = "Integration system successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """DELETE FROM INTEGRATION_SYSTEMS   
@@ -417,6 +405,7 @@ def delete_integration_system_OLD(current_user):
 @integration_requirements_blueprint.route('/api/create_integration_system', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_system', CREATED)
 def create_integration_system(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -462,10 +451,7 @@ def create_integration_system(current_user):
     system_id = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_insert_query = """INSERT INTO INTEGRATION_SYSTEMS (CORPORATE_ACCOUNT, PROJECT_ID, SYSTEM_ID, SYSTEM_NAME, SYSTEM_DESCRIPTION, SYSTEM_ACRONYM,
                     STATUS, CREATED_DATE, UPDATED_DATE)
@@ -483,6 +469,7 @@ def create_integration_system(current_user):
         record = (corporate_account, project_id, system_id, system_name, system_description, system_acronym,  'Active', datetime.now(), datetime.now())
         logging.info("record = " + str(record))
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, system_id=system_id)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -515,6 +502,7 @@ def create_integration_system(current_user):
 @integration_requirements_blueprint.route('/api/update_integration_system', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_system', UPDATED)
 def update_integration_system(current_user):
     data = request.json
     system_id = data.get('system_id')
@@ -538,17 +526,16 @@ def update_integration_system(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE INTEGRATION_SYSTEMS SET SYSTEM_NAME = %s, SYSTEM_DESCRIPTION = %s, SYSTEM_ACRONYM = %s, 
         UPDATED_DATE = %s WHERE SYSTEM_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
         record = (system_name, system_description, system_acronym, datetime.now(), system_id, corporate_account, project_id )
         cursor.execute(mySql_update_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching integration system found to update"
@@ -587,6 +574,7 @@ def update_integration_system(current_user):
 @integration_requirements_blueprint.route('/api/delete_integration_system', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_system', DELETED)
 def delete_integration_system(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -623,10 +611,7 @@ def delete_integration_system(current_user):
     connection = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Start transaction
@@ -649,6 +634,7 @@ def delete_integration_system(current_user):
             sts_description = "No matching integration systems found to delete"
         else:
             sts_description = f"Successfully deleted {deleted_count} integration systems"
+            record_change(cursor)
 
         # Commit the transaction
         connection.commit()
@@ -690,10 +676,7 @@ def get_integration_system_details(current_user):
     updated_date = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT SYSTEM_NAME, SYSTEM_DESCRIPTION, SYSTEM_ACRONYM, STATUS, CREATED_DATE, UPDATED_DATE FROM INTEGRATION_SYSTEMS
         WHERE SYSTEM_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -757,10 +740,7 @@ def get_integration_systems_list(current_user):
     integration_systems_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT SYSTEM_ID, SYSTEM_NAME, SYSTEM_DESCRIPTION, SYSTEM_ACRONYM, STATUS, CREATED_DATE, UPDATED_DATE FROM INTEGRATION_SYSTEMS
         WHERE STATUS = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s """
@@ -810,6 +790,7 @@ def get_integration_systems_list(current_user):
 @integration_requirements_blueprint.route('/api/create_integration_requirement', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_requirement', CREATED)
 def create_integration_requirement(current_user):
 
     data = request.json
@@ -913,10 +894,7 @@ def create_integration_requirement(current_user):
     sts_description = "Integration requirement added successfully"
     system_id = None
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -994,6 +972,7 @@ def create_integration_requirement(current_user):
 
 
 
+        record_change(cursor, integration_id=integration_id_with_prefix)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1025,6 +1004,7 @@ def create_integration_requirement(current_user):
 @integration_requirements_blueprint.route('/api/update_integration_requirement', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_requirement', UPDATED)
 def update_integration_requirement(current_user):
 
     data = request.json
@@ -1119,10 +1099,7 @@ def update_integration_requirement(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -1178,6 +1155,8 @@ def update_integration_requirement(current_user):
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching integration requirement found to update"
+        else:
+            record_change(cursor)
 
 
 
@@ -1261,6 +1240,40 @@ def copy_integration_requirement(current_user):
             'status_description': 'Invalid status under the target project'
         })
 
+    if data.get('run_in_background', False):
+        try:
+            job_id = enqueue_job('copy_integration_requirement', corporate_account, to_project_id,
+                                 current_user['user_id'], {
+                                     'corporate_account': corporate_account,
+                                     'from_project_id': from_project_id,
+                                     'from_integration_id': from_integration_id,
+                                     'to_project_id': to_project_id,
+                                     'to_level_id': to_level_id,
+                                     'to_status': to_status,
+                                     'copy_attachments': copy_attachments,
+                                     'user_id': current_user['user_id']
+                                 })
+        except Exception as e:
+            logging.error(f"Error queueing integration requirement copy: {str(e)}")
+            return jsonify({
+                'status': 'Failed',
+                'status_description': f"Failed to queue the integration requirement copy: {str(e)}"
+            })
+
+        return jsonify({
+            'job_id': job_id,
+            'status': 'Success',
+            'status_description': 'Integration requirement copy queued'
+        })
+
+    return jsonify(perform_integration_requirement_copy(None, corporate_account, from_project_id, from_integration_id,
+                                                        to_project_id, to_level_id, to_status, copy_attachments,
+                                                        current_user['user_id']))
+
+
+def perform_integration_requirement_copy(job_context, corporate_account, from_project_id, from_integration_id,
+                                         to_project_id, to_level_id, to_status, copy_attachments, user_id):
+    """Copies a validated integration requirement; shared by the endpoint and its background job"""
     sts = "Success"
     sts_description = "Integration successfully copied to the target project"
     attachment_count = 0  # Initialize attachment count
@@ -1268,10 +1281,7 @@ def copy_integration_requirement(current_user):
     to_integration_id_with_prefix = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)  # Changed to dictionary cursor for consistency
 
         # Check if source integration exists
@@ -1290,10 +1300,10 @@ def copy_integration_requirement(current_user):
             if seq_status == "Failed":
                 sts = "Failed"
                 sts_description = seq_status_description
-                return jsonify({
+                return {
                     'status': sts,
                     'status_description': sts_description
-                })
+                }
 
             # Get project prefix
             prefix_query = """SELECT PROJECT_PREFIX FROM CORPORATE_ACCOUNT_PROJECTS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
@@ -1307,11 +1317,11 @@ def copy_integration_requirement(current_user):
                 project_prefix = prefix_result['PROJECT_PREFIX']
 
             if project_prefix is None:
-                return jsonify({
+                return {
                     'integration_id': None,
                     'status': 'Failed',
                     'status_description': 'Requirement prefix not defined'
-                })
+                }
 
             # Create complete integration ID with prefix
             to_integration_id_with_prefix = f"{project_prefix.strip()}-{to_integration_id}"
@@ -1447,92 +1457,20 @@ def copy_integration_requirement(current_user):
                 from_integration_id)
 
             cursor.execute(consumers_query, consumers_params)
+            record_change_event(cursor, corporate_account, to_project_id, 'integration_requirement', CREATED,
+                                {'from_integration_id': from_integration_id,
+                                 'integration_id': to_integration_id_with_prefix}, user_id)
             connection.commit()
+            wake_change_dispatcher()
 
             # Handle attachment copying if requested
             if copy_attachments:
                 logging.info(
                     f"Copying attachments for integration requirement from {from_integration_id} to {to_integration_id}")
 
-                # Get existing attachments
-                attachments_query = """
-                    SELECT * FROM REQUIREMENT_ATTACHMENTS
-                    WHERE CORPORATE_ACCOUNT = %s
-                    AND PROJECT_ID = %s
-                    AND REQ_ID = %s
-                """
-                cursor.execute(attachments_query, (corporate_account, from_project_id, from_integration_id))
-                original_attachments = cursor.fetchall()
-                attachment_count = len(original_attachments)
-
-                logging.info(f"Found {attachment_count} attachments to copy")
-
-                # Process each attachment
-                for attachment in original_attachments:
-                    # Extract original file information
-                    original_file_path = attachment['FILE_PATH']
-                    original_filename = attachment['FILE_NAME']
-
-                    logging.info(f"Processing attachment: {original_filename}, path: {original_file_path}")
-
-                    # Build the full path to the original file
-                    full_original_path = os.path.join(config.ATTACHMENTS_FOLDER_PATH, original_file_path)
-
-                    if not os.path.exists(full_original_path):
-                        logging.warning(f"Original file not found: {full_original_path}")
-                        continue  # Skip if original file doesn't exist
-
-                    # Create a new unique filename but keep the extension
-                    file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-                    unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-
-                    # Create target directory path
-                    target_rel_dir = f"{corporate_account}/{to_project_id}/{to_integration_id}"
-                    target_full_dir = os.path.join(config.ATTACHMENTS_FOLDER_PATH, target_rel_dir)
-
-                    # Ensure the target directory exists
-                    logging.info(f"Creating directory: {target_full_dir}")
-                    os.makedirs(target_full_dir, exist_ok=True)
-
-                    # Create the full path for the new file
-                    target_rel_path = f"{target_rel_dir}/{unique_filename}"
-                    target_full_path = os.path.join(config.ATTACHMENTS_FOLDER_PATH, target_rel_path)
-
-                    logging.info(f"Copying file to: {target_full_path}")
-
-                    # Copy the file
-                    try:
-                        with open(full_original_path, 'rb') as src_file:
-                            file_content = src_file.read()
-                            with open(target_full_path, 'wb') as dest_file:
-                                dest_file.write(file_content)
-
-                        logging.info(f"File copied successfully")
-
-                        # Insert the new attachment record
-                        attachment_insert_query = """
-                            INSERT INTO REQUIREMENT_ATTACHMENTS 
-                            (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOADED_BY)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        attachment_params = (
-                            corporate_account,
-                            to_project_id,
-                            to_integration_id,
-                            original_filename,
-                            target_rel_path,
-                            attachment['FILE_SIZE'],
-                            attachment['FILE_TYPE'],
-                            current_user['user_id']
-                        )
-
-                        cursor.execute(attachment_insert_query, attachment_params)
-                        connection.commit()
-
-                        logging.info(f"Database record created for copied attachment")
-
-                    except Exception as file_error:
-                        logging.error(f"Error copying file: {str(file_error)}")
+                attachment_count = copy_requirement_attachments(connection, cursor, corporate_account, from_project_id,
+                                                                from_integration_id, to_project_id, to_integration_id, user_id,
+                                                                job_context)
 
         else:
             sts = "Failed"
@@ -1547,6 +1485,9 @@ def copy_integration_requirement(current_user):
             sts_description = f"Failed to copy the integration requirement: {error}"
         logging.error(f"Database error copying integration requirement: {error}")
 
+    except JobCancelled:
+        raise
+
     except Exception as e:
         sts = "Failed"
         sts_description = f"Failed to copy the integration requirement: {str(e)}"
@@ -1557,18 +1498,22 @@ def copy_integration_requirement(current_user):
             cursor.close()
             connection.close()
 
-    return jsonify({
+    return {
         'integration_id_with_prefix': to_integration_id_with_prefix,
         'integration_id': to_integration_id,
         'status': sts,
         'status_description': sts_description,
         'attachments_copied': copy_attachments,
         'attachment_count': attachment_count
-    })
+    }
+
+
+register_job_handler('copy_integration_requirement', perform_integration_requirement_copy)
 
 @integration_requirements_blueprint.route('/api/add_integration_requirement_consumer', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_consumer', CREATED)
 def add_integration_requirement_consumer(current_user):
 
     data = request.json
@@ -1611,10 +1556,7 @@ def add_integration_requirement_consumer(current_user):
     sts = "Success"
     sts_description = "System added as consumer/target successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -1622,6 +1564,7 @@ def add_integration_requirement_consumer(current_user):
         CONSUMER_DESCRIPTION, INTEGRATION_TYPE, TARGET_DATA_FORMAT, STATUS, CREATED_DATE, UPDATED_DATE) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) """
         record = (corporate_account, project_id, integration_id, target_or_consumer_system_id, consumer_description, integration_type, target_data_format, status, datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1649,6 +1592,7 @@ def add_integration_requirement_consumer(current_user):
 @integration_requirements_blueprint.route('/api/delete_integration_requirement_consumer', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_consumer', DELETED)
 def delete_integration_requirement_consumer(current_user):
 
     data = request.json
@@ -1676,10 +1620,7 @@ def delete_integration_requirement_consumer(current_user):
     sts = "Success"
     sts_description = "Target/consumer system successfully deleted for the requirement"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -1688,8 +1629,10 @@ def delete_integration_requirement_consumer(current_user):
 
         record = (corporate_account, project_id, integration_id, target_or_consumer_system_id)
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching target/consumer found to delete"
@@ -1713,6 +1656,7 @@ def delete_integration_requirement_consumer(current_user):
 @integration_requirements_blueprint.route('/api/update_integration_requirement_consumer', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_consumer', UPDATED)
 def update_integration_requirement_consumer(current_user):
 
     data = request.json
@@ -1766,18 +1710,17 @@ def update_integration_requirement_consumer(current_user):
     logging.info(f"INSIDE UPDATE CONSUMER DETAILS - 2: {data}")
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE INTEGRATION_REQUIREMENTS_CONSUMERS SET CONSUMER_DESCRIPTION = %s, INTEGRATION_TYPE = %s,  
         STATUS = %s, UPDATED_DATE = %s, TARGET_DATA_FORMAT = %s
         WHERE INTEGRATION_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND TARGET_OR_CONSUMER_SYSTEM_ID = %s"""
         record = (consumer_description, integration_type, status, datetime.now(), target_data_format, integration_id, corporate_account, project_id, target_or_consumer_system_id )
         cursor.execute(mySql_update_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching integration consumer found to update"
@@ -1815,6 +1758,7 @@ def update_integration_requirement_consumer(current_user):
 @integration_requirements_blueprint.route('/api/add_integration_requirement_field', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_field', CREATED)
 def add_integration_requirement_field(current_user):
 
     data = request.json
@@ -1893,10 +1837,7 @@ def add_integration_requirement_field(current_user):
     sts = "Success"
     sts_description = "Integration field added successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """INSERT INTO INTEGRATION_REQUIREMENTS_FIELDS (CORPORATE_ACCOUNT, PROJECT_ID, SYSTEM_ID, SYSTEM_TYPE, FIELD_NAME, FIELD_DESCRIPTION,
@@ -1918,6 +1859,7 @@ def add_integration_requirement_field(current_user):
                   maps_to_provider_system_field_name
                   )
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1946,6 +1888,7 @@ def add_integration_requirement_field(current_user):
 @integration_requirements_blueprint.route('/api/delete_integration_requirement_field', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_field', DELETED)
 def delete_integration_requirement_field(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2044,10 +1987,7 @@ def delete_integration_requirement_field(current_user):
     sts = "Success"
     sts_description = "Integration field successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # mySql_insert_query = """delete from INTEGRATION_REQUIREMENTS_FIELDS where corporate_account = %s and project_id = %s and field_name = %s and integration_id = %s and level_id = %s and req_id = %s """
@@ -2058,8 +1998,10 @@ def delete_integration_requirement_field(current_user):
 
         record = (corporate_account, project_id, field_name, integration_id, system_id, system_type)
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching integration field requirement found to delete"
@@ -2176,10 +2118,7 @@ def update_integration_requirement_field_OLD(current_user):
     sts_description = "Integration field name updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE INTEGRATION_REQUIREMENTS_FIELDS SET FIELD_DESCRIPTION = %s, STATUS = %s, UPDATED_DATE = %s 
        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND FIELD_NAME = %s AND LEVEL_ID = %s AND INTEGRATION_ID = %s AND REQ_ID = %s"""
@@ -2212,6 +2151,7 @@ def update_integration_requirement_field_OLD(current_user):
 @integration_requirements_blueprint.route('/api/update_integration_requirement_field', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_field', UPDATED)
 def update_integration_requirement_field(current_user):
     data = request.json
 
@@ -2287,10 +2227,7 @@ def update_integration_requirement_field(current_user):
     sts_description = "Integration field name updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE INTEGRATION_REQUIREMENTS_FIELDS SET FIELD_DESCRIPTION = %s, STATUS = %s, UPDATED_DATE = %s ,
         FIELD_DATA_TYPE = %s,
@@ -2309,8 +2246,10 @@ def update_integration_requirement_field(current_user):
                   field_data_security, maps_to_provider_system_field_name,
                   corporate_account, project_id, field_name, integration_id, system_id, system_type)
         cursor.execute(mySql_update_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching field name found to update"
@@ -2341,6 +2280,7 @@ def update_integration_requirement_field(current_user):
 @integration_requirements_blueprint.route('/api/copy_integration_requirement_field', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('integration_field', CREATED)
 def copy_integration_requirement_field(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2433,10 +2373,7 @@ def copy_integration_requirement_field(current_user):
     sts = "Success"
     sts_description = "Integration field successfully copied"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_select_query = """SELECT FIELD_NAME FROM INTEGRATION_REQUIREMENTS_FIELDS WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND FIELD_NAME = %s 
@@ -2472,6 +2409,7 @@ def copy_integration_requirement_field(current_user):
             record = (to_project_id, to_field_name, to_integration_id, to_status, corporate_account, from_project_id,
                       from_integration_id, from_field_name, from_system_id, from_system_type)
             cursor.execute(mySql_insert_query, record)
+            record_change(cursor)
             connection.commit()
 
         else:
@@ -2567,10 +2505,7 @@ def get_integration_requirement_field_list(current_user):
     sort_criteria = 'FIELD_NAME ASC'  # Default sort criteria if not provided
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = f"""SELECT 
@@ -2648,6 +2583,7 @@ def get_integration_requirement_field_list(current_user):
 @integration_requirements_blueprint.route('/api/create_integration_requirements_mapping_to_functional_requirement_NR', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('integration_requirement_mapping', CREATED)
 def create_integration_requirements_mapping_to_functional_requirement_NR(current_user):
 
     data = request.json
@@ -2710,10 +2646,7 @@ def create_integration_requirements_mapping_to_functional_requirement_NR(current
     sts = "Success"
     sts_description = "Integration mapping to functional requirement created successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -2721,6 +2654,7 @@ def create_integration_requirements_mapping_to_functional_requirement_NR(current
         TARGET_OR_CONSUMER_SYSTEM_ID, LEVEL_ID, REQ_ID, STATUS, CREATED_DATE, UPDATED_DATE) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) """
         record = (corporate_account, project_id, integration_id, target_or_consumer_system_id, level_id, req_id, 'Created', datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -2744,6 +2678,7 @@ def create_integration_requirements_mapping_to_functional_requirement_NR(current
 @integration_requirements_blueprint.route('/api/delete_integration_requirements_mapping_to_functional_requirement_NR', methods=['PUT'])
 @token_required
 @validate_access
+@publishes_change('integration_requirement_mapping', DELETED)
 def delete_integration_requirements_mapping_to_functional_requirement_NR(current_user):
 
     data = request.json
@@ -2806,10 +2741,7 @@ def delete_integration_requirements_mapping_to_functional_requirement_NR(current
     sts = "Success"
     sts_description = "Integration mapping to functional requirement successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -2818,8 +2750,10 @@ def delete_integration_requirements_mapping_to_functional_requirement_NR(current
 
         record = (corporate_account, project_id, integration_id, target_or_consumer_system_id, level_id, req_id)
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching integration mapping to functional requirement found to delete"
@@ -2873,10 +2807,7 @@ def get_integration_requirement_details(current_user):
     integration_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.PROJECT_ID, A.INTEGRATION_ID, A.INTEGRATION_NAME, A.INTEGRATION_DESCRIPTION, 
@@ -3032,6 +2963,7 @@ def get_integration_requirement_list(current_user):
     updated_date_start = data.get('updated_date_start')
     updated_date_end = data.get('updated_date_end')
     include_child_levels_flag = data.get('include_child_levels_flag', False)
+    updated_since = data.get('updated_since')
 
     if not validate_corporate_account(corporate_account):
         return jsonify({
@@ -3044,6 +2976,20 @@ def get_integration_requirement_list(current_user):
             'status_description': 'Project Id is not valid'
         })
 
+    if updated_since:
+        try:
+            updated_since = parse_updated_since(updated_since)
+        except ValueError:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'updated_since is not a valid date'
+            })
+        # A delta covers the whole project (or the requirement given in req_id) so an integration that
+        # moved out of the client's filters is still reported; the client applies its filters locally
+        level_id = search_query = None
+        filter_by_status = source_systems = integration_criticality = integration_priority = []
+        created_date_start = created_date_end = updated_date_start = updated_date_end = None
+
     if level_id and not validate_level_id(corporate_account, project_id, level_id):
         return jsonify({
             'status': 'Failed',
@@ -3072,6 +3018,8 @@ def get_integration_requirement_list(current_user):
     sts_description = "Integrations list retrieved successfully"
     integration_details = {}
     integration_list = []
+    deleted_records = []
+    sync_watermark = None
 
     # Add child levels processing
     level_condition = ""
@@ -3109,12 +3057,14 @@ def get_integration_requirement_list(current_user):
     params = [corporate_account, project_id]
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
+        sync_watermark = get_sync_watermark(cursor)
+        if updated_since:
+            deleted_records = get_deleted_records(cursor, corporate_account, project_id, [FUNCTIONAL_LEVEL],
+                                                  updated_since)
+
         if (req_id == 0):
             # Base query for requirements without mapping
             mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.PROJECT_ID, A.LEVEL_ID, C.LEVEL_DESCRIPTION, A.INTEGRATION_ID, A.INTEGRATION_ID_WITH_PREFIX, 
@@ -3143,6 +3093,13 @@ def get_integration_requirement_list(current_user):
              AND A.CORPORATE_ACCOUNT = %s AND A.PROJECT_ID = %s AND A.INTEGRATION_ID = %s"""
             params.append(req_id)
 
+        if updated_since:
+            delta_condition, delta_params = changed_requirements_condition('A', 'INTEGRATION_REQUIREMENTS',
+                                                                           'INTEGRATION_ID', corporate_account,
+                                                                           project_id, updated_since)
+            mySql_select_query += delta_condition
+            params.extend(delta_params)
+
         # Add status filter
         if filter_by_status and len(filter_by_status) > 0:
             placeholders = ','.join(['%s'] * len(filter_by_status))
@@ -3389,7 +3346,7 @@ def get_integration_requirement_list(current_user):
             }
             integration_list.append(integration_details)
 
-        if len(integration_list) == 0:
+        if len(integration_list) == 0 and not updated_since:
             sts = "Failed"
             sts_description = "No matching integration found"
 
@@ -3405,6 +3362,8 @@ def get_integration_requirement_list(current_user):
 
     return jsonify({
         'integration_list': integration_list,
+        'deleted_records': deleted_records,
+        'sync_watermark': sync_watermark,
         'status': sts,
         'status_description': sts_description
     })
@@ -3445,10 +3404,7 @@ def get_integration_requirement_list_by_field_name(current_user):
     integration_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.PROJECT_ID, A.INTEGRATION_ID, A.INTEGRATION_NAME, A.INTEGRATION_DESCRIPTION, 
         A.STATUS INTEGRATION_STATUS, A.CREATED_DATE, A.UPDATED_DATE,
@@ -3540,10 +3496,7 @@ def get_integration_requirement_list_by_system(current_user):
     integration_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT A.CORPORATE_ACCOUNT, A.PROJECT_ID, A.INTEGRATION_ID, A.INTEGRATION_NAME, A.INTEGRATION_DESCRIPTION, 
         A.STATUS INTEGRATION_STATUS, A.CREATED_DATE, A.UPDATED_DATE,
@@ -3601,6 +3554,10 @@ def get_integration_requirement_list_by_system(current_user):
     })
 
 if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.register_blueprint(integration_requirements_blueprint)
     app.run(debug=True)
 
 
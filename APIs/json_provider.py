@@ -0,0 +1,90 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+
+from flask.json.provider import DefaultJSONProvider
+import config
+
+# JSON provider backed by orjson when it is installed, the stdlib encoder otherwise.
+# Both paths format values the same way Flask always has: datetimes and dates as HTTP dates
+# (or ISO 8601 with config.JSON_DATETIME_FORMAT = 'iso'), Decimal and UUID as strings,
+# keys sorted.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_DATETIME_FORMAT = getattr(config, 'JSON_DATETIME_FORMAT', 'http')
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+    if JSON_DATETIME_FORMAT != 'iso':
+        # orjson writes ISO 8601 itself; HTTP dates go through json_default
+        ORJSON_OPTIONS |= orjson.OPT_PASSTHROUGH_DATETIME
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(value):
+    """Same output as werkzeug.http.http_date (naive values are taken as UTC), without its overhead"""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return f"{_WEEKDAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} {value.year:04d} " \
+           f"{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT"
+
+
+def json_default(o):
+    """Serialise the types the encoders do not handle natively"""
+    if isinstance(o, (datetime, date)):
+        return o.isoformat() if JSON_DATETIME_FORMAT == 'iso' else http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Compact, key-sorted UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers wider than 64 bits; the stdlib encoder copes
+            pass
+    return json.dumps(obj, default=json_default, sort_keys=True, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Drop-in replacement for Flask's DefaultJSONProvider"""
+
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        # orjson.JSONDecodeError is a ValueError, so request.get_json error handling is unchanged
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    """Install the fast JSON provider on the Flask app"""
+    app.json = FastJSONProvider(app)
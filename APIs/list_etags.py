@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+import mysql.connector
+from flask import current_app, g, make_response, request
+
+from db_routing import REPLICA_MAX_LAG_SECONDS, get_read_connection, has_replicas
+
+# ETag / 304 support for project-scoped list endpoints. A list's version stamp is derived from
+# COUNT(*) and the latest change date of every table the list reads, scoped to the account and
+# project, so write endpoints do not have to remember to bump anything. The ETag hashes that stamp
+# together with the request body, so every filter combination gets its own tag.
+
+# entity: [(table, scope, change date column)]
+# scope is 'project' (CORPORATE_ACCOUNT and PROJECT_ID) or 'account' (CORPORATE_ACCOUNT only).
+# Tables whose rows are only inserted and deleted use CREATED_DATE.
+LIST_SOURCES = {
+    'requirements': [
+        ('REQUIREMENTS', 'project', 'UPDATED_DATE'),
+        ('FUNCTIONAL_LEVELS', 'project', 'UPDATED_DATE'),
+        ('REQUIREMENT_CLASSIFICATION', 'project', 'UPDATED_DATE'),
+        ('PRODUCTS_BY_PROJECT', 'project', 'UPDATED_DATE'),
+        ('KEY_ATTRIBUTES_LIST_REQUIREMENTS', 'project', 'UPDATED_DATE'),
+        ('REQUIREMENTS_APPROVERS', 'project', 'CREATED_DATE'),
+    ],
+    'raid_log': [
+        ('RAID_LOG', 'project', 'UPDATED_DATE'),
+        ('RAID_LOG_ASSIGNEES', 'project', 'UPDATED_DATE'),
+        ('USER_ACCOUNTS', 'account', 'UPDATED_DATE'),
+    ],
+    'functional_levels': [
+        ('FUNCTIONAL_LEVELS', 'project', 'UPDATED_DATE'),
+    ],
+    'statuses': [
+        ('ACCOUNT_STATUSES', 'project', 'UPDATED_DATE'),
+    ],
+}
+
+# Change dates have one-second resolution, so a stamp is only handed out once the second of the
+# latest change has passed; otherwise a second write in that same second could go unnoticed.
+# Stamps are read from the primary while the list itself may come from a replica, so with replicas
+# the stamp also waits out the replication lag they are allowed.
+SETTLE_TIME = timedelta(seconds=2 + (REPLICA_MAX_LAG_SECONDS if has_replicas() else 0))
+
+
+def _get_connection():
+    return get_read_connection(stale_ok=False)
+
+
+def _stamp_query(entity):
+    columns = []
+    for table, scope, change_column in LIST_SOURCES[entity]:
+        where = "CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s" if scope == 'project' else "CORPORATE_ACCOUNT = %s"
+        columns.append(f"(SELECT COUNT(*) FROM {table} WHERE {where})")
+        columns.append(f"(SELECT MAX({change_column}) FROM {table} WHERE {where})")
+    return f"SELECT NOW(), {', '.join(columns)}"
+
+
+def get_list_version(cursor, entity, corporate_account, project_id):
+    """
+    Version stamp of the entity's list for an account and project, or None if the latest change
+    is too recent to be told apart from the next one
+    """
+    params = []
+    for _, scope, _ in LIST_SOURCES[entity]:
+        scope_params = [corporate_account, project_id] if scope == 'project' else [corporate_account]
+        params.extend(scope_params * 2)
+
+    cursor.execute(_stamp_query(entity), tuple(params))
+    row = cursor.fetchone()
+    db_now, values = row[0], row[1:]
+
+    change_dates = [value for value in values[1::2] if value is not None]
+    if change_dates and max(change_dates) > db_now - SETTLE_TIME:
+        return None
+
+    return ':'.join('' if value is None else str(value) for value in values)
+
+
+def make_list_etag(entity, version, body):
+    canonical_body = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(f"{entity}|{version}|{canonical_body}".encode('utf-8')).hexdigest()
+
+
+def report_list_status(status):
+    """Called by a conditional_list endpoint with the status it is about to return"""
+    g.list_status = status
+
+
+def conditional_list(entity):
+    """
+    Decorator for list endpoints (below @token_required). Answers 304 Not Modified without running
+    the list query when If-None-Match carries the current ETag, and tags fresh responses. The
+    endpoint calls report_list_status(sts) before returning, so the response is not parsed again.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            data = request.get_json(silent=True) or {}
+            etag = None
+
+            try:
+                connection = _get_connection()
+                try:
+                    cursor = connection.cursor()
+                    version = get_list_version(cursor, entity, data.get('corporate_account'),
+                                               data.get('project_id'))
+                    cursor.close()
+                finally:
+                    connection.close()
+                if version is not None:
+                    etag = make_list_etag(entity, version, data)
+            except mysql.connector.Error as error:
+                # Serve the list without an ETag rather than fail the request
+                logging.error(f"Unable to compute {entity} list version: {error}")
+
+            if etag and request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+            g.pop('list_status', None)
+            response = make_response(f(current_user, *args, **kwargs))
+            # Only successful lists are tagged; a transient failure must not be revalidated as current
+            if etag and response.status_code == 200 and g.pop('list_status', None) == 'Success':
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        return decorated
+
+    return decorator
@@ -1,31 +1,17 @@
 # main_prod.py
-from flask import Flask
-from flask_cors import CORS
-from account_and_project_v2 import account_and_project_blueprint
-from initial_setup_v2 import initialsetup_blueprint
-from requirements_v2 import requirements_blueprint
-from integration_requirements_v2 import integration_requirements_blueprint
-from upload_attachment import file_management_blueprint
-from base_requirements_v2 import base_requirements_blueprint
-from project_management_v2 import raid_log_blueprint
-from FeedbackSubmission import feedback_blueprint
+import os
+import sys
 
+from app_factory import create_app
 
-app = Flask(__name__)
+app = create_app()
 
-CORS(app)
 
-# Register all blueprints
-#app.register_blueprint(get_user_info)
-#app.register_blueprint(get_business_team_list)
+if __name__ == "__main__":
+    # Serve with gunicorn and the settings in gunicorn.conf.py; main.py runs the development server
+    from gunicorn.app.wsgiapp import run
 
-app.register_blueprint(initialsetup_blueprint)
-app.register_blueprint(account_and_project_blueprint)
-app.register_blueprint(requirements_blueprint)
-app.register_blueprint(base_requirements_blueprint)
-app.register_blueprint(integration_requirements_blueprint)
-app.register_blueprint(file_management_blueprint)
-app.register_blueprint(raid_log_blueprint)
-app.register_blueprint(feedback_blueprint)
-
-if __name__ == "__main__": app.run(host="0.0.0.0", port=5000) 
+    app_folder = os.path.dirname(os.path.abspath(__file__))
+    sys.argv = ['gunicorn', '--chdir', app_folder, '--config', os.path.join(app_folder, 'gunicorn.conf.py'),
+                'main_prod:app']
+    sys.exit(run())
@@ -0,0 +1,122 @@
+"""
+Schema migration for the API's own tables and indexes: creates the tables in SHARD_TABLES and the
+SYNC_INDEXES (delta_sync.py) on every shard, and the shared tables in DEFAULT_SHARD_TABLES on the
+default shard, or only on the shards named with --shard. Run it once per deployment, before
+starting an API version that uses them; running it again only reports what is in place. The API
+itself never issues DDL.
+
+Run from the APIs folder:
+    python migrate_schema.py --check
+    python migrate_schema.py
+    python migrate_schema.py --shard tenant_db_1
+
+InnoDB builds the indexes online (ALGORITHM=INPLACE, LOCK=NONE), so the API keeps serving reads
+and writes on those tables while the script runs.
+"""
+import argparse
+import sys
+
+import mysql.connector
+
+from attachment_store import BLOBS_TABLE_DDL
+from background_jobs import JOBS_TABLE_DDL
+from change_events import CHANGE_EVENTS_DDL
+from db_routing import DEFAULT_SHARD, TENANT_SHARDS_DDL, get_connection, shard_names
+from delta_sync import DELETION_LOG_DDL, SYNC_INDEXES
+from email_outbox import OUTBOX_TABLE_DDL
+from file_reaper import DELETIONS_TABLE_DDL
+
+# (table, DDL) needed on every shard
+SHARD_TABLES = [
+    ('DELETION_LOG', DELETION_LOG_DDL),
+    ('ATTACHMENT_BLOBS', BLOBS_TABLE_DDL),
+    ('CHANGE_EVENTS', CHANGE_EVENTS_DDL),
+]
+
+# (table, DDL) for tables in db_routing.GLOBAL_TABLES, kept on the default shard only
+DEFAULT_SHARD_TABLES = [
+    ('TENANT_SHARDS', TENANT_SHARDS_DDL),
+    ('BACKGROUND_JOBS', JOBS_TABLE_DDL),
+    ('EMAIL_OUTBOX', OUTBOX_TABLE_DDL),
+    ('PENDING_FILE_DELETIONS', DELETIONS_TABLE_DDL),
+]
+
+
+def _missing_indexes(cursor):
+    missing = []
+    for table, index_name, columns in SYNC_INDEXES:
+        cursor.execute("""SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s""", (table, index_name))
+        if not cursor.fetchone()[0]:
+            missing.append((table, index_name, columns))
+    return missing
+
+
+def _has_table(cursor, table):
+    cursor.execute("""SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s""", (table,))
+    return bool(cursor.fetchone()[0])
+
+
+def migrate_shard(shard, check_only=False):
+    """Bring one shard up to date; returns the number of changes still missing (check) or failed"""
+    connection = get_connection(shard=shard)
+    problems = 0
+    try:
+        cursor = connection.cursor()
+
+        tables = SHARD_TABLES + (DEFAULT_SHARD_TABLES if shard == DEFAULT_SHARD else [])
+        for table, ddl in tables:
+            if _has_table(cursor, table):
+                continue
+            if check_only:
+                print(f"  missing table {table}")
+                problems += 1
+            else:
+                print(f"  creating table {table}")
+                cursor.execute(ddl)
+
+        for table, index_name, columns in _missing_indexes(cursor):
+            if check_only:
+                print(f"  missing index {index_name} on {table} ({columns})")
+                problems += 1
+                continue
+            print(f"  creating index {index_name} on {table} ({columns})")
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} ({columns}), "
+                               f"ALGORITHM=INPLACE, LOCK=NONE")
+            except mysql.connector.Error as error:
+                if error.errno != 1061:  # Duplicate key name: created meanwhile
+                    print(f"  FAILED: {error}")
+                    problems += 1
+
+        cursor.close()
+    finally:
+        connection.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shard', action='append', choices=shard_names(), help='only this shard (repeatable)')
+    parser.add_argument('--check', action='store_true', help='report what is missing without changing anything')
+    args = parser.parse_args()
+
+    problems = 0
+    for shard in args.shard or shard_names():
+        print(f"{shard} shard:")
+        try:
+            problems += migrate_shard(shard, args.check)
+        except mysql.connector.Error as error:
+            print(f"  FAILED: {error}")
+            problems += 1
+
+    if problems:
+        print(f"{problems} {'change(s) missing' if args.check else 'failure(s)'}")
+    else:
+        print("Up to date")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
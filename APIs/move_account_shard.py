@@ -0,0 +1,321 @@
+"""
+Admin tool for tenant shards: show the shard map, assign a new account to a shard, or move an
+existing account's data from its shard to another one.
+
+Run from the APIs folder:
+    python move_account_shard.py list
+    python move_account_shard.py assign NEWCO tenant_db_1
+    python move_account_shard.py move BIGCO tenant_db_1 --purge-source
+
+A move marks the account Moving in TENANT_SHARDS, which makes the API refuse its writes (reads
+carry on from the old shard), and waits until every API process has seen that. It then copies the
+account's rows of every table with a CORPORATE_ACCOUNT column, checks the row counts, carries the
+attachment blob references over and points TENANT_SHARDS at the new shard. If anything fails the
+copied rows are removed again and the account goes back to Active on its old shard.
+--purge-source deletes the rows from the old shard once every process has switched over; without
+it they are left in place (the API ignores them) until removed with the purge command.
+"""
+import argparse
+import getpass
+import sys
+import time
+from datetime import datetime
+
+from attachment_store import content_hash_from_path
+from db_routing import ACTIVE, DEFAULT_SHARD, GLOBAL_TABLES, MOVING, SHARD_MAP_REFRESH_SECONDS, get_connection, \
+    load_shard_map, refresh_shard_map, set_tenant_shard, shard_for, shard_names
+
+# Extra wait for requests that opened their connection just before the map changed
+MOVE_SETTLE_SECONDS = 10
+BATCH_SIZE = 1000
+
+# Per-shard tables whose rows stay behind when an account moves. Event ids only mean something on
+# their own shard; a stream resuming with an old shard's id is told to refetch everything.
+UNMOVED_TABLES = {'CHANGE_EVENTS'}
+
+
+class MoveError(Exception):
+    pass
+
+
+def _wait_for_processes(reason):
+    wait = SHARD_MAP_REFRESH_SECONDS + MOVE_SETTLE_SECONDS
+    print(f"Waiting {wait}s for every API process to {reason}...")
+    time.sleep(wait)
+
+
+def _set_shard(corporate_account, shard, status):
+    connection = get_connection(shard=DEFAULT_SHARD)
+    try:
+        cursor = connection.cursor()
+        set_tenant_shard(cursor, corporate_account, shard, status, getpass.getuser())
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def _base_tables(cursor):
+    cursor.execute("""SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE' ORDER BY TABLE_NAME""")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _tenant_tables(cursor):
+    """Tables holding per-account rows, i.e. with a CORPORATE_ACCOUNT column, minus the global and unmoved ones"""
+    cursor.execute("""SELECT C.TABLE_NAME FROM INFORMATION_SCHEMA.COLUMNS C, INFORMATION_SCHEMA.TABLES T
+        WHERE C.TABLE_SCHEMA = DATABASE() AND C.COLUMN_NAME = 'CORPORATE_ACCOUNT'
+        AND T.TABLE_SCHEMA = C.TABLE_SCHEMA AND T.TABLE_NAME = C.TABLE_NAME AND T.TABLE_TYPE = 'BASE TABLE'
+        ORDER BY C.TABLE_NAME""")
+    return [row[0] for row in cursor.fetchall() if row[0] not in GLOBAL_TABLES and row[0] not in UNMOVED_TABLES]
+
+
+def _create_missing_tables(source_cursor, target_cursor):
+    """Give the target every table the source has, so queries that span tables work there too"""
+    for table in _base_tables(source_cursor):
+        source_cursor.execute(f"SHOW CREATE TABLE `{table}`")
+        ddl = source_cursor.fetchone()[1]
+        target_cursor.execute(ddl.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+
+
+def _count_rows(cursor, table, corporate_account):
+    cursor.execute(f"SELECT COUNT(*) FROM `{table}` WHERE CORPORATE_ACCOUNT = %s", (corporate_account,))
+    return cursor.fetchone()[0]
+
+
+def _copy_rows(source, target, table, corporate_account, batch_size):
+    source_cursor = source.cursor()
+    target_cursor = target.cursor()
+    source_cursor.execute(f"SELECT * FROM `{table}` WHERE CORPORATE_ACCOUNT = %s", (corporate_account,))
+    columns = ', '.join(f"`{column}`" for column in source_cursor.column_names)
+    placeholders = ', '.join(['%s'] * len(source_cursor.column_names))
+    insert_query = f"INSERT INTO `{table}` ({columns}) VALUES ({placeholders})"
+
+    copied = 0
+    while True:
+        rows = source_cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        target_cursor.executemany(insert_query, rows)
+        copied += len(rows)
+
+    target.commit()
+    source_cursor.close()
+    target_cursor.close()
+    return copied
+
+
+def _delete_rows(connection, table, corporate_account, batch_size):
+    cursor = connection.cursor()
+    while True:
+        cursor.execute(f"DELETE FROM `{table}` WHERE CORPORATE_ACCOUNT = %s LIMIT {int(batch_size)}",
+                       (corporate_account,))
+        deleted = cursor.rowcount
+        connection.commit()
+        if deleted < batch_size:
+            break
+    cursor.close()
+
+
+def _blob_references(cursor, corporate_account):
+    """{content hash: (file path, file size, references held by the account)}"""
+    cursor.execute("""SELECT A.FILE_PATH, B.FILE_SIZE, COUNT(*) FROM REQUIREMENT_ATTACHMENTS A, ATTACHMENT_BLOBS B
+        WHERE A.CORPORATE_ACCOUNT = %s AND A.FILE_PATH = B.FILE_PATH
+        GROUP BY A.FILE_PATH, B.FILE_SIZE""", (corporate_account,))
+    references = {}
+    for file_path, file_size, count in cursor.fetchall():
+        content_hash = content_hash_from_path(file_path)
+        if content_hash:
+            references[content_hash] = (file_path, file_size, count)
+    return references
+
+
+def _adjust_blob_references(connection, references, sign):
+    """Add (sign=1) or drop (sign=-1) the account's blob references; files are left to the orphan sweep"""
+    cursor = connection.cursor()
+    for content_hash, (file_path, file_size, count) in references.items():
+        cursor.execute("""
+            INSERT INTO ATTACHMENT_BLOBS (CONTENT_HASH, FILE_PATH, FILE_SIZE, REF_COUNT, CREATED_DATE, UPDATED_DATE)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE REF_COUNT = REF_COUNT + VALUES(REF_COUNT), UPDATED_DATE = VALUES(UPDATED_DATE)
+        """, (content_hash, file_path, file_size, sign * count, datetime.now(), datetime.now()))
+    cursor.execute("DELETE FROM ATTACHMENT_BLOBS WHERE REF_COUNT <= 0")
+    connection.commit()
+    cursor.close()
+
+
+def purge_account(corporate_account, shard, batch_size=BATCH_SIZE):
+    """Delete an account's rows from a shard it no longer lives on"""
+    refresh_shard_map()
+    if shard_for(corporate_account) == shard:
+        raise MoveError(f"{corporate_account} lives on {shard}; refusing to purge it")
+
+    connection = get_connection(shard=shard)
+    try:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        tables = _tenant_tables(cursor)
+        references = _blob_references(cursor, corporate_account)
+        cursor.close()
+
+        _adjust_blob_references(connection, references, -1)
+        for table in tables:
+            _delete_rows(connection, table, corporate_account, batch_size)
+            print(f"  purged {table}")
+    finally:
+        connection.close()
+
+
+def move_account(corporate_account, target_shard, purge_source=False, batch_size=BATCH_SIZE):
+    if target_shard not in shard_names():
+        raise MoveError(f"Shard {target_shard} is not configured (known: {', '.join(shard_names())})")
+
+    refresh_shard_map()
+    source_shard = shard_for(corporate_account)
+    if source_shard == target_shard:
+        raise MoveError(f"{corporate_account} already lives on {target_shard}")
+
+    source = get_connection(shard=source_shard)
+    target = get_connection(shard=target_shard)
+    copied_tables = []
+    references = {}
+    references_added = False
+    try:
+        source_cursor = source.cursor(buffered=True)
+        target_cursor = target.cursor(buffered=True)
+        target_cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        _create_missing_tables(source_cursor, target_cursor)
+
+        tables = _tenant_tables(source_cursor)
+        occupied = [table for table in tables if _count_rows(target_cursor, table, corporate_account)]
+        if occupied:
+            raise MoveError(f"{target_shard} already has {corporate_account} rows in {', '.join(occupied)}; "
+                            f"purge them first")
+
+        print(f"Moving {corporate_account} from {source_shard} to {target_shard} ({len(tables)} tables)")
+        _set_shard(corporate_account, source_shard, MOVING)
+        _wait_for_processes("stop writing to the account")
+
+        for table in tables:
+            copied_tables.append(table)
+            copied = _copy_rows(source, target, table, corporate_account, batch_size)
+            expected = _count_rows(source_cursor, table, corporate_account)
+            if _count_rows(target_cursor, table, corporate_account) != expected:
+                raise MoveError(f"{table}: copied {copied} rows but the source has {expected}")
+            print(f"  {table}: {copied} rows")
+
+        references = _blob_references(source_cursor, corporate_account)
+        _adjust_blob_references(target, references, 1)
+        references_added = True
+
+        _set_shard(corporate_account, target_shard, ACTIVE)
+        print(f"{corporate_account} now lives on {target_shard}")
+        source_cursor.close()
+        target_cursor.close()
+
+    except Exception:
+        print(f"Move failed; removing the copied rows from {target_shard}")
+        target.rollback()
+        if references_added:
+            _adjust_blob_references(target, references, -1)
+        for table in copied_tables:
+            _delete_rows(target, table, corporate_account, batch_size)
+        _set_shard(corporate_account, source_shard, ACTIVE)
+        raise
+
+    finally:
+        source.close()
+        target.close()
+
+    if purge_source:
+        _wait_for_processes(f"switch to {target_shard}")
+        purge_account(corporate_account, source_shard, batch_size)
+        print(f"Removed {corporate_account} from {source_shard}")
+
+
+def assign_account(corporate_account, shard):
+    """Place an account that has no data yet on a shard, before it is created, copying over any missing tables"""
+    if shard not in shard_names():
+        raise MoveError(f"Shard {shard} is not configured (known: {', '.join(shard_names())})")
+
+    refresh_shard_map()
+    current_shard = shard_for(corporate_account)
+    connection = get_connection(shard=current_shard)
+    try:
+        cursor = connection.cursor(buffered=True)
+        has_data = _count_rows(cursor, 'CORPORATE_ACCOUNTS', corporate_account)
+        cursor.close()
+    finally:
+        connection.close()
+    if has_data:
+        raise MoveError(f"{corporate_account} already has data on {current_shard}; use move instead")
+
+    if shard != current_shard:
+        # The account's first request must find every table on its new shard
+        source = get_connection(shard=current_shard)
+        target = get_connection(shard=shard)
+        try:
+            source_cursor = source.cursor(buffered=True)
+            target_cursor = target.cursor(buffered=True)
+            target_cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            _create_missing_tables(source_cursor, target_cursor)
+            source_cursor.close()
+            target_cursor.close()
+        finally:
+            source.close()
+            target.close()
+
+    _set_shard(corporate_account, shard, ACTIVE)
+    print(f"{corporate_account} assigned to {shard}")
+
+
+def list_shards():
+    connection = get_connection(shard=DEFAULT_SHARD)
+    try:
+        cursor = connection.cursor()
+        shard_map = load_shard_map(cursor)
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    print(f"Configured shards: {', '.join(shard_names())}")
+    for corporate_account, (shard, status) in sorted(shard_map.items()):
+        print(f"  {corporate_account}: {shard} ({status})")
+    print(f"Accounts not listed live on {DEFAULT_SHARD}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='show the shard map')
+    assign = subparsers.add_parser('assign', help='place a new account on a shard')
+    assign.add_argument('corporate_account')
+    assign.add_argument('shard')
+    move = subparsers.add_parser('move', help="move an account's data to another shard")
+    move.add_argument('corporate_account')
+    move.add_argument('shard')
+    move.add_argument('--purge-source', action='store_true', help='delete the rows from the old shard afterwards')
+    move.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    purge = subparsers.add_parser('purge', help="delete an account's leftover rows from a shard it has left")
+    purge.add_argument('corporate_account')
+    purge.add_argument('shard')
+    purge.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            list_shards()
+        elif args.command == 'assign':
+            assign_account(args.corporate_account, args.shard)
+        elif args.command == 'move':
+            move_account(args.corporate_account, args.shard, args.purge_source, args.batch_size)
+        else:
+            purge_account(args.corporate_account, args.shard, args.batch_size)
+    except MoveError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,19 @@ from flask import Flask, request, jsonify, Blueprint
 import mysql.connector
 from datetime import datetime
 import config
+from db_routing import get_connection, get_read_connection
 import logging
 from foundational_v2 import generate_next_sequence, validate_project_id, validate_level_id, validate_req_id, \
     validate_status, validate_user_id, is_user_authorized_to_approve, validate_integration_id, validate_raid_log_entry, \
     get_project_prefix, get_link_details
 from foundational_v2 import validate_corporate_account, validate_usecase_id, validate_testcase_id, \
     validate_key_attribute_list_id, validate_product_id, validate_req_classification, get_functional_level_children
+from foundational_v2 import get_existing_record_ids
 from utils import token_required
+from change_events import publishes_change, record_change, CREATED, UPDATED, DELETED
+from list_etags import conditional_list, report_list_status
+from delta_sync import parse_updated_since, get_sync_watermark, changed_raid_log_condition, \
+    log_deletions, RAID_LOG_ASSIGNEE
 from access_validation_at_api_level import validate_access
 import os
 import uuid
@@ -22,6 +28,7 @@ raid_log_blueprint = Blueprint('raid_log', __name__)
 @raid_log_blueprint.route('/api/create_raid_log', methods=['POST', 'PUT'])
 @token_required
 @validate_access
+@publishes_change('raid_log', CREATED)
 def create_raid_log(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -157,10 +164,7 @@ def create_raid_log(current_user):
     raid_id_with_prefix = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         raid_id, seq_status, seq_status_description = generate_next_sequence(corporate_account, project_id, 'RAID_LOG')
@@ -191,6 +195,7 @@ def create_raid_log(current_user):
 
 
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, raid_id=raid_id)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -221,6 +226,7 @@ def create_raid_log(current_user):
 @raid_log_blueprint.route('/api/update_raid_log', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log', UPDATED)
 def update_raid_log(current_user):
     data = request.json
     raid_id = data.get('raid_id')
@@ -365,10 +371,7 @@ def update_raid_log(current_user):
             })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_update_query = """UPDATE RAID_LOG SET RAID_TYPE = %s, RAID_DESCRIPTION = %s, RAID_LOGGED_BY_USER = %s,
@@ -384,6 +387,8 @@ def update_raid_log(current_user):
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching RAID log entry found to update"
+        else:
+            record_change(cursor)
 
         connection.commit()
 
@@ -415,6 +420,7 @@ def update_raid_log(current_user):
 @raid_log_blueprint.route('/api/update_raid_log_status', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log', UPDATED)
 def update_raid_log_status(current_user):
     data = request.json
     raid_ids = data.get('raid_ids', [])
@@ -426,6 +432,7 @@ def update_raid_log_status(current_user):
     sts_description = "RAID log status updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
     if not raid_ids or not isinstance(raid_ids, list):
         return jsonify({
@@ -440,27 +447,32 @@ def update_raid_log_status(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(raid_ids))
-        mySql_update_query = f"""UPDATE RAID_LOG SET STATUS = %s, UPDATED_DATE = %s 
-                                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
+        # Lock the matching rows once so the validation and the update share one transaction
+        raid_ids = list(dict.fromkeys(raid_ids))
+        existing_raid_ids = get_existing_record_ids(cursor, 'RAID_LOG', 'RAID_ID', corporate_account,
+                                                    project_id, raid_ids, for_update=True)
+        matched_raid_ids = [raid_id for raid_id in raid_ids if str(raid_id) in existing_raid_ids]
+        unmatched_ids = [raid_id for raid_id in raid_ids if str(raid_id) not in existing_raid_ids]
 
-        record = [status, datetime.now(), corporate_account, project_id]
-        record.extend(raid_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f"Executed SQL is: {cursor._executed}")
-
-        rows_impacted = cursor.rowcount
-        if rows_impacted == 0:
+        if not matched_raid_ids:
             sts = "Failed"
             sts_description = "No matching RAID log entries found to update"
+        else:
+            placeholders = ','.join(['%s'] * len(matched_raid_ids))
+            mySql_update_query = f"""UPDATE RAID_LOG SET STATUS = %s, UPDATED_DATE = %s 
+                                    WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
 
-        connection.commit()
+            record = [status, datetime.now(), corporate_account, project_id]
+            record.extend(matched_raid_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f"Executed SQL is: {cursor._executed}")
+
+            rows_impacted = cursor.rowcount
+            record_change(cursor)
+            connection.commit()
 
     except mysql.connector.Error as error:
         sts = "Failed"
@@ -482,7 +494,8 @@ def update_raid_log_status(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 
@@ -523,10 +536,7 @@ def get_raid_log_details(current_user):
     raid_log_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = """SELECT R.RAID_ID, R.RAID_ID_WITH_PREFIX, R.RAID_TYPE, R.RAID_DESCRIPTION, 
@@ -584,6 +594,7 @@ def get_raid_log_details(current_user):
 @raid_log_blueprint.route('/api/add_raid_log_assignee', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log_assignee', CREATED)
 def add_raid_log_assignee(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -624,10 +635,7 @@ def add_raid_log_assignee(current_user):
     sts_description = "User added as an assignee successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """INSERT INTO RAID_LOG_ASSIGNEES 
@@ -636,6 +644,7 @@ def add_raid_log_assignee(current_user):
 
         record = (corporate_account, project_id, raid_id, raid_owner_user_id, raid_owner_type, datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -664,6 +673,7 @@ def add_raid_log_assignee(current_user):
 @raid_log_blueprint.route('/api/update_raid_log_assignee', methods=['PUT'])
 @token_required
 @validate_access
+@publishes_change('raid_log_assignee', UPDATED)
 def update_raid_log_assignee(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -708,10 +718,7 @@ def update_raid_log_assignee(current_user):
     sts_description = "Assignee updated successfully"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # First check if the assignee record exists
@@ -743,9 +750,12 @@ def update_raid_log_assignee(current_user):
                   corporate_account, project_id, raid_id, raid_owner_user_id)
 
         cursor.execute(update_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
-        if cursor.rowcount == 0:
+        if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No records were updated"
 
@@ -776,6 +786,7 @@ def update_raid_log_assignee(current_user):
 @raid_log_blueprint.route('/api/delete_raid_log_assignee', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log_assignee', DELETED)
 def delete_raid_log_assignee(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -809,20 +820,23 @@ def delete_raid_log_assignee(current_user):
     sts_description = "RAID log assignee successfully deleted"
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        mySql_delete_query = """DELETE FROM RAID_LOG_ASSIGNEES 
-                              WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID = %s AND RAID_OWNER_USER_ID = %s"""
+        where_clause = "CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID = %s AND RAID_OWNER_USER_ID = %s"
+        mySql_delete_query = f"""DELETE FROM RAID_LOG_ASSIGNEES 
+                              WHERE {where_clause}"""
 
         record = (corporate_account, project_id, raid_id, raid_owner_user_id)
+        # Lets delta sync refresh the entry's assignee count
+        log_deletions(cursor, RAID_LOG_ASSIGNEE, 'RAID_LOG_ASSIGNEES', 'RAID_OWNER_USER_ID', where_clause, record,
+                      current_user['user_id'], parent_column='RAID_ID')
         cursor.execute(mySql_delete_query, record)
+        rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
         connection.commit()
 
-        rows_impacted = cursor.rowcount
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching assignee found to delete"
@@ -884,10 +898,7 @@ def get_raid_log_assignee_list(current_user):
     assignee_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
 
@@ -943,6 +954,7 @@ def get_raid_log_assignee_list(current_user):
 @raid_log_blueprint.route('/api/update_raid_log_criticality', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log', UPDATED)
 def update_raid_log_criticality(current_user):
     data = request.json
     raid_ids = data.get('raid_ids', [])
@@ -954,6 +966,7 @@ def update_raid_log_criticality(current_user):
     sts_description = "RAID log criticality updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
     if not raid_ids or not isinstance(raid_ids, list):
         return jsonify({
@@ -968,27 +981,32 @@ def update_raid_log_criticality(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(raid_ids))
-        mySql_update_query = f"""UPDATE RAID_LOG SET CRITICALITY = %s, UPDATED_DATE = %s 
-                                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
-
-        record = [criticality, datetime.now(), corporate_account, project_id]
-        record.extend(raid_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f"Executed SQL is: {cursor._executed}")
+        # Lock the matching rows once so the validation and the update share one transaction
+        raid_ids = list(dict.fromkeys(raid_ids))
+        existing_raid_ids = get_existing_record_ids(cursor, 'RAID_LOG', 'RAID_ID', corporate_account,
+                                                    project_id, raid_ids, for_update=True)
+        matched_raid_ids = [raid_id for raid_id in raid_ids if str(raid_id) in existing_raid_ids]
+        unmatched_ids = [raid_id for raid_id in raid_ids if str(raid_id) not in existing_raid_ids]
 
-        rows_impacted = cursor.rowcount
-        if rows_impacted == 0:
+        if not matched_raid_ids:
             sts = "Failed"
             sts_description = "No matching RAID log entries found to update"
+        else:
+            placeholders = ','.join(['%s'] * len(matched_raid_ids))
+            mySql_update_query = f"""UPDATE RAID_LOG SET CRITICALITY = %s, UPDATED_DATE = %s 
+                                    WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
 
-        connection.commit()
+            record = [criticality, datetime.now(), corporate_account, project_id]
+            record.extend(matched_raid_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f"Executed SQL is: {cursor._executed}")
+
+            rows_impacted = cursor.rowcount
+            record_change(cursor)
+            connection.commit()
 
     except mysql.connector.Error as error:
         sts = "Failed"
@@ -1010,7 +1028,8 @@ def update_raid_log_criticality(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 
@@ -1018,6 +1037,7 @@ def update_raid_log_criticality(current_user):
 @raid_log_blueprint.route('/api/update_raid_log_priority', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log', UPDATED)
 def update_raid_log_priority(current_user):
     data = request.json
     raid_ids = data.get('raid_ids', [])
@@ -1029,6 +1049,7 @@ def update_raid_log_priority(current_user):
     sts_description = "RAID log priority updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
     if not raid_ids or not isinstance(raid_ids, list):
         return jsonify({
@@ -1043,27 +1064,32 @@ def update_raid_log_priority(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(raid_ids))
-        mySql_update_query = f"""UPDATE RAID_LOG SET PRIORITY = %s, UPDATED_DATE = %s 
-                                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
-
-        record = [priority, datetime.now(), corporate_account, project_id]
-        record.extend(raid_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f"Executed SQL is: {cursor._executed}")
+        # Lock the matching rows once so the validation and the update share one transaction
+        raid_ids = list(dict.fromkeys(raid_ids))
+        existing_raid_ids = get_existing_record_ids(cursor, 'RAID_LOG', 'RAID_ID', corporate_account,
+                                                    project_id, raid_ids, for_update=True)
+        matched_raid_ids = [raid_id for raid_id in raid_ids if str(raid_id) in existing_raid_ids]
+        unmatched_ids = [raid_id for raid_id in raid_ids if str(raid_id) not in existing_raid_ids]
 
-        rows_impacted = cursor.rowcount
-        if rows_impacted == 0:
+        if not matched_raid_ids:
             sts = "Failed"
             sts_description = "No matching RAID log entries found to update"
+        else:
+            placeholders = ','.join(['%s'] * len(matched_raid_ids))
+            mySql_update_query = f"""UPDATE RAID_LOG SET PRIORITY = %s, UPDATED_DATE = %s 
+                                    WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND RAID_ID IN({placeholders})"""
 
-        connection.commit()
+            record = [priority, datetime.now(), corporate_account, project_id]
+            record.extend(matched_raid_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f"Executed SQL is: {cursor._executed}")
+
+            rows_impacted = cursor.rowcount
+            record_change(cursor)
+            connection.commit()
 
     except mysql.connector.Error as error:
         sts = "Failed"
@@ -1085,7 +1111,8 @@ def update_raid_log_priority(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 
@@ -1094,6 +1121,7 @@ def update_raid_log_priority(current_user):
 @raid_log_blueprint.route('/api/copy_raid_log_entry', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('raid_log', CREATED)
 def copy_raid_log_entry(current_user):
     try:
         # Get parameters from request
@@ -1117,10 +1145,7 @@ def copy_raid_log_entry(current_user):
                 'status_description': 'Missing required parameters'
             }), 400
 
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         logging.info("hello 1")
@@ -1271,6 +1296,7 @@ def copy_raid_log_entry(current_user):
                 except Exception as file_error:
                     logging.error(f"Error copying file: {str(file_error)}")
 
+        record_change(cursor, raid_id=new_raid_id)
         connection.commit()
 
         # Return the new RAID ID information
@@ -1311,6 +1337,7 @@ def copy_raid_log_entry(current_user):
  # 7. Get RAID Log List
 @raid_log_blueprint.route('/api/get_raid_log_list', methods=['GET', 'POST'])
 @token_required
+@conditional_list('raid_log')
 def get_raid_log_list(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1329,6 +1356,7 @@ def get_raid_log_list(current_user):
     updated_date_end = data.get('updated_date_end')
     due_date_start = data.get('due_date_start')  # Added filter
     due_date_end = data.get('due_date_end')  # Added filter
+    updated_since = data.get('updated_since')
 
     logging.info(f"data for get_raid_log_list: {data}")
 
@@ -1346,16 +1374,31 @@ def get_raid_log_list(current_user):
             'raid_log_list': []
         })
 
+    if updated_since:
+        try:
+            updated_since = parse_updated_since(updated_since)
+        except ValueError:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'updated_since is not a valid date',
+                'raid_log_list': []
+            })
+        # A delta covers the whole project so an entry that moved out of the client's filters is still
+        # reported; the client applies its filters locally
+        search_query = None
+        filter_by_status = filter_by_type = filter_by_criticality = filter_by_priority = []
+        filter_by_raid_logged_by_user = filter_by_assignees = []
+        created_date_start = created_date_end = updated_date_start = updated_date_end = None
+        due_date_start = due_date_end = None
+
     sts = "Success"
     sts_description = "RAID log entries retrieved successfully"
     raid_log_details = {}
     raid_log_list = []
+    sync_watermark = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query without ORDER BY
@@ -1374,6 +1417,13 @@ def get_raid_log_list(current_user):
 
         params = [corporate_account, project_id]
 
+        sync_watermark = get_sync_watermark(cursor)
+        if updated_since:
+            # No RAID log endpoint hard-deletes entries, so there are no tombstones to return here
+            delta_condition, delta_params = changed_raid_log_condition(corporate_account, project_id, updated_since)
+            mySql_select_query += delta_condition
+            params.extend(delta_params)
+
         # Add status filter if provided
         if filter_by_status and isinstance(filter_by_status, list) and len(filter_by_status) > 0:
             placeholders = ','.join(['%s'] * len(filter_by_status))
@@ -1477,7 +1527,7 @@ def get_raid_log_list(current_user):
             }
             raid_log_list.append(raid_log_details)
 
-        if len(raid_log_list) == 0:
+        if len(raid_log_list) == 0 and not updated_since:
             sts = "Failed"
             sts_description = "No matching RAID log entries found"
 
@@ -1491,8 +1541,11 @@ def get_raid_log_list(current_user):
             cursor.close()
             connection.close()
 
+    report_list_status(sts)
     return jsonify({
         'raid_log_list': raid_log_list,
+        'deleted_records': [],
+        'sync_watermark': sync_watermark,
         'status': sts,
         'status_description': sts_description
     })
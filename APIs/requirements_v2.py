@@ -1,13 +1,20 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint
 import mysql.connector
 from datetime import datetime
-import config
+from db_routing import get_connection, get_read_connection
 import logging
 from foundational_v2 import generate_next_sequence, validate_project_id, validate_level_id, validate_req_id, \
     validate_status, validate_user_id, is_user_authorized_to_approve, validate_integration_id, validate_raid_log_entry, \
     get_project_prefix, get_link_details
 from foundational_v2 import validate_corporate_account, validate_usecase_id, validate_testcase_id,  validate_key_attribute_list_id, validate_product_id, validate_req_classification, get_functional_level_children
+from foundational_v2 import get_existing_record_ids, get_approval_authorization, get_invalid_record_ids
 from utils import token_required
+from change_events import publishes_change, record_change, record_change_event, wake_change_dispatcher, CREATED, \
+    UPDATED, DELETED
+from delta_sync import parse_updated_since, get_sync_watermark, get_deleted_records, log_deletions, USECASE, COMMENT, \
+    REQUIREMENT_APPROVER, KEY_ATTRIBUTE_LIST_REQUIREMENT
+from upload_attachment import copy_requirement_attachments
+from background_jobs import enqueue_job, register_job_handler, JobCancelled
 from access_validation_at_api_level import validate_access
 import os
 import uuid
@@ -16,9 +23,6 @@ import uuid
 requirements_blueprint = Blueprint('requirements', __name__)
 
 
-app = Flask(__name__)
-
-logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 
 
 
@@ -27,6 +31,7 @@ logging.basicConfig(filename='debugging.log', level=logging.DEBUG)
 @requirements_blueprint.route('/api/create_requirement', methods=['POST','PUT'])
 @token_required
 @validate_access
+@publishes_change('requirement', CREATED)
 def create_requirement(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -112,10 +117,7 @@ def create_requirement(current_user):
     project_prefix = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -148,6 +150,7 @@ def create_requirement(current_user):
 
         record = (corporate_account, project_id, req_id, req_id_with_prefix, level_id, req_description, status, req_criticality, req_priority, datetime.now(), datetime.now(), ref_field_1, ref_field_2, ref_field_3, ref_field_4)
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, req_id=req_id_with_prefix)
 
         connection.commit()
 
@@ -179,6 +182,7 @@ def create_requirement(current_user):
 @requirements_blueprint.route('/api/update_requirement', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('requirement', UPDATED)
 def update_requirement(current_user):
     data = request.json
     req_id = data.get('req_id')
@@ -255,10 +259,7 @@ def update_requirement(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE REQUIREMENTS SET LEVEL_ID = %s, REQ_DESCRIPTION = %s, STATUS = %s, REQ_CRITICALITY = %s, REQ_PRIORITY = %s, 
         UPDATED_DATE = %s, REF_FIELD_1 = %s, REF_FIELD_2 = %s, REF_FIELD_3 = %s, REF_FIELD_4 = %s 
@@ -269,6 +270,8 @@ def update_requirement(current_user):
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching requirement found to update"
+        else:
+            record_change(cursor)
 
         connection.commit()
 
@@ -301,6 +304,7 @@ def update_requirement(current_user):
 @requirements_blueprint.route('/api/update_requirement_status', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('requirement', UPDATED)
 def update_requirement_status(current_user):
 
     data = request.json
@@ -315,6 +319,7 @@ def update_requirement_status(current_user):
     sts_description = "Requirement status updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
 
     if not req_ids or not isinstance(req_ids, list):
@@ -330,28 +335,45 @@ def update_requirement_status(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(req_ids))
-        mySql_update_query = f"""UPDATE REQUIREMENTS SET STATUS = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
-        record = [status,  datetime.now(), corporate_account, project_id]
-        record.extend(req_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-1 is: {cursor._executed}")
-        rows_impacted = cursor.rowcount
-
-        mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET STATUS = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-2 is: {cursor._executed}")
-        rows_impacted += cursor.rowcount
-        if rows_impacted == 0:
-                sts = "Failed"
-                sts_description = "No matching requirement found to update"
+        # Lock the matching rows once so the validation and the updates share one transaction
+        req_ids = list(dict.fromkeys(req_ids))
+        existing_req_ids = get_existing_record_ids(cursor, 'REQUIREMENTS', 'REQ_ID', corporate_account,
+                                                   project_id, req_ids, for_update=True)
+        matched_req_ids = [req_id for req_id in req_ids if str(req_id) in existing_req_ids]
+        remaining_ids = [req_id for req_id in req_ids if str(req_id) not in existing_req_ids]
+
+        existing_integration_ids = get_existing_record_ids(cursor, 'INTEGRATION_REQUIREMENTS', 'INTEGRATION_ID',
+                                                           corporate_account, project_id, remaining_ids,
+                                                           for_update=True)
+        matched_integration_ids = [req_id for req_id in remaining_ids if str(req_id) in existing_integration_ids]
+        unmatched_ids = [req_id for req_id in remaining_ids if str(req_id) not in existing_integration_ids]
+
+        if matched_req_ids:
+            placeholders = ','.join(['%s'] * len(matched_req_ids))
+            mySql_update_query = f"""UPDATE REQUIREMENTS SET STATUS = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
+            record = [status,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_req_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-1 is: {cursor._executed}")
+            rows_impacted = cursor.rowcount
+
+        if matched_integration_ids:
+            placeholders = ','.join(['%s'] * len(matched_integration_ids))
+            mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET STATUS = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
+            record = [status,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_integration_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-2 is: {cursor._executed}")
+            rows_impacted += cursor.rowcount
+
+        if not matched_req_ids and not matched_integration_ids:
+            sts = "Failed"
+            sts_description = "No matching requirement found to update"
         else:
+            record_change(cursor)
             connection.commit()
 
 
@@ -375,13 +397,15 @@ def update_requirement_status(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 
 @requirements_blueprint.route('/api/update_requirement_criticality', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('requirement', UPDATED)
 def update_requirement_criticality(current_user):
 
     data = request.json
@@ -396,6 +420,7 @@ def update_requirement_criticality(current_user):
     sts_description = "Requirement criticality updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
 
     if not req_ids or not isinstance(req_ids, list):
@@ -411,29 +436,45 @@ def update_requirement_criticality(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(req_ids))
-        mySql_update_query = f"""UPDATE REQUIREMENTS SET REQ_CRITICALITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
-        record = [req_criticality,  datetime.now(), corporate_account, project_id]
-        record.extend(req_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-1 is: {cursor._executed}")
-        rows_impacted = cursor.rowcount
-
-        mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET INTEGRATION_CRITICALITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-2 is: {cursor._executed}")
-        rows_impacted += cursor.rowcount
-
-        if rows_impacted == 0:
+        # Lock the matching rows once so the validation and the updates share one transaction
+        req_ids = list(dict.fromkeys(req_ids))
+        existing_req_ids = get_existing_record_ids(cursor, 'REQUIREMENTS', 'REQ_ID', corporate_account,
+                                                   project_id, req_ids, for_update=True)
+        matched_req_ids = [req_id for req_id in req_ids if str(req_id) in existing_req_ids]
+        remaining_ids = [req_id for req_id in req_ids if str(req_id) not in existing_req_ids]
+
+        existing_integration_ids = get_existing_record_ids(cursor, 'INTEGRATION_REQUIREMENTS', 'INTEGRATION_ID',
+                                                           corporate_account, project_id, remaining_ids,
+                                                           for_update=True)
+        matched_integration_ids = [req_id for req_id in remaining_ids if str(req_id) in existing_integration_ids]
+        unmatched_ids = [req_id for req_id in remaining_ids if str(req_id) not in existing_integration_ids]
+
+        if matched_req_ids:
+            placeholders = ','.join(['%s'] * len(matched_req_ids))
+            mySql_update_query = f"""UPDATE REQUIREMENTS SET REQ_CRITICALITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
+            record = [req_criticality,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_req_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-1 is: {cursor._executed}")
+            rows_impacted = cursor.rowcount
+
+        if matched_integration_ids:
+            placeholders = ','.join(['%s'] * len(matched_integration_ids))
+            mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET INTEGRATION_CRITICALITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
+            record = [req_criticality,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_integration_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-2 is: {cursor._executed}")
+            rows_impacted += cursor.rowcount
+
+        if not matched_req_ids and not matched_integration_ids:
             sts = "Failed"
             sts_description = "No matching requirement found to update"
         else:
+            record_change(cursor)
             connection.commit()
 
 
@@ -457,12 +498,14 @@ def update_requirement_criticality(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 @requirements_blueprint.route('/api/update_requirement_priority', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('requirement', UPDATED)
 def update_requirement_priority(current_user):
 
     data = request.json
@@ -477,6 +520,7 @@ def update_requirement_priority(current_user):
     sts_description = "Requirement priority updated successfully"
     rows_impacted = 0
     placeholders = ''
+    unmatched_ids = []
 
 
     if not req_ids or not isinstance(req_ids, list):
@@ -492,31 +536,48 @@ def update_requirement_priority(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
-        placeholders = ','.join(['%s'] * len(req_ids))
-        mySql_update_query = f"""UPDATE REQUIREMENTS SET REQ_PRIORITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
-        record = [req_priority,  datetime.now(), corporate_account, project_id]
-        record.extend(req_ids)
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-1 is: {cursor._executed}")
-        rows_impacted = cursor.rowcount
-
-        mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET INTEGRATION_PRIORITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
-        cursor.execute(mySql_update_query, record)
-        logging.info(f" executed SQL-2 is: {cursor._executed}")
-        rows_impacted += cursor.rowcount
-
-        if rows_impacted == 0:
+        # Lock the matching rows once so the validation and the updates share one transaction
+        req_ids = list(dict.fromkeys(req_ids))
+        existing_req_ids = get_existing_record_ids(cursor, 'REQUIREMENTS', 'REQ_ID', corporate_account,
+                                                   project_id, req_ids, for_update=True)
+        matched_req_ids = [req_id for req_id in req_ids if str(req_id) in existing_req_ids]
+        remaining_ids = [req_id for req_id in req_ids if str(req_id) not in existing_req_ids]
+
+        existing_integration_ids = get_existing_record_ids(cursor, 'INTEGRATION_REQUIREMENTS', 'INTEGRATION_ID',
+                                                           corporate_account, project_id, remaining_ids,
+                                                           for_update=True)
+        matched_integration_ids = [req_id for req_id in remaining_ids if str(req_id) in existing_integration_ids]
+        unmatched_ids = [req_id for req_id in remaining_ids if str(req_id) not in existing_integration_ids]
+
+        if matched_req_ids:
+            placeholders = ','.join(['%s'] * len(matched_req_ids))
+            mySql_update_query = f"""UPDATE REQUIREMENTS SET REQ_PRIORITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID IN({placeholders})"""
+            record = [req_priority,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_req_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-1 is: {cursor._executed}")
+            rows_impacted = cursor.rowcount
+
+        if matched_integration_ids:
+            placeholders = ','.join(['%s'] * len(matched_integration_ids))
+            mySql_update_query = f"""UPDATE INTEGRATION_REQUIREMENTS SET INTEGRATION_PRIORITY = %s, UPDATED_DATE = %s WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND INTEGRATION_ID IN({placeholders})"""
+            record = [req_priority,  datetime.now(), corporate_account, project_id]
+            record.extend(matched_integration_ids)
+            cursor.execute(mySql_update_query, record)
+            logging.info(f" executed SQL-2 is: {cursor._executed}")
+            rows_impacted += cursor.rowcount
+
+        if not matched_req_ids and not matched_integration_ids:
             sts = "Failed"
             sts_description = "No matching requirement found to update"
         else:
+            record_change(cursor)
             connection.commit()
 
+
     except mysql.connector.Error as error:
         sts = "Failed"
         if error.errno == 1062:  # Duplicate entry
@@ -537,7 +598,8 @@ def update_requirement_priority(current_user):
     return jsonify({
         'status': sts,
         'status_description': sts_description,
-        'rows_impacted': rows_impacted
+        'rows_impacted': rows_impacted,
+        'unmatched_ids': unmatched_ids
     })
 
 
@@ -590,6 +652,38 @@ def copy_requirement(current_user):
             'status_description': 'Invalid status under the target project'
         })
 
+    if data.get('run_in_background', False):
+        try:
+            job_id = enqueue_job('copy_requirement', corporate_account, to_project_id, current_user['user_id'], {
+                'corporate_account': corporate_account,
+                'from_project_id': from_project_id,
+                'from_req_id': from_req_id,
+                'to_project_id': to_project_id,
+                'to_level_id': to_level_id,
+                'to_status': to_status,
+                'copy_attachments': copy_attachments,
+                'user_id': current_user['user_id']
+            })
+        except Exception as e:
+            logging.error(f"Error queueing requirement copy: {str(e)}")
+            return jsonify({
+                'status': 'Failed',
+                'status_description': f"Failed to queue the requirement copy: {str(e)}"
+            })
+
+        return jsonify({
+            'job_id': job_id,
+            'status': 'Success',
+            'status_description': 'Requirement copy queued'
+        })
+
+    return jsonify(perform_requirement_copy(None, corporate_account, from_project_id, from_req_id, to_project_id,
+                                            to_level_id, to_status, copy_attachments, current_user['user_id']))
+
+
+def perform_requirement_copy(job_context, corporate_account, from_project_id, from_req_id, to_project_id, to_level_id,
+                             to_status, copy_attachments, user_id):
+    """Copies a validated requirement; shared by the copy_requirement endpoint and its background job"""
     sts = "Success"
     sts_description = "Requirement successfully copied to the target project"
     attachment_count = 0
@@ -597,10 +691,7 @@ def copy_requirement(current_user):
     to_req_id_with_prefix = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor(dictionary=True)
 
         # Check if source requirement exists
@@ -619,20 +710,20 @@ def copy_requirement(current_user):
             if seq_status == "Failed":
                 sts = "Failed"
                 sts_description = seq_status_description
-                return jsonify({
+                return {
                     'status': sts,
                     'status_description': sts_description
-                })
+                }
 
             # Get project prefix
             project_prefix = get_project_prefix(corporate_account, to_project_id)
 
             if project_prefix == 'Error':
-                return jsonify({
+                return {
                     'req_id': None,
                     'status': 'Failed',
                     'status_description': 'Requirement prefix not defined'
-                })
+                }
 
             # Create complete requirement ID with prefix
             to_req_id_with_prefix = f"{project_prefix.strip()}-{to_req_id}"
@@ -654,8 +745,9 @@ def copy_requirement(current_user):
                 from_project_id,
                 from_req_id)
 
+            # The requirement, its key attributes and its attachments commit together, so a failed
+            # or cancelled copy leaves nothing behind
             cursor.execute(insert_query, insert_params)
-            connection.commit()
 
             # Copy key attributes
             key_attributes_query = """INSERT INTO KEY_ATTRIBUTES_LIST_REQUIREMENTS(CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, LEVEL_ID, KEY_ATTRIBUTE_LIST_ID,
@@ -672,91 +764,19 @@ def copy_requirement(current_user):
                 from_req_id)
 
             cursor.execute(key_attributes_query, key_attributes_params)
-            connection.commit()
 
             # Handle attachment copying if requested
             if copy_attachments:
                 logging.info(f"Copying attachments for requirement from {from_req_id} to {to_req_id}")
 
-                # Get existing attachments
-                attachments_query = """
-                    SELECT * FROM REQUIREMENT_ATTACHMENTS
-                    WHERE CORPORATE_ACCOUNT = %s
-                    AND PROJECT_ID = %s
-                    AND REQ_ID = %s
-                """
-                cursor.execute(attachments_query, (corporate_account, from_project_id, from_req_id))
-                original_attachments = cursor.fetchall()
-                attachment_count = len(original_attachments)
-
-                logging.info(f"Found {attachment_count} attachments to copy")
-
-                # Process each attachment
-                for attachment in original_attachments:
-                    # Extract original file information
-                    original_file_path = attachment['FILE_PATH']
-                    original_filename = attachment['FILE_NAME']
-
-                    logging.info(f"Processing attachment: {original_filename}, path: {original_file_path}")
-
-                    # Build the full path to the original file
-                    full_original_path = os.path.join(config.ATTACHMENTS_FOLDER_PATH, original_file_path)
-
-                    if not os.path.exists(full_original_path):
-                        logging.warning(f"Original file not found: {full_original_path}")
-                        continue  # Skip if original file doesn't exist
-
-                    # Create a new unique filename but keep the extension
-                    file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-                    unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-
-                    # Create target directory path
-                    target_rel_dir = f"{corporate_account}/{to_project_id}/{to_req_id}"
-                    target_full_dir = os.path.join(config.ATTACHMENTS_FOLDER_PATH, target_rel_dir)
-
-                    # Ensure the target directory exists
-                    logging.info(f"Creating directory: {target_full_dir}")
-                    os.makedirs(target_full_dir, exist_ok=True)
-
-                    # Create the full path for the new file
-                    target_rel_path = f"{target_rel_dir}/{unique_filename}"
-                    target_full_path = os.path.join(config.ATTACHMENTS_FOLDER_PATH, target_rel_path)
-
-                    logging.info(f"Copying file to: {target_full_path}")
-
-                    # Copy the file
-                    try:
-                        with open(full_original_path, 'rb') as src_file:
-                            file_content = src_file.read()
-                            with open(target_full_path, 'wb') as dest_file:
-                                dest_file.write(file_content)
-
-                        logging.info(f"File copied successfully")
-
-                        # Insert the new attachment record
-                        attachment_insert_query = """
-                            INSERT INTO REQUIREMENT_ATTACHMENTS 
-                            (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOADED_BY)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        attachment_params = (
-                            corporate_account,
-                            to_project_id,
-                            to_req_id,
-                            original_filename,
-                            target_rel_path,
-                            attachment['FILE_SIZE'],
-                            attachment['FILE_TYPE'],
-                            current_user['user_id']
-                        )
-
-                        cursor.execute(attachment_insert_query, attachment_params)
-                        connection.commit()
-
-                        logging.info(f"Database record created for copied attachment")
-
-                    except Exception as file_error:
-                        logging.error(f"Error copying file: {str(file_error)}")
+                attachment_count = copy_requirement_attachments(connection, cursor, corporate_account, from_project_id,
+                                                                from_req_id, to_project_id, to_req_id, user_id,
+                                                                job_context)
+
+            record_change_event(cursor, corporate_account, to_project_id, 'requirement', CREATED,
+                                {'from_req_id': from_req_id, 'req_id': to_req_id_with_prefix}, user_id)
+            connection.commit()
+            wake_change_dispatcher()
 
         else:
             sts = "Failed"
@@ -771,6 +791,10 @@ def copy_requirement(current_user):
             sts_description = f"Failed to copy the requirement: {error}"
         logging.error(f"Database error copying requirement: {error}")
 
+    except JobCancelled:
+        connection.rollback()
+        raise
+
     except Exception as e:
         sts = "Failed"
         sts_description = f"Failed to copy the requirement: {str(e)}"
@@ -781,13 +805,16 @@ def copy_requirement(current_user):
             cursor.close()
             connection.close()
 
-    return jsonify({
+    return {
         'req_id': to_req_id_with_prefix,
         'status': sts,
         'status_description': sts_description,
         'attachments_copied': copy_attachments,
         'attachment_count': attachment_count
-    })
+    }
+
+
+register_job_handler('copy_requirement', perform_requirement_copy)
 
 @requirements_blueprint.route('/api/get_requirements_list_old', methods=['GET', 'POST'])
 @token_required
@@ -824,10 +851,7 @@ def get_requirements_list_old(current_user):
     requirement_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         level_condition = ""
@@ -1011,10 +1035,7 @@ def get_requirements_by_approver(current_user):
     requirement_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         level_condition = ""
@@ -1314,10 +1335,7 @@ def get_requirement_details(current_user):
     requirement_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = f"""SELECT REQ_ID, CORPORATE_ACCOUNT, PROJECT_ID, LEVEL_ID, REQ_DESCRIPTION, STATUS, REQ_CRITICALITY, REQ_PRIORITY, CREATED_DATE, UPDATED_DATE,         
         REF_FIELD_1, REF_FIELD_2, REF_FIELD_3, REF_FIELD_4
@@ -1371,6 +1389,7 @@ def get_requirement_details(current_user):
 @requirements_blueprint.route('/api/add_requirement_approver', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('requirement_approver', CREATED)
 def add_requirement_approver(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -1416,10 +1435,7 @@ def add_requirement_approver(current_user):
     sts = "Success"
     sts_description = "User added as an approver successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         if not level_id:
             level_id = 0
@@ -1430,6 +1446,7 @@ def add_requirement_approver(current_user):
                                 VALUES (%s, %s, %s, %s, %s, %s, 'Pending') """
         record = (corporate_account, project_id, req_id, level_id, approval_user_id, datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -1459,6 +1476,7 @@ def add_requirement_approver(current_user):
 @requirements_blueprint.route('/api/delete_requirement_approver', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('requirement_approver', DELETED)
 def delete_requirement_approver(current_user):
 
     data = request.json
@@ -1503,23 +1521,26 @@ def delete_requirement_approver(current_user):
     sts = "Success"
     sts_description = "Requirement approver successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         if not level_id:
             level_id = 0
         if not req_id:
             req_id = 0
 
-        mySql_insert_query = """DELETE FROM REQUIREMENTS_APPROVERS  
-        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s AND LEVEL_ID = %s AND APPROVAL_USER_ID = %s """
+        where_clause = "CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s AND LEVEL_ID = %s AND APPROVAL_USER_ID = %s"
+        mySql_insert_query = f"""DELETE FROM REQUIREMENTS_APPROVERS  
+        WHERE {where_clause} """
 
         record = (corporate_account, project_id, req_id, level_id, approval_user_id)
+        # Lets delta sync refresh the requirement's approver count
+        log_deletions(cursor, REQUIREMENT_APPROVER, 'REQUIREMENTS_APPROVERS', 'APPROVAL_USER_ID', where_clause,
+                      record, current_user['user_id'], parent_column='REQ_ID')
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching approver found to delete"
@@ -1588,10 +1609,7 @@ def get_requirements_approver_list(current_user):
     approver_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query without ORDER BY
@@ -1679,10 +1697,7 @@ def get_approver_list(current_user):
     approver_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query without ORDER BY
@@ -1727,6 +1742,7 @@ def get_approver_list(current_user):
 @requirements_blueprint.route('/api/update_requirement_approval_status', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('requirement_approver', UPDATED)
 def update_requirement_approval_status(current_user):
 
     data = request.json
@@ -1763,12 +1779,7 @@ def update_requirement_approval_status(current_user):
                 'status': 'Failed',
                 'status_description': 'Both level_id and req_id cannot be provided'
             })
-        for req_id in req_ids:
-            if not validate_req_id(corporate_account, project_id, req_id):
-                return jsonify({
-                    'status': 'Failed',
-                    'status_description': f'Requirement Id {req_id} is not valid'
-                })
+        req_ids = list(dict.fromkeys(req_ids))
 
     if level_id and not validate_level_id(corporate_account, project_id, level_id):
         return jsonify({
@@ -1787,12 +1798,20 @@ def update_requirement_approval_status(current_user):
         })
 
     if req_ids:
-        for req_id in req_ids:
-            if not is_user_authorized_to_approve(corporate_account, project_id, approval_user_id, req_id, level_id):
-                return jsonify({
-                    'status': 'Failed',
-                    'status_description': f'User is not authorized to approve the requirement {req_id}'
-                })
+        invalid_req_ids, unauthorized_req_ids = get_approval_authorization(corporate_account, project_id,
+                                                                           approval_user_id, req_ids)
+        if invalid_req_ids:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': f'Requirement Id {invalid_req_ids[0]} is not valid',
+                'invalid_req_ids': invalid_req_ids
+            })
+        if unauthorized_req_ids:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': f'User is not authorized to approve the requirement {unauthorized_req_ids[0]}',
+                'unauthorized_req_ids': unauthorized_req_ids
+            })
     else:
         req_id = 0
         if not is_user_authorized_to_approve(corporate_account, project_id, approval_user_id, req_id, level_id):
@@ -1807,10 +1826,7 @@ def update_requirement_approval_status(current_user):
     sts = "Success"
     sts_description = "Requirement approval status updated successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         if not level_id:
             level_id = 0
@@ -1819,23 +1835,50 @@ def update_requirement_approval_status(current_user):
         WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s AND LEVEL_ID = %s AND APPROVAL_USER_ID = %s """
 
         if req_ids:
-            for req_id in req_ids:
-                record = (approval_status, approval_comments, datetime.now(), corporate_account, project_id, req_id, level_id, approval_user_id)
-                cursor.execute(mySql_update_query, record)
-                connection.commit()
+            # Update the approver rows that already exist and add the missing ones, in one transaction
+            placeholders = ','.join(['%s'] * len(req_ids))
+            mySql_select_query = f"""SELECT REQ_ID FROM REQUIREMENTS_APPROVERS
+            WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND LEVEL_ID = %s AND APPROVAL_USER_ID = %s AND REQ_ID IN ({placeholders})"""
+            record = [corporate_account, project_id, level_id, approval_user_id]
+            record.extend(req_ids)
+            cursor.execute(mySql_select_query, record)
+            existing_req_ids = {str(result[0]) for result in cursor.fetchall()}
+
+            update_req_ids = [req_id for req_id in req_ids if str(req_id) in existing_req_ids]
+            insert_req_ids = [req_id for req_id in req_ids if str(req_id) not in existing_req_ids]
+
+            if update_req_ids:
+                placeholders = ','.join(['%s'] * len(update_req_ids))
+                mySql_update_many_query = f"""UPDATE REQUIREMENTS_APPROVERS SET APPROVAL_STATUS = %s, APPROVER_COMMENTS = %s, UPDATED_DATE = %s
+                WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND LEVEL_ID = %s AND APPROVAL_USER_ID = %s AND REQ_ID IN ({placeholders})"""
+                record = [approval_status, approval_comments, datetime.now(), corporate_account, project_id, level_id, approval_user_id]
+                record.extend(update_req_ids)
+                cursor.execute(mySql_update_many_query, record)
+
+            if insert_req_ids:
+                mySql_insert_query = """INSERT INTO REQUIREMENTS_APPROVERS (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, LEVEL_ID, APPROVAL_USER_ID, CREATED_DATE, APPROVAL_STATUS, APPROVER_COMMENTS)
+                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s) """
+                records = [(corporate_account, project_id, req_id, level_id, approval_user_id, datetime.now(), approval_status, approval_comments)
+                           for req_id in insert_req_ids]
+                cursor.executemany(mySql_insert_query, records)
+
+            record_change(cursor)
+            connection.commit()
+            logging.info(f"Approver rows updated: {len(update_req_ids)} inserted: {len(insert_req_ids)}")
         else:
-                req_id =0
-                record = (approval_status, approval_comments, datetime.now(), corporate_account, project_id, req_id, level_id, approval_user_id)
-                cursor.execute(mySql_update_query, record)
-                connection.commit()
+            req_id =0
+            record = (approval_status, approval_comments, datetime.now(), corporate_account, project_id, req_id, level_id, approval_user_id)
+            cursor.execute(mySql_update_query, record)
+
+            rows_impacted = cursor.rowcount
+            logging.info(f"Rows impacted by update: {rows_impacted}")
+            if rows_impacted == 0:
+                mySql_insert_query = """INSERT INTO REQUIREMENTS_APPROVERS (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, LEVEL_ID, APPROVAL_USER_ID, CREATED_DATE, APPROVAL_STATUS, APPROVER_COMMENTS)
+                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s) """
+                record = (corporate_account, project_id, req_id, level_id, approval_user_id, datetime.now(), approval_status, approval_comments)
+                cursor.execute(mySql_insert_query, record)
 
-        rows_impacted = cursor.rowcount
-        logging.info(f"Rows impacted by update: {rows_impacted}")
-        if rows_impacted == 0:
-            mySql_insert_query = """INSERT INTO REQUIREMENTS_APPROVERS (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, LEVEL_ID, APPROVAL_USER_ID, CREATED_DATE, APPROVAL_STATUS, APPROVER_COMMENTS)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s) """
-            record = (corporate_account, project_id, req_id, level_id, approval_user_id, datetime.now(), approval_status, approval_comments)
-            cursor.execute(mySql_insert_query, record)
+            record_change(cursor)
             connection.commit()
 
 
@@ -1924,10 +1967,7 @@ def get_requirements_approval_list(current_user):
     requirement_approval_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         # Base query without ORDER BY
@@ -2017,6 +2057,7 @@ def get_requirements_approval_list(current_user):
 @requirements_blueprint.route('/api/create_requirement_usecase', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('usecase', CREATED)
 def create_requirement_usecase(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2081,10 +2122,7 @@ def create_requirement_usecase(current_user):
     if not req_id:
         req_id = 0
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         project_prefix = get_project_prefix(corporate_account, project_id)
@@ -2105,6 +2143,7 @@ def create_requirement_usecase(current_user):
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) """
         record = (corporate_account, project_id, level_id, req_id, usecase_id, usecase_id_with_prefix, usecase_description, acceptance_criteria,  status , datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor, usecase_id=usecase_id)
 
 
         connection.commit()
@@ -2139,6 +2178,7 @@ def create_requirement_usecase(current_user):
 @requirements_blueprint.route('/api/update_requirement_usecase', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('usecase', UPDATED)
 def update_requirement_usecase(current_user):
     data = request.json
     usecase_id = data.get('usecase_id')
@@ -2179,10 +2219,7 @@ def update_requirement_usecase(current_user):
             'status_description': 'Invalid usecase status'
         })
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE REQUIREMENTS_USECASES SET USECASE_DESCRIPTION = %s, ACCEPTANCE_CRITERIA = %s, STATUS = %s, UPDATED_DATE = %s WHERE USECASE_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
         record = (usecase_description, acceptance_criteria, status, datetime.now(), usecase_id, corporate_account, project_id )
@@ -2191,6 +2228,8 @@ def update_requirement_usecase(current_user):
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching usecase found to update"
+        else:
+            record_change(cursor)
 
 
         connection.commit()
@@ -2226,6 +2265,7 @@ def update_requirement_usecase(current_user):
 @requirements_blueprint.route('/api/delete_requirement_usecases', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('usecase', DELETED)
 def delete_requirement_usecases(current_user):
 
 
@@ -2253,21 +2293,22 @@ def delete_requirement_usecases(current_user):
     sts = "Success"
     sts_description = "Usecase(s) successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
         placeholders = ','.join(['%s'] * len(usecase_ids))
 
 
+        where_clause = f"CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND USECASE_ID IN ({placeholders})"
         mySql_insert_query = f"""DELETE FROM REQUIREMENTS_USECASES
-        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND USECASE_ID IN ({placeholders})"""
+        WHERE {where_clause}"""
 
         record = (corporate_account, project_id)  + tuple(usecase_ids)
 
+        # Tombstones for delta sync, committed with the delete
+        log_deletions(cursor, USECASE, 'REQUIREMENTS_USECASES', 'USECASE_ID', where_clause, record,
+                      current_user['user_id'], parent_column='REQ_ID')
         cursor.execute(mySql_insert_query, record)
 
 
@@ -2275,6 +2316,8 @@ def delete_requirement_usecases(current_user):
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching usecases found to delete"
+        else:
+            record_change(cursor)
 
 
         connection.commit()
@@ -2300,6 +2343,7 @@ def delete_requirement_usecases(current_user):
 @requirements_blueprint.route('/api/create_project_link', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('project_link', CREATED)
 def create_project_link(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -2416,10 +2460,7 @@ def create_project_link(current_user):
     logging.info("hello 1")
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Process each source ID
@@ -2510,6 +2551,8 @@ def create_project_link(current_user):
                 'project_link_id': project_link_id
             })
 
+        if project_link_ids:
+            record_change(cursor)
         connection.commit()
 
         # Determine overall status
@@ -2556,6 +2599,7 @@ def create_project_link(current_user):
 @requirements_blueprint.route('/api/delete_project_links', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('project_link', DELETED)
 def delete_project_links(current_user):
 
 
@@ -2583,10 +2627,7 @@ def delete_project_links(current_user):
     sts = "Success"
     sts_description = "Links successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
@@ -2600,8 +2641,10 @@ def delete_project_links(current_user):
 
         cursor.execute(mySql_insert_query, record)
         logging.info(f" executed SQL is: {cursor._executed}")
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching links found to delete"
@@ -2647,10 +2690,7 @@ def get_links_list(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
 
@@ -2758,10 +2798,7 @@ def get_search_results_list(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         placeholders = ','.join(['%s'] * len(filter_by_status))
@@ -2873,10 +2910,7 @@ def get_usecase_list(current_user):
 
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         placeholders = ','.join(['%s'] * len(filter_by_status))
@@ -2977,10 +3011,7 @@ def get_usecase_details(current_user):
     usecase_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = f"""SELECT CORPORATE_ACCOUNT, PROJECT_ID, LEVEL_ID, REQ_ID, USECASE_ID, USECASE_ID_WITH_PREFIX, USECASE_DESCRIPTION, ACCEPTANCE_CRITERIA,
         STATUS, CREATED_DATE, UPDATED_DATE FROM REQUIREMENTS_USECASES 
@@ -3029,6 +3060,7 @@ def get_usecase_details(current_user):
 @requirements_blueprint.route('/api/create_requirement_testcase', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('testcase', CREATED)
 def create_requirement_testcase(current_user):
 
     data = request.json
@@ -3065,10 +3097,7 @@ def create_requirement_testcase(current_user):
     sts = "Success"
     sts_description = "Testcase successfully created"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = """INSERT INTO REQUIREMENTS_TESTCASES (CORPORATE_ACCOUNT, PROJECT_ID, USECASE_ID, TESTCASE_ID, 
@@ -3076,6 +3105,7 @@ def create_requirement_testcase(current_user):
                                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) """
         record = (corporate_account, project_id, usecase_id, testcase_id, testcase_description, acceptance_criteria, 'Created', datetime.now(), datetime.now())
         cursor.execute(mySql_insert_query, record)
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -3104,6 +3134,7 @@ def create_requirement_testcase(current_user):
 @requirements_blueprint.route('/api/update_requirement_testcase', methods=['PUT'])
 @token_required
 @validate_access
+@publishes_change('testcase', UPDATED)
 def update_requirement_testcase(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -3150,16 +3181,15 @@ def update_requirement_testcase(current_user):
             'status_description': 'Invalid testcase status'
         })
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = """UPDATE REQUIREMENTS_TESTCASES SET USECASE_ID = %s, TESTCASE_DESCRIPTION = %s, ACCEPTANCE_CRITERIA = %s, STATUS = %s, UPDATED_DATE = %s WHERE TESTCASE_ID = %s AND CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s"""
         record = (usecase_id, testcase_description, acceptance_criteria, status, datetime.now(), testcase_id, corporate_account, project_id )
         cursor.execute(mySql_update_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching testcase found to update"
@@ -3203,10 +3233,7 @@ def get_testcase_details(current_user):
     testcase_details = {}
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
         mySql_select_query = """SELECT CORPORATE_ACCOUNT, PROJECT_ID, TESTCASE_ID, USECASE_ID, TESTCASE_DESCRIPTION, ACCEPTANCE_CRITERIA, 
         STATUS, CREATED_DATE, UPDATED_DATE FROM REQUIREMENTS_TESTCASES 
@@ -3255,6 +3282,7 @@ def get_testcase_details(current_user):
 @requirements_blueprint.route('/api/add_comments', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('comment', CREATED)
 def add_comments(current_user):
 
     data = request.json
@@ -3286,37 +3314,22 @@ def add_comments(current_user):
     #     })
 
     if req_ids:
-        for req_id in req_ids:
+        invalid_req_ids = get_invalid_record_ids(corporate_account, project_id, req_type, req_ids)
+        if invalid_req_ids:
+            req_id = invalid_req_ids[0]
             if req_type == 'INTEGRATION':
-                logging.info("req_type is integration")
-                if not validate_integration_id(corporate_account, project_id, req_id):
-                    return jsonify({
-                        'status': 'Failed',
-                        'status_description': f'Integration Id {req_id} is not valid'
-                    })
+                sts_description = f'Integration Id {req_id} is not valid'
+            elif req_type == 'REQUIREMENT':
+                sts_description = f'Requirement Id {req_id} is not valid'
+            elif req_type == 'USECASE':
+                sts_description = f'Usecase Id {req_id} is not valid'
             else:
-                if req_type == 'REQUIREMENT':
-                    logging.info("req_type is requirement")
-                    if not validate_req_id(corporate_account, project_id, req_id):
-                        return jsonify({
-                            'status': 'Failed',
-                            'status_description': f'Requirement Id {req_id} is not valid'
-                        })
-                else:
-                    if req_type == 'USECASE' :
-                        logging.info("req_type is usecase")
-                        if not validate_usecase_id(corporate_account, project_id, req_id):
-                            return jsonify({
-                                'status': 'Failed',
-                                'status_description': f'Usecase Id {req_id} is not valid'
-                            })
-                    else:
-                        logging.info("req_type is raid log")
-                        if not validate_raid_log_entry(corporate_account, project_id, req_type, req_id):
-                            return jsonify({
-                                'status': 'Failed',
-                                'status_description': f'Invalid requirement type - {req_type}'
-                        })
+                sts_description = f'Invalid requirement type - {req_type}'
+            return jsonify({
+                'status': 'Failed',
+                'status_description': sts_description,
+                'invalid_req_ids': invalid_req_ids
+            })
     if level_id and req_ids and len(req_ids) > 0:
         return jsonify({
             'status': 'Failed',
@@ -3357,10 +3370,7 @@ def add_comments(current_user):
     sts_description = "comments added successfully"
     try:
 
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = f"""INSERT INTO REQUIREMENTS_COMMENTS (CORPORATE_ACCOUNT, PROJECT_ID, COMMENT_ID, REQ_TYPE, REQ_ID, LEVEL_ID, COMMENTS, 
@@ -3383,20 +3393,22 @@ def add_comments(current_user):
             cursor.execute(mySql_insert_query, record)
         else:
             level_id = 0
-            for req_id in req_ids:
-                comment_id, seq_status, seq_status_description = generate_next_sequence(corporate_account, project_id,
-                                                                                        'COMMENT')
+            # Reserve one block of comment ids and insert every comment row in a single batch
+            first_comment_id, seq_status, seq_status_description = generate_next_sequence(corporate_account, project_id,
+                                                                                          'COMMENT', len(req_ids))
 
-                if seq_status == "Failed":
-                    sts = "Failed"
-                    sts_description = seq_status_description
-                    return jsonify({
-                        'status': sts,
-                        'status_description': sts_description
-                    })
-                record = (corporate_account, project_id, comment_id, req_type, req_id, level_id, comments, status, datetime.now(), datetime.now(), user_id)
-                cursor.execute(mySql_insert_query, record)
+            if seq_status == "Failed":
+                sts = "Failed"
+                sts_description = seq_status_description
+                return jsonify({
+                    'status': sts,
+                    'status_description': sts_description
+                })
+            records = [(corporate_account, project_id, first_comment_id + index, req_type, req_id, level_id, comments, status, datetime.now(), datetime.now(), user_id)
+                       for index, req_id in enumerate(req_ids)]
+            cursor.executemany(mySql_insert_query, records)
 
+        record_change(cursor)
         connection.commit()
 
     except mysql.connector.Error as error:
@@ -3439,6 +3451,7 @@ def get_comments_list(current_user):
     filter_by_status = data.get('filter_by_status', [])
     search_query = data.get('search_query')
     sort_criteria = data.get('sort_criteria')
+    updated_since = data.get('updated_since')
 
     logging.info(f"data : {data}")
 
@@ -3502,6 +3515,19 @@ def get_comments_list(current_user):
         })
 
 
+    if updated_since:
+        try:
+            updated_since = parse_updated_since(updated_since)
+        except ValueError:
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'updated_since is not a valid date'
+            })
+        # A delta covers every comment on the level or requirement so a comment that moved out of the
+        # client's filters is still reported; the client applies its filters locally
+        filter_by_status = []
+        search_query = None
+
     placeholders = ','.join(['%s'] * len(filter_by_status))
 
     if not level_id:
@@ -3518,12 +3544,11 @@ def get_comments_list(current_user):
     sts_description = "comments retrieved successfully"
     comments_details = {}
     comments_list = []
+    deleted_records = []
+    sync_watermark = None
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         mySql_select_query = f""" SELECT A.COMMENT_ID, A.COMMENTS,
@@ -3544,6 +3569,12 @@ def get_comments_list(current_user):
         # Build the query parameters list
         params = [corporate_account, project_id]
 
+        sync_watermark = get_sync_watermark(cursor)
+        if updated_since:
+            deleted_records = get_deleted_records(cursor, corporate_account, project_id, [COMMENT], updated_since)
+            mySql_select_query += " AND A.UPDATED_DATE >= %s "
+            params.append(updated_since)
+
         if filter_by_status and len(filter_by_status) > 0:
             mySql_select_query += f"""AND A.STATUS IN({placeholders}) """
             params.extend(filter_by_status)
@@ -3585,7 +3616,7 @@ def get_comments_list(current_user):
 
         logging.info(f" array lenght is : {len(comments_list) }")
 
-        if len(comments_list) == 0:
+        if len(comments_list) == 0 and not updated_since:
             sts = "Failed"
             sts_description = "No matching entries found"
 
@@ -3601,6 +3632,8 @@ def get_comments_list(current_user):
 
     return jsonify({
         'comments_list': comments_list,
+        'deleted_records': deleted_records,
+        'sync_watermark': sync_watermark,
         'status': sts,
         'status_description': sts_description
     })
@@ -3609,6 +3642,7 @@ def get_comments_list(current_user):
 @requirements_blueprint.route('/api/update_comments', methods=['PUT', 'POST'])
 @token_required
 @validate_access
+@publishes_change('comment', UPDATED)
 def update_comments(current_user):
     data = request.json
     corporate_account = data.get('corporate_account')
@@ -3663,18 +3697,17 @@ def update_comments(current_user):
         })
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
         mySql_update_query = f"""UPDATE REQUIREMENTS_COMMENTS SET COMMENTS = %s , STATUS = %s , UPDATED_DATE = NOW(), USER_ID = %s 
            WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID =  %s  AND COMMENT_ID = %s """
 
         record = (comments, status, user_id, corporate_account, project_id , comment_id)
         cursor.execute(mySql_update_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching comment found to update"
@@ -3709,6 +3742,7 @@ def update_comments(current_user):
 @requirements_blueprint.route('/api/delete_comments', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('comment', DELETED)
 def delete_comments(current_user):
 
 
@@ -3736,24 +3770,27 @@ def delete_comments(current_user):
     sts = "Success"
     sts_description = "Comments successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
 
         placeholders = ','.join(['%s'] * len(comment_ids))
 
 
+        where_clause = f"CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND COMMENT_ID IN ({placeholders})"
         mySql_insert_query = f"""DELETE FROM REQUIREMENTS_COMMENTS
-        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND COMMENT_ID IN ({placeholders})"""
+        WHERE {where_clause}"""
 
         record = (corporate_account, project_id)  + tuple(comment_ids)
 
+        # Tombstones for delta sync, committed with the delete
+        log_deletions(cursor, COMMENT, 'REQUIREMENTS_COMMENTS', 'COMMENT_ID', where_clause, record,
+                      current_user['user_id'], parent_column='REQ_ID')
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching comments found to delete"
@@ -3783,6 +3820,7 @@ def delete_comments(current_user):
 @requirements_blueprint.route('/api/add_key_attributes_list_requirements', methods=['POST'])
 @token_required
 @validate_access
+@publishes_change('key_attribute_list_requirement', CREATED)
 def add_key_attributes_list_requirements(current_user):
 
     data = request.json
@@ -3854,10 +3892,7 @@ def add_key_attributes_list_requirements(current_user):
     sts = "Success"
     sts_description = "key attribute list mapping to requirement added successfully"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         mySql_insert_query = f"""INSERT INTO KEY_ATTRIBUTES_LIST_REQUIREMENTS(CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, LEVEL_ID, KEY_ATTRIBUTE_LIST_ID, 
@@ -3876,6 +3911,7 @@ def add_key_attributes_list_requirements(current_user):
                 cursor.execute(mySql_insert_query, record)
 
         rows_impacted = cursor.rowcount
+        record_change(cursor)
 
 
         connection.commit()
@@ -3912,6 +3948,7 @@ def add_key_attributes_list_requirements(current_user):
 @requirements_blueprint.route('/api/delete_key_attributes_list_requirements', methods=['PUT','POST'])
 @token_required
 @validate_access
+@publishes_change('key_attribute_list_requirement', DELETED)
 def delete_key_attributes_list_requirements(current_user):
 
 
@@ -3967,10 +4004,7 @@ def delete_key_attributes_list_requirements(current_user):
     sts = "Success"
     sts_description = "Key attributes list mapping to requirements is successfully deleted"
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         if not level_id:
@@ -3981,14 +4015,20 @@ def delete_key_attributes_list_requirements(current_user):
         placeholders = ','.join(['%s'] * len(key_attribute_list_ids))
 
 
+        where_clause = f"CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s AND LEVEL_ID = %s AND KEY_ATTRIBUTE_LIST_ID IN ({placeholders})"
         mySql_insert_query = f"""DELETE FROM KEY_ATTRIBUTES_LIST_REQUIREMENTS 
-        WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s AND REQ_ID = %s AND LEVEL_ID = %s AND KEY_ATTRIBUTE_LIST_ID IN ({placeholders})"""
+        WHERE {where_clause}"""
 
         record = (corporate_account, project_id, req_id, level_id)  + tuple(key_attribute_list_ids)
 
+        # Lets delta sync refresh the requirement's exception count
+        log_deletions(cursor, KEY_ATTRIBUTE_LIST_REQUIREMENT, 'KEY_ATTRIBUTES_LIST_REQUIREMENTS', 'KEY_ATTRIBUTE_LIST_ID',
+                      where_clause, record, current_user['user_id'], parent_column='REQ_ID')
         cursor.execute(mySql_insert_query, record)
-        connection.commit()
         rows_impacted = cursor.rowcount
+        if rows_impacted:
+            record_change(cursor)
+        connection.commit()
         if rows_impacted == 0:
             sts = "Failed"
             sts_description = "No matching attribute list Id found to delete"
@@ -4062,10 +4102,7 @@ def get_key_attributes_list_requirements(current_user):
     key_functional_attributes_list = []
 
     try:
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
 
@@ -4132,6 +4169,10 @@ def get_key_attributes_list_requirements(current_user):
 
 
 if __name__ == '__main__':
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.register_blueprint(requirements_blueprint)
     app.run(debug=True)
 
 
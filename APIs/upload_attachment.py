@@ -1,10 +1,14 @@
 # Import required modules
-from flask import Flask, request, jsonify, send_file, Blueprint
+from flask import Flask, request, jsonify, send_file, Blueprint, make_response, Response, stream_with_context, redirect
 import os
+import shutil
+import time
+import zipfile
 from werkzeug.utils import secure_filename
 import uuid
 import mysql.connector
 import config
+from db_routing import get_connection, get_read_connection
 import logging
 
 
@@ -15,10 +19,26 @@ from datetime import datetime
 
 # Assuming these are already defined in your existing API
 from utils import token_required
+from foundational_v2 import get_user_api_access_level
+from attachment_store import stream_to_temp, discard_temp, add_blob_reference, release_blob_reference, \
+    delete_unreferenced_blob, content_hash_from_path, UploadTooLarge, get_storage_backend, open_attachment, \
+    local_attachment_path, attachment_exists, upload_limits
 
 # Configure upload directory
 UPLOAD_FOLDER = config.ATTACHMENTS_FOLDER_PATH
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'txt', 'png', 'jpg', 'jpeg', 'gif'}
+MAX_FILE_SIZE = getattr(config, 'MAX_ATTACHMENT_SIZE', 25 * 1024 * 1024)  # 25MB
+MAX_FILES = getattr(config, 'MAX_ATTACHMENTS_PER_UPLOAD', 10)
+
+# Blobs never change once written, so browsers may keep them for a year
+BLOB_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+# When set (e.g. '/protected-attachments/'), nginx serves the file through X-Accel-Redirect.
+# Flask's USE_X_SENDFILE setting is honoured by send_file for Apache/lighttpd.
+ACCEL_REDIRECT_PREFIX = getattr(config, 'ATTACHMENTS_ACCEL_REDIRECT_PREFIX', None)
+
+# Formats that are already compressed are stored in ZIP downloads instead of deflated again
+ZIP_STORED_EXTENSIONS = {'docx', 'xlsx', 'png', 'jpg', 'jpeg', 'gif', 'pdf', 'zip'}
+ZIP_CHUNK_SIZE = 1024 * 1024
 
 # Create directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -28,10 +48,175 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# Chunk size used when a stored file has to be physically copied
+FILE_COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Linux ioctl that clones a file's extents (btrfs, xfs with reflink=1, ...)
+FICLONE = 0x40049409
+
+
+def _reflink_file(src_fd, dest_fd):
+    try:
+        import fcntl
+        fcntl.ioctl(dest_fd, FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def duplicate_file(source_path, target_path):
+    """
+    Duplicate a stored attachment without reading it into Python memory.
+    Tries a hardlink, then a reflink, then kernel-side copy_file_range/sendfile and
+    finally a chunked copy. Returns the method that was used.
+    """
+    try:
+        os.link(source_path, target_path)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    with open(source_path, 'rb') as src_file, open(target_path, 'wb') as dest_file:
+        src_fd = src_file.fileno()
+        dest_fd = dest_file.fileno()
+
+        if _reflink_file(src_fd, dest_fd):
+            return 'reflink'
+
+        remaining = os.fstat(src_fd).st_size
+        for kernel_copy in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, kernel_copy):
+                continue
+            try:
+                while remaining > 0:
+                    if kernel_copy == 'copy_file_range':
+                        copied = os.copy_file_range(src_fd, dest_fd, min(remaining, FILE_COPY_CHUNK_SIZE))
+                    else:
+                        copied = os.sendfile(dest_fd, src_fd, None, min(remaining, FILE_COPY_CHUNK_SIZE))
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return kernel_copy
+            except OSError:
+                # Not supported between these file systems; restart with the next method
+                src_file.seek(0)
+                dest_file.seek(0)
+                dest_file.truncate()
+                remaining = os.fstat(src_fd).st_size
+
+        src_file.seek(0)
+        dest_file.seek(0)
+        dest_file.truncate()
+        shutil.copyfileobj(src_file, dest_file, FILE_COPY_CHUNK_SIZE)
+        return 'copy'
+
+
+def copy_requirement_attachments(connection, cursor, corporate_account, from_project_id, from_req_id, to_project_id,
+                                 to_req_id, user_id, job_context=None):
+    """
+    Duplicate every attachment of one requirement onto another requirement.
+    Blob-backed attachments just gain a reference; older files are duplicated on disk.
+    New REQUIREMENT_ATTACHMENTS rows are inserted in one batch. Returns the number of source attachments.
+    """
+    cursor.execute("""
+        SELECT FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE FROM REQUIREMENT_ATTACHMENTS
+        WHERE CORPORATE_ACCOUNT = %s
+        AND PROJECT_ID = %s
+        AND REQ_ID = %s
+    """, (corporate_account, from_project_id, from_req_id))
+    original_attachments = cursor.fetchall()
+    attachment_count = len(original_attachments)
+
+    logging.info(f"Found {attachment_count} attachments to copy")
+
+    if attachment_count == 0:
+        return 0
+
+    target_rel_dir = f"{corporate_account}/{to_project_id}/{to_req_id}"
+    os.makedirs(os.path.join(UPLOAD_FOLDER, target_rel_dir), exist_ok=True)
+
+    attachment_rows = []
+    created_files = []
+
+    try:
+        for index, attachment in enumerate(original_attachments):
+            if job_context:
+                job_context.report_progress(index, attachment_count, f"Copying attachment {index + 1} of {attachment_count}")
+
+            original_filename = attachment['FILE_NAME']
+
+            content_hash = content_hash_from_path(attachment['FILE_PATH'])
+            if content_hash:
+                attachment_rows.append((
+                    corporate_account,
+                    to_project_id,
+                    to_req_id,
+                    original_filename,
+                    add_blob_reference(cursor, content_hash, attachment['FILE_SIZE']),
+                    attachment['FILE_SIZE'],
+                    attachment['FILE_TYPE'],
+                    user_id
+                ))
+                continue
+
+            full_original_path = os.path.join(UPLOAD_FOLDER, attachment['FILE_PATH'])
+
+            if not os.path.exists(full_original_path):
+                logging.warning(f"Original file not found: {full_original_path}")
+                continue  # Skip if original file doesn't exist
+
+            # Create a new unique filename but keep the extension
+            file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+            unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
+            target_rel_path = f"{target_rel_dir}/{unique_filename}"
+            target_full_path = os.path.join(UPLOAD_FOLDER, target_rel_path)
+
+            try:
+                method = duplicate_file(full_original_path, target_full_path)
+                created_files.append(target_full_path)
+                logging.info(f"Copied {original_filename} to {target_full_path} using {method}")
+            except Exception as file_error:
+                logging.error(f"Error copying file: {str(file_error)}")
+                continue
+
+            attachment_rows.append((
+                corporate_account,
+                to_project_id,
+                to_req_id,
+                original_filename,
+                target_rel_path,
+                attachment['FILE_SIZE'],
+                attachment['FILE_TYPE'],
+                user_id
+            ))
+
+        if attachment_rows:
+            cursor.executemany("""
+                INSERT INTO REQUIREMENT_ATTACHMENTS 
+                (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOADED_BY)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, attachment_rows)
+            connection.commit()
+
+    except BaseException:
+        # Undo blob references and do not leave files behind that no attachment row points at
+        connection.rollback()
+        for created_file in created_files:
+            if os.path.exists(created_file):
+                os.remove(created_file)
+        raise
+
+    return attachment_count
+
+
 # 1. Upload attachment(s) for a requirement
 @file_management_blueprint.route('/api/upload_requirement_attachment', methods=['POST'])
+@upload_limits(MAX_FILE_SIZE, MAX_FILES)
 @token_required
 def upload_requirement_attachment(current_user):
+    temp_files = []
+
     try:
         req_id = request.form.get('req_id')
         corporate_account = request.form.get('corporate_account')
@@ -65,65 +250,67 @@ def upload_requirement_attachment(current_user):
                 'status_description': 'No file selected'
             }), 400
 
+        if len(files) > MAX_FILES:
+            return jsonify({
+                'status': 'Error',
+                'status_description': f'Maximum {MAX_FILES} files allowed'
+            }), 400
 
         logging.info("Level 3")
 
-
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        # Every file was spooled and hashed while the body was read (an oversized one ends the
+        # request with 413 there), so nothing reaches the database or the blob store before that
+        for file in files:
+            if file and allowed_file(file.filename):
+                try:
+                    content_hash, file_size, temp_path = stream_to_temp(file, MAX_FILE_SIZE)
+                except UploadTooLarge:
+                    return jsonify({
+                        'status': 'Error',
+                        'status_description': f'File too large: {secure_filename(file.filename)}. '
+                                              f'Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB'
+                    }), 413
+                temp_files.append((file, content_hash, file_size, temp_path))
+
+        connection = get_connection()
         cursor = connection.cursor()
 
         uploaded_files = []
 
         logging.info("Level 4")
 
-        for file in files:
-            if file and allowed_file(file.filename):
-                # Create unique filename to prevent collisions
-                logging.info("Level 5")
-
-                original_filename = secure_filename(file.filename)
-                file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-                unique_filename = f"{uuid.uuid4().hex}.{file_extension}" if file_extension else f"{uuid.uuid4().hex}"
-
-                # Create path based on corporate account and project
-                relative_path = f"{corporate_account}/{project_id}/{req_id}"
-                full_dir = os.path.join(UPLOAD_FOLDER, relative_path)
-                os.makedirs(full_dir, exist_ok=True)
-
-                file_path = os.path.join(full_dir, unique_filename)
-
-                # Save the file
-                file.save(file_path)
-
-                # Get file size
-                file_size = os.path.getsize(file_path)
-
-                # Store in database
-                cursor.execute("""
-                    INSERT INTO REQUIREMENT_ATTACHMENTS 
-                    (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOADED_BY)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    corporate_account, project_id, req_id,
-                    original_filename,
-                    os.path.join(relative_path, unique_filename),
-                    file_size,
-                    file_extension,
-                    uploaded_by
-                ))
-                logging.info("Level 6")
-
-                attachment_id = cursor.lastrowid
-
-                uploaded_files.append({
-                    'attachment_id': attachment_id,
-                    'file_name': original_filename,
-                    'file_size': file_size,
-                    'file_type': file_extension
-                })
+        for file, content_hash, file_size, temp_path in temp_files:
+            logging.info("Level 5")
+
+            original_filename = secure_filename(file.filename)
+            file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+
+            # Identical content is stored only once
+            blob_path = add_blob_reference(cursor, content_hash, file_size, temp_path)
+
+            # Store in database
+            cursor.execute("""
+                INSERT INTO REQUIREMENT_ATTACHMENTS 
+                (CORPORATE_ACCOUNT, PROJECT_ID, REQ_ID, FILE_NAME, FILE_PATH, FILE_SIZE, FILE_TYPE, UPLOADED_BY)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                corporate_account, project_id, req_id,
+                original_filename,
+                blob_path,
+                file_size,
+                file_extension,
+                uploaded_by
+            ))
+            logging.info("Level 6")
+
+            attachment_id = cursor.lastrowid
+
+            uploaded_files.append({
+                'attachment_id': attachment_id,
+                'file_name': original_filename,
+                'file_size': file_size,
+                'file_type': file_extension
+            })
 
         connection.commit()
         cursor.close()
@@ -144,6 +331,11 @@ def upload_requirement_attachment(current_user):
             'status_description': f'Failed to upload attachment: {str(e)}'
         }), 500
 
+    finally:
+        # Temp files that were moved into the blob store are already gone
+        for temp_file in temp_files:
+            discard_temp(temp_file[3])
+
 
 # 2. Get all attachments for a requirement
 @file_management_blueprint.route('/api/get_requirement_attachments', methods=['POST'])
@@ -161,10 +353,7 @@ def get_requirement_attachments(current_user):
                 'status_description': 'Missing required parameters'
             }), 400
 
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         cursor.execute("""
@@ -237,10 +426,7 @@ def download_requirement_attachment(attachment_id):
                 'message': 'Invalid token!'
             }), 401
 
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_read_connection()
         cursor = connection.cursor()
 
         cursor.execute("""
@@ -260,19 +446,51 @@ def download_requirement_attachment(attachment_id):
             }), 404
 
         file_name, file_path = result
-        full_path = os.path.join(UPLOAD_FOLDER, file_path)
 
-        if not os.path.exists(full_path):
+        # Blob paths are named after their SHA-256, which makes a strong validator.
+        # Older files fall back to the ETag send_file derives from mtime and size.
+        content_hash = content_hash_from_path(file_path)
+
+        # Remote storage hands out a presigned URL so the bytes do not pass through the API
+        if content_hash:
+            presigned_url = get_storage_backend().presigned_url(file_path, secure_filename(file_name))
+            if presigned_url:
+                return redirect(presigned_url)
+
+        full_path = local_attachment_path(file_path)
+
+        if not full_path or not os.path.exists(full_path):
             return jsonify({
                 'status': 'Error',
                 'status_description': 'File not found on server'
             }), 404
 
-        return send_file(
-            full_path,
-            as_attachment=True,
-            download_name=file_name
-        )
+        if ACCEL_REDIRECT_PREFIX:
+            if content_hash and content_hash in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response('')
+                response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + file_path.replace('\\', '/')
+                response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(file_name)}"'
+            if content_hash:
+                response.set_etag(content_hash)
+        else:
+            # conditional=True answers If-None-Match with 304 and Range requests with 206
+            response = send_file(
+                full_path,
+                as_attachment=True,
+                download_name=file_name,
+                conditional=True,
+                etag=content_hash if content_hash else True
+            )
+
+        if content_hash:
+            response.cache_control.no_cache = None
+            response.cache_control.private = True
+            response.cache_control.max_age = BLOB_CACHE_MAX_AGE
+            response.cache_control.immutable = True
+
+        return response
 
     except Exception as e:
         # Log the exception
@@ -300,10 +518,7 @@ def delete_requirement_attachment(current_user):
                 'status_description': 'Missing required parameters'
             }), 400
 
-        connection = mysql.connector.connect(host=config.host,
-                                             database=config.database,
-                                             user=config.user,
-                                             password=config.password)
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Get the file path before deleting the record
@@ -332,12 +547,19 @@ def delete_requirement_attachment(current_user):
         """, (attachment_id,))
 
         req_id = cursor.lastrowid
+
+        # Shared blobs are only unlinked when their last reference goes away, after the commit
+        is_blob, unreferenced_blob = release_blob_reference(cursor, file_path)
         connection.commit()
 
-        # Delete the file from filesystem
-        full_path = os.path.join(UPLOAD_FOLDER, file_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
+        if unreferenced_blob:
+            delete_unreferenced_blob(connection, unreferenced_blob)
+
+        # Delete the file from filesystem (attachments stored before the blob store)
+        if not is_blob:
+            full_path = os.path.join(UPLOAD_FOLDER, file_path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
 
         cursor.close()
         connection.close()
@@ -356,4 +578,144 @@ def delete_requirement_attachment(current_user):
         return jsonify({
             'status': 'Error',
             'status_description': f'Failed to delete attachment: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+class _ZipStreamBuffer:
+    """Write-only, unseekable sink that hands ZipFile output to a response generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def generate_attachments_zip(attachments):
+    """
+    Yield a ZIP archive of (entry_name, relative_path, file_type) tuples piece by piece.
+    Nothing is written to disk and at most one chunk of a file is held in memory.
+    """
+    buffer = _ZipStreamBuffer()
+
+    with zipfile.ZipFile(buffer, mode='w') as archive:
+        for entry_name, relative_path, file_type in attachments:
+            if not attachment_exists(relative_path):
+                logging.warning(f"Skipping missing attachment file in ZIP download: {relative_path}")
+                continue
+
+            entry = zipfile.ZipInfo(entry_name, date_time=time.localtime()[:6])
+            entry.external_attr = 0o100644 << 16
+            entry.compress_type = zipfile.ZIP_STORED if (file_type or '').lower() in ZIP_STORED_EXTENSIONS \
+                else zipfile.ZIP_DEFLATED
+
+            with open_attachment(relative_path) as src_file, \
+                    archive.open(entry, mode='w', force_zip64=True) as dest_entry:
+                while True:
+                    chunk = src_file.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest_entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory
+    yield buffer.drain()
+
+
+# 5. Download all attachments of a requirement, or of a whole project, as one ZIP
+@file_management_blueprint.route('/api/download_requirement_attachments_zip', methods=['POST'])
+@token_required
+def download_requirement_attachments_zip(current_user):
+    try:
+        req_id = request.json.get('req_id')
+        corporate_account = request.json.get('corporate_account')
+        project_id = request.json.get('project_id')
+
+        # Validate required inputs; req_id is optional and narrows the archive to one requirement
+        if not corporate_account or not project_id:
+            return jsonify({
+                'status': 'Error',
+                'status_description': 'Missing required parameters'
+            }), 400
+
+        # Only users of the project (or its account) may download its attachments
+        _, _, access_sts, _ = get_user_api_access_level(current_user['user_id'], corporate_account, project_id, None)
+        if access_sts != 'Success':
+            return jsonify({
+                'status': 'Failed',
+                'status_description': 'Access denied',
+                'error_type': 'INSUFFICIENT_ACCESS'
+            }), 403
+
+        connection = get_read_connection()
+        cursor = connection.cursor()
+
+        query = """
+            SELECT REQ_ID, FILE_NAME, FILE_PATH, FILE_TYPE
+            FROM REQUIREMENT_ATTACHMENTS
+            WHERE CORPORATE_ACCOUNT = %s AND PROJECT_ID = %s
+        """
+        params = [corporate_account, project_id]
+
+        if req_id:
+            query += " AND REQ_ID = %s"
+            params.append(req_id)
+
+        query += " ORDER BY REQ_ID, ATTACHMENT_ID"
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+        cursor.close()
+        connection.close()
+
+        if not rows:
+            return jsonify({
+                'status': 'Error',
+                'status_description': 'No attachments found'
+            }), 404
+
+        # One folder per requirement; repeated file names get a counter so no entry is shadowed
+        attachments = []
+        used_names = set()
+        for row_req_id, file_name, file_path, file_type in rows:
+            entry_name = f"{row_req_id}/{secure_filename(file_name) or 'attachment'}"
+            base_name, dot, extension = entry_name.rpartition('.')
+            counter = 2
+            while entry_name in used_names:
+                entry_name = f"{base_name} ({counter}).{extension}" if dot else f"{extension} ({counter})"
+                counter += 1
+            used_names.add(entry_name)
+            attachments.append((entry_name, file_path, file_type))
+
+        archive_name = f"{project_id}_{req_id}_attachments.zip" if req_id else f"{project_id}_attachments.zip"
+
+        return Response(
+            stream_with_context(generate_attachments_zip(attachments)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{secure_filename(archive_name)}"'}
+        )
+
+    except Exception as e:
+        # Log the exception
+        print(f"Error downloading attachments: {str(e)}")
+        logging.error(f"Error downloading attachments: {str(e)}")
+
+        return jsonify({
+            'status': 'Error',
+            'status_description': f'Failed to download attachments: {str(e)}'
+        }), 500
@@ -1,10 +1,71 @@
 # utils.py
 import jwt
 import logging
+from datetime import datetime, timedelta
 from config import SECRET_KEY
-from flask import request, jsonify
+from flask import g, request, jsonify
 from functools import wraps
 
+# Stream tokens open one project's event stream. They travel in the URL, so they end up in access
+# logs; they are only valid for this long and only for that stream, never as a session token.
+STREAM_TOKEN_SECONDS = 60
+STREAM_TOKEN_SCOPE = 'events'
+
+def verify_token(token):
+    """Returns (current_user, None) for a valid token, or (None, error message)"""
+    try:
+        logging.info(f"Decoding the token...SECRET_KEY {SECRET_KEY}")
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        logging.info(f"Decoded token data: {data}")
+        if 'scope' in data:
+            # A stream token is not a session token
+            return None, 'Token is invalid!'
+        # Create a user dictionary instead of just the ID
+        return {'user_id': data['user_id']}, None
+    except jwt.ExpiredSignatureError:
+        logging.error("Token has expired")
+        return None, 'Token has expired!'
+    except jwt.InvalidTokenError as e:
+        logging.error(f"Invalid token error: {str(e)}")
+        return None, 'Token is invalid!'
+    except jwt.DecodeError as e:
+        logging.error(f"Token decode error: {str(e)}")
+        return None, 'Token decode failed!'
+    except Exception as e:
+        logging.error(f"Unexpected error during token validation: {str(e)}")
+        return None, 'Token validation failed!'
+
+def issue_stream_token(user_id, corporate_account, project_id):
+    """Short-lived token that opens the event stream of one project, for the EventSource URL"""
+    return jwt.encode({
+        'user_id': user_id,
+        'scope': STREAM_TOKEN_SCOPE,
+        'corporate_account': corporate_account,
+        'project_id': project_id,
+        'exp': datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_SECONDS)
+    }, SECRET_KEY, algorithm="HS256")
+
+def verify_stream_token(token, corporate_account, project_id):
+    """Returns (current_user, None) for a valid stream token of that project, or (None, error message)"""
+    try:
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired!'
+    except Exception as e:
+        logging.error(f"Invalid stream token: {str(e)}")
+        return None, 'Token is invalid!'
+    if data.get('scope') != STREAM_TOKEN_SCOPE or data.get('corporate_account') != corporate_account \
+            or data.get('project_id') != project_id:
+        return None, 'Token is invalid!'
+    return {'user_id': data['user_id']}, None
+
+def _decode_token(token):
+    """Returns (current_user, None) for a valid token, or (None, error response)"""
+    current_user, message = verify_token(token)
+    if message:
+        return None, (jsonify({'message': message}), 401)
+    return current_user, None
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -17,25 +78,38 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
 
-        try:
-            logging.info(f"Decoding the token...SECRET_KEY {SECRET_KEY}")
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            logging.info(f"Decoded token data: {data}")
-            # Create a user dictionary instead of just the ID
-            current_user = {'user_id': data['user_id']}
-        except jwt.ExpiredSignatureError:
-            logging.error("Token has expired")
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError as e:
-            logging.error(f"Invalid token error: {str(e)}")
-            return jsonify({'message': 'Token is invalid!'}), 401
-        except jwt.DecodeError as e:
-            logging.error(f"Token decode error: {str(e)}")
-            return jsonify({'message': 'Token decode failed!'}), 401
-        except Exception as e:
-            logging.error(f"Unexpected error during token validation: {str(e)}")
-            return jsonify({'message': 'Token validation failed!'}), 401
+        current_user, error = _decode_token(token)
+        if error:
+            return error
+
+        g.current_user = current_user
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+def stream_token_required(f):
+    """
+    token_required for EventSource endpoints. Browsers cannot set headers on an EventSource, so
+    instead of the session token they pass a stream token (issue_stream_token) for the requested
+    corporate_account and project_id as the stream_token query parameter.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if 'Authorization' in request.headers:
+            current_user, error = _decode_token(request.headers['Authorization'].split(" ")[1])
+            if error:
+                return error
+        else:
+            token = request.args.get('stream_token')
+            if not token:
+                return jsonify({'message': 'Token is missing!'}), 401
+
+            current_user, message = verify_stream_token(token, request.args.get('corporate_account'),
+                                                        request.args.get('project_id'))
+            if message:
+                return jsonify({'message': message}), 401
 
+        g.current_user = current_user
         return f(current_user, *args, **kwargs)
 
-    return decorated
\ No newline at end of file
+    return decorated